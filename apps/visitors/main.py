@@ -18,6 +18,7 @@ class Controller:
         """Display a search interface, and the results of the default query"""
 
         query = kwargs.get("query", "")
+        cursor = kwargs.get("cursor", "")
 
         site_domains = cherrypy.engine.publish(
             "registry:search:valuelist",
@@ -38,10 +39,12 @@ class Controller:
         if "default" in saved_queries.keys() and not query:
             query = saved_queries["default"]
 
-        log_records, query_plan = cherrypy.engine.publish(
+        log_records, query_plan, next_cursor = cherrypy.engine.publish(
             "logindex:query",
-            query
-        ).pop() or []
+            query,
+            explain="explain" in kwargs,
+            cursor=cursor
+        ).pop()
 
         reversed_ips = None
         country_names = None
@@ -74,6 +77,8 @@ class Controller:
             flagless_countries=("AP", None, ""),
             query=query,
             query_plan=query_plan,
+            cursor=cursor,
+            next_cursor=next_cursor,
             reversed_ips=reversed_ips,
             active_date=self.get_active_date(log_records, query),
             results=log_records,
@@ -240,6 +240,7 @@ def setup() -> None:
     plugins.maintenance.Plugin(cherrypy.engine).subscribe()
     plugins.markup.Plugin(cherrypy.engine).subscribe()
     plugins.memorize.Plugin(cherrypy.engine).subscribe()
+    plugins.mixins.pool.subscribe()
     plugins.notifier.Plugin(cherrypy.engine).subscribe()
     plugins.plotter.Plugin(cherrypy.engine).subscribe()
     plugins.recipes.Plugin(cherrypy.engine).subscribe()
@@ -52,6 +52,37 @@ class TestCombinedLogParser(unittest.TestCase):
         self.assertIsNone(fields["referrer"])
         self.assertIsNone(fields["referrer_domain"])
 
+    def test_fractional_timestamp(self) -> None:
+        """Timestamps with fractional seconds are parsed."""
+
+        logline = helpers.get_fixture("combined.log").replace(
+            "01:01:01 -0700",
+            "01:01:01:25 -0700"
+        )
+
+        fields = self.parser.parse(logline)
+        self.assertEqual(fields["unix_timestamp"], 915177661.25)
+        self.assertEqual(fields["datestamp"], "1999-01-01-08")
+
+
+class TestFastCombinedLogParser(TestCombinedLogParser):
+    """Run the same cases against the single-pass parser."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Create the parser instance."""
+        cls.parser = parsers.combined_log.FastParser()
+
+    def test_irregular_line(self) -> None:
+        """Lines outside the fast path match the reference parser."""
+
+        logline = helpers.get_fixture("combined.log").replace(" ", "  ", 1)
+
+        self.assertEqual(
+            self.parser.parse(logline),
+            parsers.combined_log.Parser().parse(logline)
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
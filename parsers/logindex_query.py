@@ -4,14 +4,20 @@ import calendar
 from datetime import datetime
 from datetime import timedelta
 import re
+from typing import Any
 from typing import Callable
 from typing import Dict
+from typing import Optional
 from typing import Tuple
 from pytz import UTC
 
-Transformer = Callable[[str, str, bool], str]
+Params = Tuple[Any, ...]
+Phrase = Tuple[str, Params]
+Transformer = Callable[[str, str, bool], Phrase]
 PhraseTuple = Tuple[str, ...]
 TermDict = Dict[str, PhraseTuple]
+Predicate = Callable[[Any], bool]
+ValueTest = Callable[[Any], bool]
 
 
 class Parser():
@@ -44,11 +50,58 @@ class Parser():
     numeric_fields = ("statusCode",)
     subquery_fields = ("reverse_domain",)
 
+    # Fields whose database columns do not use nocase collation.
+    case_sensitive_fields = ("source_file", "reverse_domain")
+
     def parse(self, query: str) -> str:
-        """Convert a search query to an SQL phrase."""
+        """Convert a search query to an SQL phrase with inline values."""
+
+        sql, params = self.prepare(query)
+
+        return self.inline(sql, params)
+
+    def prepare(self, query: str) -> Phrase:
+        """Convert a search query to an SQL phrase and its parameters.
+
+        Search terms are never interpolated into the SQL. Queries that
+        differ only by their terms produce the same statement, which
+        lets SQLite reuse the prepared form.
+
+        """
 
-        terms: TermDict = {}
         sql_phrases: PhraseTuple = ()
+        params: Params = ()
+
+        for field, values in self.terms(query).items():
+            sql_phrase, phrase_params = self.transform(
+                field,
+                values,
+                self.get_transformer(field)
+            )
+            sql_phrases += (sql_phrase,)
+            params += phrase_params
+
+        return (" AND ".join(sql_phrases), params)
+
+    @staticmethod
+    def inline(sql: str, params: Params) -> str:
+        """Substitute parameters into an SQL phrase as literals."""
+
+        values = iter(params)
+
+        def literal(_: re.Match) -> str:
+            value = next(values)
+            if isinstance(value, str):
+                escaped = value.replace("'", "''")
+                return f"'{escaped}'"
+            return str(value)
+
+        return re.sub(r"\?", literal, sql)
+
+    def terms(self, query: str) -> TermDict:
+        """Group the words of a search query by field."""
+
+        terms: TermDict = {}
         field = None
 
         for word in query.lower().replace("\n", " ").split():
@@ -72,14 +125,131 @@ class Parser():
         if "datestamp" in terms:
             terms = self.qualify_terms(terms, "datestamp")
 
-        for field, values in terms.items():
-            sql_phrases += self.transform(
-                field,
-                values,
-                self.get_transformer(field)
+        return terms
+
+    def date_bounds(self, query: str) -> Optional[Tuple[str, str]]:
+        """Find the overall date range that a query is restricted to.
+
+        The result is None if the query does not restrict by date, or
+        if any of its dates could not be understood.
+
+        """
+
+        terms = self.terms(query).get("datestamp")
+
+        if not terms:
+            return None
+
+        date_ranges = [self.date_range(term) for term in terms]
+
+        starts = []
+        ends = []
+        for date_range in date_ranges:
+            if not date_range:
+                return None
+            starts.append(date_range[0])
+            ends.append(date_range[1])
+
+        return (min(starts), max(ends))
+
+    def compile(self, query: str) -> Predicate:
+        """Convert a search query to a function that tests a record.
+
+        This is the in-memory equivalent of parse(). Records are
+        mappings keyed by column name, and fields that parse() would
+        handle with a subquery are expected to be present as columns.
+
+        """
+
+        tests = tuple(
+            (
+                self.non_negated_field(field).lstrip("+"),
+                self.compile_field(field, values)
             )
+            for field, values in self.terms(query).items()
+        )
 
-        return " AND ".join(sql_phrases)
+        if not tests:
+            return lambda _: False
+
+        return lambda record: all(
+            test(record[field]) for field, test in tests
+        )
+
+    def compile_field(self, field: str, terms: PhraseTuple) -> ValueTest:
+        """Combine the tests for each of a field's terms.
+
+        As in transform(), negated terms must all pass and other terms
+        need only one.
+
+        """
+
+        negated = field.endswith("_not")
+        field = self.non_negated_field(field).lstrip("+")
+
+        if field in self.subquery_fields:
+            # Subqueries disregard negation, see transform_subquery().
+            tests = tuple(
+                self.compile_term(field, term, False)
+                for term in terms
+            )
+        else:
+            tests = tuple(
+                self.compile_term(field, term, negated)
+                for term in terms
+            )
+
+        combine = all if negated else any
+
+        return lambda value: combine(test(value) for test in tests)
+
+    def compile_term(self, field: str, term: str, negated: bool) -> ValueTest:
+        """Build a test equivalent to the SQL phrase for a single term.
+
+        Comparisons against NULL are never true in SQL, so a missing
+        value fails regardless of negation.
+
+        """
+
+        if field in self.date_fields:
+            date_range = self.date_range(term)
+            if not date_range:
+                return lambda _: False
+            start, end = date_range
+            return lambda value: value is not None and start <= value <= end
+
+        if field in self.numeric_fields:
+            try:
+                number = float(term)
+            except ValueError:
+                return lambda _: False
+            return lambda value: (
+                value is not None and (value == number) != negated
+            )
+
+        if "%" in term:
+            pattern = re.compile(
+                "".join(
+                    ".*" if char == "%" else
+                    "." if char == "_" else
+                    re.escape(char)
+                    for char in term
+                ),
+                re.IGNORECASE | re.DOTALL
+            )
+            return lambda value: (
+                value is not None
+                and bool(pattern.fullmatch(str(value))) != negated
+            )
+
+        if field in self.case_sensitive_fields:
+            return lambda value: (
+                value is not None and (str(value) == term) != negated
+            )
+
+        return lambda value: (
+            value is not None and (str(value).lower() == term) != negated
+        )
 
     @staticmethod
     def get_operator(term: str, negated: bool = False) -> str:
@@ -145,7 +315,7 @@ class Parser():
             field: str,
             terms: PhraseTuple,
             transformer: Transformer
-    ) -> PhraseTuple:
+    ) -> Phrase:
         """Transform a set of values to an SQL phrase."""
 
         negated = False
@@ -153,19 +323,22 @@ class Parser():
             negated = True
             field = self.non_negated_field(field)
 
-        phrases = tuple(
-            transformer(field, term, negated)
-            for term in terms
-        )
+        phrases: PhraseTuple = ()
+        params: Params = ()
+
+        for term in terms:
+            phrase, phrase_params = transformer(field, term, negated)
+            phrases += (phrase,)
+            params += phrase_params
 
         boolean = " OR "
         if negated:
             boolean = " AND "
-        return ("(" + boolean.join(phrases) + ")",)
+        return ("(" + boolean.join(phrases) + ")", params)
 
     @staticmethod
-    def transform_date(field: str, term: str, _: bool = False) -> str:
-        """Convert a date value to an SQL phrase.
+    def date_range(term: str) -> Optional[Tuple[str, str]]:
+        """Convert a date value to a pair of UTC datestamps.
 
         Dates in YYYY-MM-DD and YYYY-MM format are recognized, as are
         the keywords "today" and "yesterday".
@@ -198,7 +371,7 @@ class Parser():
             end_date_delta = timedelta(days=month_range[1])
 
         if not reference_date:
-            return ""
+            return None
 
         start_date = reference_date.replace(
             hour=0, minute=0, second=0
@@ -206,27 +379,45 @@ class Parser():
 
         end_date = start_date + end_date_delta
 
-        start = start_date.strftime("%Y-%m-%d-%H")
-        end = end_date.strftime("%Y-%m-%d-%H")
+        return (
+            start_date.strftime("%Y-%m-%d-%H"),
+            end_date.strftime("%Y-%m-%d-%H")
+        )
+
+    def transform_date(self, field: str, term: str, _: bool = False) -> Phrase:
+        """Convert a date value to an SQL phrase."""
+
+        date_range = self.date_range(term)
 
-        return f"{field} BETWEEN '{start}' AND '{end}'"
+        if not date_range:
+            return ("", ())
+
+        return (f"{field} BETWEEN ? AND ?", date_range)
 
     @staticmethod
-    def transform_numeric(field: str, term: str, negated: bool = False) -> str:
+    def transform_numeric(
+            field: str,
+            term: str,
+            negated: bool = False
+    ) -> Phrase:
         """Convert a numeric value to an SQL phrase."""
 
         operator = "="
         if negated:
             operator = "<>"
 
-        return f"{field} {operator} {term}"
+        value: Any = term
+        if term.isdigit():
+            value = int(term)
+
+        return (f"{field} {operator} ?", (value,))
 
     def transform_string(
             self,
             field: str,
             term: str,
             negated: bool = False
-    ) -> str:
+    ) -> Phrase:
         """Convert a string value to an SQL phrase."""
 
         # The IP field needs to be qualified because it is used
@@ -237,14 +428,14 @@ class Parser():
 
         operator = self.get_operator(term, negated)
 
-        return f"{field} {operator} '{term}'"
+        return (f"{field} {operator} ?", (term,))
 
     def transform_subquery(
             self,
             field: str,
             term: str,
             _: bool = False
-    ) -> str:
+    ) -> Phrase:
         """Build a SQL phrase that involves a subquery."""
 
         operator = self.get_operator(term, False)
@@ -253,6 +444,6 @@ class Parser():
             return ("logs.ip IN ("
                     "SELECT ip "
                     "FROM reverse_ip "
-                    f"WHERE reverse_domain {operator} '{term}')")
+                    f"WHERE reverse_domain {operator} ?)", (term,))
 
-        return ""
+        return ("", ())
@@ -119,6 +119,32 @@ class TestLogindexQueryParser(unittest.TestCase):
 
         self.parse_and_assert(query, expected)
 
+    def test_compile(self) -> None:
+        """Compiled queries match records the way SQL phrases do."""
+
+        record = {
+            "ip": "192.0.2.1",
+            "uri": "/Hello/World",
+            "statusCode": 404,
+            "agent": None,
+            "reverse_domain": "example.com",
+        }
+
+        cases = (
+            ("uri /hello/world", True),
+            ("uri /hello% uri not /unwanted", True),
+            ("uri /hello% status 200 404", True),
+            ("status not 400 404", False),
+            ("agent not curl%", False),
+            ("reverse_domain %.com ip 192.0.2.1", True),
+            ("reverse_domain example.org", False),
+            ("nothing here", False),
+        )
+
+        for query, expected in cases:
+            predicate = self.parser.compile(query)
+            self.assertEqual(predicate(record), expected, query)
+
 
 if __name__ == "__main__":
     unittest.main()
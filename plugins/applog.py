@@ -93,7 +93,7 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
             for message in messages
         ]
 
-        self._multi(queries)
+        self._batch(queries)
 
     def add(self, source: str, message: Any) -> None:
         """Accept a log message for storage."""
@@ -46,7 +46,7 @@ class TestApplog(Subscriber):
             0
         )
 
-    @patch("plugins.applog.Plugin._multi")
+    @patch("plugins.applog.Plugin._batch")
     def test_pull(self, db_mock: Mock) -> None:
         """Queued messages are written to storage."""
 
@@ -71,7 +71,7 @@ class TestApplog(Subscriber):
             0
         )
 
-    @patch("plugins.applog.Plugin._multi")
+    @patch("plugins.applog.Plugin._batch")
     def test_exception_message(self, db_mock: Mock) -> None:
         """Messages can be provided as exceptions."""
 
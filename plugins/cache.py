@@ -1,11 +1,18 @@
 """Store arbitrary values in an SQLite database."""
 
+from collections import OrderedDict
 from datetime import datetime
 import json
+import marshal
 from sqlite3 import Row
+import sys
+import threading
+import time
+import zlib
 from typing import Any
 from typing import List
 from typing import Iterator
+from typing import Optional
 from typing import Tuple
 from typing import Dict
 from typing import cast
@@ -13,19 +20,182 @@ import cherrypy
 from resources.url import Url
 from . import mixins
 
+# Reddit listings are projected into these tables when cached, so
+# that rendering them does not require walking the JSON.
+REDDIT_TABLES = ("reddit_page", "reddit_story", "reddit_comment")
+
+# Comments by these authors are left out of projected discussions.
+REDDIT_IGNORED_AUTHORS = ("AutoModerator", "RemindMeBot", "[deleted]")
+
+# Marshal's format can change between Python versions, so the version
+# that wrote a value is part of its encoding name. Values written by
+# any other version are treated as missing.
+MARSHAL_ENCODING = f"marshal-{sys.version_info.major}.{sys.version_info.minor}"
+
+# A cached value, the date it was cached, when it expires as a Unix
+# timestamp, and its approximate size in bytes.
+MemoryEntry = Tuple[Any, Optional[datetime], float, int]
+
+
+class MemoryTier():
+    """A size-bounded, least-recently-used store of decoded values.
+
+    This sits in front of the database so that frequently-read keys
+    skip both the query and the decoding of their value. Entries are
+    dropped once they expire, and the least recently used ones are
+    evicted whenever the total size exceeds the budget.
+
+    Values are handed out as-is rather than copied, so callers must
+    not modify what they get back.
+
+    The generation counts discards. A value read from the database
+    is only added if no discard happened while it was being read.
+    Writers discard both before and after their write commits, so a
+    read that could have seen the old row always overlaps the second
+    discard and cannot shadow the new value.
+
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.entries: OrderedDict[str, MemoryEntry] = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[MemoryEntry]:
+        """Look up an unexpired entry and mark it as recently used."""
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry and entry[2] <= time.time():
+                self.remove(key)
+                entry = None
+
+            if not entry:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: MemoryEntry, generation: int) -> None:
+        """Add an entry, evicting others as needed to stay in budget.
+
+        Entries larger than the budget as a whole are not kept, nor
+        are ones from before the most recent discard.
+
+        """
+
+        if entry[3] > self.budget:
+            return
+
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.remove(key)
+            self.entries[key] = entry
+            self.size += entry[3]
+
+            while self.size > self.budget:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        """Drop an entry if present."""
+
+        with self.lock:
+            self.generation += 1
+            self.remove(key)
+
+    def remove(self, key: str) -> None:
+        """Drop an entry without locking."""
+
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry[3]
+
+    def sweep(self) -> int:
+        """Drop every expired entry."""
+
+        now = time.time()
+
+        with self.lock:
+            expired = [
+                key for key, entry in self.entries.items()
+                if entry[2] <= now
+            ]
+
+            for key in expired:
+                self.remove(key)
+
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Usage counters for the store."""
+
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
 
 class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
-    """A CherryPy plugin for caching arbitrary values to disk."""
+    """A CherryPy plugin for caching arbitrary values to disk.
+
+    Each value is stored alongside the name of its encoding, which is
+    one of bytes, text or MARSHAL_ENCODING, and of its compression if
+    any. Rows from before encodings were recorded have neither, and
+    are decoded by inspection as they always were. A value that
+    cannot be decoded is treated as missing.
+
+    """
+
+    db_pragmas = ("PRAGMA synchronous=NORMAL",)
+
+    # Values whose encoded size exceeds this many bytes are compressed
+    # with zlib if doing so makes them smaller.
+    compression_threshold = 16384
+
+    # Expired rows are deleted in the background this many at a time,
+    # for at most sweep_seconds per run, every sweep_interval seconds.
+    # Each run also returns up to sweep_pages free pages to the
+    # filesystem.
+    sweep_batch_size = 500
+    sweep_seconds = 0.05
+    sweep_interval = 300
+    sweep_pages = 1024
+
+    # The most keys that mget() looks up in a single query. Each key
+    # takes two of SQLite's 32766 parameters.
+    mget_batch_size = 500
+
+    # The most memory that decoded values held in-process may occupy.
+    memory_budget = 32 * 1024 * 1024
 
     def __init__(self, bus: cherrypy.process.wspbus.Bus) -> None:
         cherrypy.process.plugins.SimplePlugin.__init__(self, bus)
 
         self.db_path = self._path("cache.sqlite")
+        self.memory = MemoryTier(self.memory_budget)
 
     def setup(self) -> None:
         """Create the database."""
 
         self._create("""
+        PRAGMA auto_vacuum=INCREMENTAL;
+
         PRAGMA journal_mode=WAL;
 
         CREATE TABLE IF NOT EXISTS cache (
@@ -33,20 +203,111 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
             key TEXT,
             value BLOB,
             expires TEXT,
-            created TEXT DEFAULT CURRENT_TIMESTAMP
+            created TEXT DEFAULT CURRENT_TIMESTAMP,
+            encoding TEXT,
+            compression TEXT
         );
 
         CREATE UNIQUE INDEX IF NOT EXISTS index_prefix_and_key
             ON cache(prefix, key);
 
-        CREATE VIEW IF NOT EXISTS unexpired AS
-            SELECT prefix, key, value, expires, created
+        CREATE INDEX IF NOT EXISTS index_expires
+            ON cache(expires);
+
+        CREATE TABLE IF NOT EXISTS reddit_page (
+            prefix TEXT,
+            key TEXT,
+            before TEXT,
+            after TEXT,
+            count INTEGER,
+            PRIMARY KEY (prefix, key)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS reddit_story (
+            prefix TEXT,
+            key TEXT,
+            position INTEGER,
+            title TEXT,
+            url TEXT,
+            domain TEXT,
+            permalink TEXT,
+            num_comments INTEGER,
+            selftext TEXT,
+            subreddit TEXT,
+            created_utc REAL,
+            author TEXT,
+            num_crossposts INTEGER,
+            PRIMARY KEY (prefix, key, position)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS reddit_comment (
+            prefix TEXT,
+            key TEXT,
+            position INTEGER,
+            id TEXT,
+            author TEXT,
+            created_utc REAL,
+            parent_id TEXT,
+            body_html TEXT,
+            PRIMARY KEY (prefix, key, position)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS cache_after_delete_reddit
+        AFTER DELETE ON cache
+        WHEN instr(old.key, 'reddit.com/') > 0
+        BEGIN
+            DELETE FROM reddit_page
+            WHERE prefix=old.prefix AND key=old.key;
+            DELETE FROM reddit_story
+            WHERE prefix=old.prefix AND key=old.key;
+            DELETE FROM reddit_comment
+            WHERE prefix=old.prefix AND key=old.key;
+        END;
+        """)
+
+        # Auto-vacuum can only be turned on for an existing database
+        # by rebuilding it. This happens once.
+        if self._selectFirst("PRAGMA auto_vacuum") != 2:
+            self._create("""
+            PRAGMA auto_vacuum=INCREMENTAL;
+            VACUUM;
+            """)
+
+            cherrypy.engine.publish(
+                "applog:add",
+                "cache",
+                "Enabled incremental vacuuming"
+            )
+
+        columns = {
+            row["name"]
+            for row in self._select("PRAGMA table_info(cache)")
+        }
+
+        if "encoding" not in columns:
+            self._create("""
+            ALTER TABLE cache ADD COLUMN encoding TEXT;
+            ALTER TABLE cache ADD COLUMN compression TEXT;
+            """)
+
+        self._create("""
+        DROP VIEW IF EXISTS unexpired;
+
+        CREATE VIEW unexpired AS
+            SELECT prefix, key, value, encoding, compression,
+            expires, created
             FROM cache
             WHERE expires > datetime('now');
         """)
 
         cherrypy.engine.publish("cache:ready")
 
+        cherrypy.engine.publish(
+            "scheduler:add",
+            self.sweep_interval,
+            "cache:sweep"
+        )
+
     def start(self) -> None:
         """Define the CherryPy messages to listen for.
 
@@ -68,6 +329,8 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         self.bus.subscribe("cache:set", self.set)
         self.bus.subscribe("cache:clear", self.clear)
         self.bus.subscribe("cache:prune", self.prune)
+        self.bus.subscribe("cache:sweep", self.sweep)
+        self.bus.subscribe("cache:stats", self.stats)
 
     @staticmethod
     def keysplit(key: str) -> Tuple[str, str]:
@@ -102,55 +365,174 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
 
         return {}
 
+    @classmethod
+    def encode(cls, value: Any) -> Optional[Tuple[Any, str, Optional[str]]]:
+        """Serialize a value for storage.
+
+        The return value is the stored form, the name of its encoding
+        and the name of its compression, or None if the value cannot
+        be encoded. Bytes and strings are stored as they are. Anything
+        else is marshaled, which covers everything JSON could
+        represent and decodes faster.
+
+        """
+
+        stored: Any = value
+
+        if isinstance(value, bytes):
+            encoding = "bytes"
+        elif isinstance(value, str):
+            encoding = "text"
+        else:
+            try:
+                stored = marshal.dumps(value)
+                encoding = MARSHAL_ENCODING
+            except ValueError:
+                return None
+
+        if len(stored) > cls.compression_threshold:
+            raw = stored.encode("utf-8") if isinstance(stored, str) else stored
+            compressed = zlib.compress(raw)
+
+            if len(compressed) < len(raw):
+                return (compressed, encoding, "zlib")
+
+        return (stored, encoding, None)
+
+    @staticmethod
+    def decompress(value: Any, compression: Optional[str]) -> Any:
+        """Undo the compression of a stored value.
+
+        A value that fails to decompress is returned as None.
+
+        """
+
+        if compression == "zlib":
+            try:
+                return zlib.decompress(value)
+            except (zlib.error, TypeError):
+                return None
+
+        return value
+
+    @staticmethod
+    def decode(value: Any, encoding: Optional[str]) -> Any:
+        """Convert a decompressed value back to its original form.
+
+        A value that is corrupt, or that was marshaled by a different
+        version of Python, is returned as None.
+
+        """
+
+        if encoding == "bytes":
+            return value
+
+        if encoding == "text":
+            if isinstance(value, bytes):
+                try:
+                    return value.decode("utf-8")
+                except UnicodeDecodeError:
+                    return None
+            return value
+
+        if encoding == MARSHAL_ENCODING:
+            try:
+                return marshal.loads(value)
+            except (ValueError, EOFError, TypeError):
+                return None
+
+        if encoding:
+            return None
+
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except json.decoder.JSONDecodeError:
+                pass
+
+        return value
+
     def match(self, prefix: str) -> Iterator[Any]:
         """Retrieve multiple values based on a common prefix."""
 
         rows = self._select_generator(
-            """SELECT value
+            """SELECT value, encoding, compression
             FROM unexpired
             WHERE prefix=?""",
             (prefix,)
         )
 
         for row in rows:
-            if not isinstance(row["value"], str):
-                yield row["value"]
-                continue
-            try:
-                yield json.loads(row["value"])
-            except json.decoder.JSONDecodeError:
-                yield row["value"]
+            value = self.decode(
+                self.decompress(row["value"], row["compression"]),
+                row["encoding"]
+            )
 
-    def mget(self, keys: Tuple[str, ...]) -> Iterator[Tuple[Any, datetime]]:
-        """Retrieve multiple values."""
+            if value is not None:
+                yield value
+
+    def mget(
+            self,
+            keys: Tuple[str, ...],
+            include_cache_date: bool = False
+    ) -> Dict[str, Any]:
+        """Retrieve multiple values as a mapping of key to value.
+
+        Keys that are not cached are left out. Values are served from
+        memory when possible, and the rest are read from the database
+        mget_batch_size keys per query by joining against a list of
+        wanted keys. When include_cache_date is set, each value is
+        paired with its cache date as with get().
+
+        """
+
+        found: Dict[str, Tuple[Any, Optional[datetime]]] = {}
+        wanted: Dict[Tuple[str, str], List[str]] = {}
 
-        filters = []
-        placeholders: List[str] = []
         for key in keys:
-            prefix, rest = self.keysplit(key)
-            placeholders.append(prefix)
-            placeholders.append(rest)
-            filters.append("(prefix=? AND key=?)")
+            entry = self.memory.get(key)
+
+            if entry:
+                found[key] = (entry[0], entry[1])
+            else:
+                wanted.setdefault(self.keysplit(key), []).append(key)
+
+        generation = self.memory.generation
+        pairs = list(wanted.items())
+
+        for offset in range(0, len(pairs), self.mget_batch_size):
+            batch = pairs[offset:offset + self.mget_batch_size]
+            placeholders = ", ".join("(?, ?)" for _ in batch)
+
+            rows = self._select(
+                f"""WITH wanted(prefix, key) AS (VALUES {placeholders})
+                SELECT u.prefix, u.key, u.value, u.encoding, u.compression,
+                u.created as 'created [local_datetime]',
+                unixepoch(u.expires) as expires_at
+                FROM wanted
+                JOIN unexpired u
+                ON u.prefix=wanted.prefix AND u.key=wanted.key""",  # nosec
+                [part for pair, _ in batch for part in pair]
+            )
 
-        sql = f"""SELECT key, value, created as 'created [local_datetime]'
-        FROM unexpired
-        WHERE {" or ".join(filters)}"""
+            for row in rows:
+                for key in wanted[(row["prefix"], row["key"])]:
+                    value, created = self.remember(key, row, generation)
 
-        rows = self._select_generator(sql, placeholders)
+                    if value is not None:
+                        found[key] = (value, created)
 
-        for row in rows:
-            key, value, created = row
-            if not isinstance(value, str):
-                yield (value, created)
-                continue
-            try:
-                yield (json.loads(value), created)
-            except json.decoder.JSONDecodeError:
-                yield (value, created)
+        if include_cache_date:
+            return found
+
+        return {key: value for key, (value, _) in found.items()}
 
     def check(self, key: str) -> bool:
         """Determine if a key exists in the check."""
 
+        if self.memory.get(key):
+            return True
+
         prefix, rest = self.keysplit(key)
 
         return bool(self._selectFirst(
@@ -160,18 +542,188 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
             (prefix, rest)
         ))
 
+    @staticmethod
+    def is_reddit(prefix: str, rest: str) -> bool:
+        """Whether a key refers to a Reddit JSON endpoint."""
+
+        return prefix in ("http", "https") and "reddit.com/" in rest
+
+    @staticmethod
+    def reddit_comments(listing: Any) -> Iterator[Dict[str, Any]]:
+        """Flatten a comment listing and its replies in reading order.
+
+        Placeholders for unloaded comments, removed comments, and
+        comments from bots or deleted accounts are skipped, but their
+        replies are not.
+
+        """
+
+        if not isinstance(listing, dict):
+            return
+
+        for child in listing.get("data", {}).get("children", []):
+            comment = child.get("data", {})
+
+            author = comment.get("author")
+            body_html = comment.get("body_html")
+
+            if (comment.get("id")
+                    and author is not None
+                    and author not in REDDIT_IGNORED_AUTHORS
+                    and body_html is not None
+                    and body_html != "[removed]"
+                    and "remindme!" not in body_html.lower()):
+                yield comment
+
+            yield from Plugin.reddit_comments(comment.get("replies"))
+
+    def reddit_projection(
+            self,
+            prefix: str,
+            rest: str,
+            value: Any
+    ) -> List[Tuple[str, Tuple[Any, ...]]]:
+        """Queries that replace the relational projection of a cached
+        Reddit response.
+
+        An index response yields pagination and story rows. A story
+        response, which is a pair of listings, yields the story and
+        its comments. Anything else, such as an error page, yields no
+        rows, so that those of the previous value are still cleared.
+
+        """
+
+        payload = value
+
+        if isinstance(value, (str, bytes)):
+            try:
+                payload = json.loads(value)
+            except ValueError:
+                payload = None
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = [
+            (f"DELETE FROM {table} WHERE prefix=? AND key=?", (prefix, rest))
+            for table in REDDIT_TABLES
+        ]
+
+        page: Dict[str, Any] = {}
+        stories: List[Dict[str, Any]] = []
+        comments: List[Dict[str, Any]] = []
+
+        try:
+            if isinstance(payload, dict):
+                page = payload["data"]
+                stories = sorted(
+                    (
+                        child["data"]
+                        for child in page["children"]
+                        if child.get("kind") == "t3"
+                    ),
+                    key=lambda story: story.get("created_utc") or 0,
+                    reverse=True
+                )
+            else:
+                stories = [payload[0]["data"]["children"][0]["data"]]
+                comments = list(self.reddit_comments(payload[1]))
+        except (KeyError, IndexError, TypeError, AttributeError):
+            pass
+
+        if not isinstance(page, dict):
+            page = {}
+
+        # The page row is written even for a malformed or non-JSON
+        # response, to record that the projection has been made.
+        queries.append((
+            """INSERT INTO reddit_page
+            (prefix, key, before, after, count)
+            VALUES (?, ?, ?, ?, ?)""",
+            (prefix, rest, page.get("before"), page.get("after"),
+             page.get("dist"))
+        ))
+
+        for position, story in enumerate(stories):
+            queries.append((
+                """INSERT INTO reddit_story
+                (prefix, key, position, title, url, domain, permalink,
+                num_comments, selftext, subreddit, created_utc, author,
+                num_crossposts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    prefix, rest, position,
+                    story.get("title"),
+                    story.get("url"),
+                    story.get("domain"),
+                    story.get("permalink"),
+                    story.get("num_comments"),
+                    story.get("selftext"),
+                    story.get("subreddit"),
+                    story.get("created_utc"),
+                    story.get("author"),
+                    story.get("num_crossposts"),
+                )
+            ))
+
+        for position, comment in enumerate(comments):
+            queries.append((
+                """INSERT INTO reddit_comment
+                (prefix, key, position, id, author, created_utc,
+                parent_id, body_html)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    prefix, rest, position,
+                    comment.get("id"),
+                    comment.get("author"),
+                    comment.get("created_utc"),
+                    comment.get("parent_id"),
+                    comment.get("body_html"),
+                )
+            ))
+
+        return queries
+
+    def reddit_projected(self, key: str) -> bool:
+        """Whether a cached Reddit response has been projected.
+
+        Responses cached before projections existed are projected
+        here on first read.
+
+        """
+
+        prefix, rest = self.keysplit(key)
+
+        row = self._selectOne(
+            """SELECT
+            EXISTS (
+                SELECT 1 FROM unexpired WHERE prefix=? AND key=?
+            ) AS cached,
+            EXISTS (
+                SELECT 1 FROM reddit_page WHERE prefix=? AND key=?
+            ) AS projected""",
+            (prefix, rest, prefix, rest)
+        )
+
+        if not row or not row["cached"]:
+            return False
+
+        if row["projected"]:
+            return True
+
+        return bool(self._multi(
+            self.reddit_projection(prefix, rest, self.get(key))
+        ))
+
     def reddit_pagination(self, url: Url) -> Dict[str, Any]:
         """Extract values needed to build Reddit pagination links."""
 
+        if not self.reddit_projected(url.address):
+            return {}
+
         prefix, rest = self.keysplit(url.address)
 
         row = self._selectOne(
-            """SELECT
-            json_extract(u.value, '$.data.before') as before,
-            json_extract(u.value, '$.data.after') as after,
-            json_extract(u.value, '$.data.dist') as count
-            FROM unexpired u
-            WHERE u.prefix=? AND u.key=?""",
+            """SELECT before, after, count
+            FROM reddit_page
+            WHERE prefix=? AND key=?""",
             (prefix, rest)
         )
 
@@ -182,25 +734,25 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
     def reddit_index(self, endpoint: Url) -> Iterator[Row]:
         """Render a list of stories."""
 
+        if not self.reddit_projected(endpoint.address):
+            return iter([])
+
         prefix, rest = self.keysplit(endpoint.address)
 
         return self._select_generator(
             """SELECT
-            j.value ->> '$.data.title' as title,
-            j.value ->> '$.data.url' as 'url [url]',
-            j.value ->> '$.data.domain' as domain,
-            FORMAT('https://reddit.com%s', j.value ->> '$.data.permalink')
-              AS 'permalink [url]',
-            j.value ->> '$.data.num_comments' as 'num_comments',
-            LENGTH(IFNULL(j.value ->> '$.data.selftext', '')) > 0 as selftext,
-            FORMAT('https://reddit.com/r/%s', j.value ->> '$.data.subreddit')
+            title,
+            url as 'url [url]',
+            domain,
+            FORMAT('https://reddit.com%s', permalink) AS 'permalink [url]',
+            num_comments,
+            LENGTH(IFNULL(selftext, '')) > 0 as selftext,
+            FORMAT('https://reddit.com/r/%s', subreddit)
               AS 'subreddit [url]',
-            j.value ->> '$.data.created_utc' as created_utc
-            FROM unexpired u, json_each(u.value, '$.data.children') j
-            WHERE u.prefix=? AND u.key=?
-            AND json_extract(u.value, j.fullkey || '.kind') == 't3'
-            ORDER BY j.value ->> '$.data.created_utc' DESC
-            """,
+            created_utc
+            FROM reddit_story
+            WHERE prefix=? AND key=?
+            ORDER BY position""",
             (prefix, rest)
         )
 
@@ -210,97 +762,125 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
     ) -> Tuple[Dict[str, Any], Iterator[Row]]:
         """Render a story discussion."""
 
+        if not self.reddit_projected(endpoint.address):
+            return ({}, iter([]))
+
         prefix, rest = self.keysplit(endpoint.address)
 
-        story_rows = self._select_generator(
+        row = self._selectOne(
             """SELECT
-            j.key, j.value
-            FROM unexpired u,
-                 json_each(u.value, '$[0].data.children[0].data') j
-            WHERE u.prefix=? AND u.key=?
-            AND j.key IN (
-                'selftext',
-                'created_utc',
-                'url',
-                'subreddit',
-                'title',
-                'num_comments',
-                'author',
-                'domain',
-                'num_crossposts'
-            )
-            UNION
-            SELECT
-              'author_url',
-              FORMAT('https://reddit.com/u/%s',
-                u.value ->> '$[0].data.children[0].data.author')
-              FROM unexpired u
-              WHERE u.prefix=? AND u.key=?
-            UNION
-            SELECT
-              'subreddit_url',
-              FORMAT('https://reddit.com/r/%s',
-                u.value ->> '$[0].data.children[0].data.subreddit')
-              FROM unexpired u
-              WHERE u.prefix=? AND u.key=?
-            """,
-            (prefix, rest) * 3
+            selftext, created_utc, url, subreddit, title, num_comments,
+            author, domain, num_crossposts,
+            FORMAT('https://reddit.com/u/%s', author) AS author_url,
+            FORMAT('https://reddit.com/r/%s', subreddit) AS subreddit_url
+            FROM reddit_story
+            WHERE prefix=? AND key=? AND position=0""",
+            (prefix, rest)
         )
 
-        story = {row["key"]: row["value"] for row in story_rows}
+        story = {}
+        if row:
+            story = {
+                key: value
+                for key, value in dict(row).items()
+                if value is not None
+            }
 
         comments = self._select_generator(
             """SELECT
-            j.value ->> '$.id' AS id,
-            j.value ->> '$.author' AS author,
-            FORMAT('https://reddit.com/u/%s', j.value ->> '$.author')
-              AS 'author_url [url]',
-            j.value ->> '$.created_utc' AS created_utc,
-            j.value ->> '$.parent_id' as parent_id,
-            j.value ->> '$.body_html' as body_html
-            FROM unexpired u, json_tree(u.value, '$[1].data.children') j
-            WHERE u.prefix=? AND u.key=?
-            AND j.key='data'
-            AND j.value ->> '$.id' <> ''
-            AND j.value ->> '$.author' != 'AutoModerator'
-            AND j.value ->> '$.author' != 'RemindMeBot'
-            AND j.value ->> '$.author' != '[deleted]'
-            AND j.value ->> '$.body_html' != '[removed]'
-            AND j.value ->> '$.body_html' NOT LIKE  '%RemindMe!%'
-            """,
+            id,
+            author,
+            FORMAT('https://reddit.com/u/%s', author) AS 'author_url [url]',
+            created_utc,
+            parent_id,
+            body_html
+            FROM reddit_comment
+            WHERE prefix=? AND key=?
+            ORDER BY position""",
             (prefix, rest)
         )
 
         return (story, comments)
 
     def get(self, key: str, include_cache_date: bool = False) -> Any:
-        """Retrieve a value from the store."""
+        """Retrieve a value from the store.
+
+        Values are served from memory when possible. Otherwise they
+        are read from the database and kept in memory until they
+        expire or are evicted.
+
+        """
+
+        entry = self.memory.get(key)
+
+        if entry:
+            value, created = entry[0:2]
+        else:
+            value, created = self.load(key)
+
+        if include_cache_date:
+            return (value, created)
+
+        return value
+
+    def load(self, key: str) -> Tuple[Any, Optional[datetime]]:
+        """Read a value and its cache date from the database and add
+        them to the memory tier."""
 
         prefix, rest = self.keysplit(key)
+        generation = self.memory.generation
 
         row = self._selectOne(
-            """SELECT value, created as 'created [local_datetime]'
+            """SELECT value, encoding, compression,
+            created as 'created [local_datetime]',
+            unixepoch(expires) as expires_at
             FROM unexpired
             WHERE prefix=? AND key=?""",
             (prefix, rest)
         )
 
-        value = None
-        created = None
-        if row:
-            value = row["value"]
-            created = row["created"]
+        if not row:
+            return (None, None)
 
-        if isinstance(value, str):
-            try:
-                value = json.loads(value)
-            except json.decoder.JSONDecodeError:
-                pass
+        return self.remember(key, row, generation)
 
-        if include_cache_date:
-            return (value, created)
+    def remember(
+            self,
+            key: str,
+            row: Row,
+            generation: int
+    ) -> Tuple[Any, Optional[datetime]]:
+        """Decode a value read from the database and add it to the
+        memory tier.
 
-        return value
+        A value that cannot be decoded is reported as missing and is
+        not kept.
+
+        """
+
+        value = self.decompress(row["value"], row["compression"])
+        size = len(key) + 8
+
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+
+        value = self.decode(value, row["encoding"])
+
+        if value is None:
+            return (None, None)
+
+        self.memory.put(
+            key,
+            (value, row["created"], row["expires_at"], size),
+            generation
+        )
+
+        return (value, row["created"])
+
+    def stats(self) -> Dict[str, int]:
+        """Usage counters for the memory tier."""
+
+        return self.memory.stats()
 
     def set(
             self,
@@ -310,39 +890,59 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
     ) -> bool:
         """Add a value to the store.
 
-        If the value is anything other than bytes or a string, JSON
-        encoding will be attempted. If the value cannot be JSON
-        encoded, no caching will occur.
+        If the value is anything other than bytes or a string, it is
+        marshaled. If that fails, no caching will occur.
+
+        Strings come back from get() exactly as they were stored.
+        Unlike rows from before encodings were recorded, JSON text is
+        not parsed on the way out; callers that want a parsed value
+        should cache the parsed value.
+
+        Reddit responses are also projected into relational rows in
+        the same transaction, replacing those of the previous value.
+
+        The value is written to the database and any copy of the
+        previous value is dropped from memory. The new value reaches
+        memory on its next read, decoded the same way as any other.
 
         """
 
-        value_for_storage = value
+        encoded = self.encode(value)
 
-        if isinstance(value, (dict, list, set)):
-            try:
-                value_for_storage = json.dumps(value)
-            except TypeError:
-                cherrypy.engine.publish(
-                    "applog:add",
-                    "cache:set",
-                    f"A value for {key} could not be cached."
-                )
+        if not encoded:
+            cherrypy.engine.publish(
+                "applog:add",
+                "cache:set",
+                f"A value for {key} could not be cached."
+            )
 
-                return False
+            return False
 
         prefix, rest = self.keysplit(key)
 
-        self._execute(
+        self.memory.discard(key)
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = [(
             """INSERT OR REPLACE INTO cache
-            (prefix, key, value, expires)
-            VALUES (?, ?, ?, datetime('now', ?))""",
+            (prefix, key, value, encoding, compression, expires)
+            VALUES (?, ?, ?, ?, ?, datetime('now', ?))""",
             (
                 prefix,
                 rest,
-                value_for_storage,
+                *encoded,
                 f"{lifespan_seconds} seconds"
             )
-        )
+        )]
+
+        if self.is_reddit(prefix, rest):
+            queries.extend(self.reddit_projection(prefix, rest, value))
+
+        if len(queries) == 1:
+            self._execute(*queries[0])
+        else:
+            self._multi(queries)
+
+        self.memory.discard(key)
 
         return True
 
@@ -351,12 +951,16 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
 
         prefix, rest = self.keysplit(key)
 
+        self.memory.discard(key)
+
         deletion_count = self._delete(
             """DELETE FROM cache
             WHERE prefix=? AND key=?""",
             (prefix, rest)
         )
 
+        self.memory.discard(key)
+
         unit = "row" if deletion_count == 1 else "rows"
 
         cherrypy.engine.publish(
@@ -367,14 +971,79 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
 
         return deletion_count
 
-    def prune(self) -> None:
-        """Delete expired cache entries."""
+    def delete_expired(self, deadline: float = 0) -> Tuple[int, bool]:
+        """Delete expired rows in batches until none remain or the
+        deadline passes.
 
-        deletion_count = self._delete(
-            """DELETE FROM cache
-            WHERE expires < datetime()"""
+        Each batch is its own transaction, so writers are never held
+        up for long. The deadline is a perf_counter() value, and 0
+        means no deadline. The return value is the number of rows
+        deleted and whether any expired rows might remain.
+
+        """
+
+        deletion_count = 0
+
+        while True:
+            batch_count = self._delete(
+                """DELETE FROM cache
+                WHERE rowid IN (
+                    SELECT rowid FROM cache
+                    WHERE expires < datetime()
+                    LIMIT ?
+                )""",
+                (self.sweep_batch_size,)
+            )
+
+            deletion_count += batch_count
+
+            if batch_count < self.sweep_batch_size:
+                return (deletion_count, False)
+
+            if deadline and time.perf_counter() > deadline:
+                return (deletion_count, True)
+
+    def sweep(self) -> int:
+        """Delete expired rows and reclaim free space for a short while.
+
+        This runs in the background on the scheduler, and schedules
+        its own next run. If expired rows remain when time runs out,
+        that run comes sooner.
+
+        """
+
+        self.memory.sweep()
+
+        deletion_count, remaining = self.delete_expired(
+            time.perf_counter() + self.sweep_seconds
         )
 
+        # Only executescript() steps this pragma to completion.
+        # Executing it as a query frees a single page.
+        self._create(f"PRAGMA incremental_vacuum({self.sweep_pages});")
+
+        cherrypy.engine.publish(
+            "scheduler:add",
+            1 if remaining else self.sweep_interval,
+            "cache:sweep"
+        )
+
+        return deletion_count
+
+    def prune(self) -> None:
+        """Delete all expired cache entries and reclaim free space.
+
+        This is the exhaustive counterpart to sweep(), for use during
+        maintenance.
+
+        """
+
+        self.memory.sweep()
+
+        deletion_count, _ = self.delete_expired()
+
+        self._create("PRAGMA incremental_vacuum;")
+
         unit = "row" if deletion_count == 1 else "rows"
 
         cherrypy.engine.publish(
@@ -1,9 +1,18 @@
 """Test suite for the cache plugin."""
 
+import json
+import marshal
+import tempfile
+import threading
+import time
 import unittest
+from typing import Any
+from typing import Dict
 from unittest.mock import Mock, patch
 import cherrypy
 import plugins.cache
+from plugins import mixins
+from resources.url import Url
 from testing.assertions import Subscriber
 
 
@@ -19,9 +28,254 @@ class TestCache(Subscriber):
         self.plugin.start()
         self.assert_prefixes(subscribe_mock, ("server", "cache"))
 
-    def test_placeholder(self) -> None:
-        """Placeholder to force pytest to generate a coverage file."""
-        pass   # pylint: disable=unnecessary-pass
+    def test_encoding(self) -> None:
+        """Values survive encoding with their types intact."""
+
+        values = (
+            b"\x00bytes",
+            "123",
+            {"key": (1, 2), 3: None},
+            {"set", "of", "strings"},
+            {"padding": "x" * 20000},
+        )
+
+        for value in values:
+            encoded = self.plugin.encode(value)
+            assert encoded is not None
+            stored, encoding, compression = encoded
+            decoded = self.plugin.decode(
+                self.plugin.decompress(stored, compression),
+                encoding
+            )
+
+            self.assertEqual(decoded, value)
+            self.assertIsInstance(decoded, type(value))
+
+        padded = self.plugin.encode(values[4])
+        assert padded is not None
+        self.assertEqual(
+            padded[1:],
+            (plugins.cache.MARSHAL_ENCODING, "zlib")
+        )
+        self.assertIsNone(self.plugin.encode({"unencodable": object()}))
+
+    def test_legacy_decoding(self) -> None:
+        """Values stored without an encoding are decoded by inspection."""
+
+        self.assertEqual(self.plugin.decode('{"a": 1}', None), {"a": 1})
+        self.assertEqual(self.plugin.decode("plain", None), "plain")
+
+    def test_undecodable(self) -> None:
+        """Corrupt values and values marshaled by another version of
+        Python are treated as missing."""
+
+        marshaled = marshal.dumps({"a": 1})
+
+        self.assertIsNone(
+            self.plugin.decode(marshaled[:-1], plugins.cache.MARSHAL_ENCODING)
+        )
+        self.assertIsNone(self.plugin.decode(marshaled, "marshal-2.7"))
+        self.assertIsNone(self.plugin.decompress(b"not zlib", "zlib"))
+
+        with tempfile.TemporaryDirectory() as database_dir:
+            cherrypy.config.update({"database_dir": database_dir})
+            plugin = plugins.cache.Plugin(cherrypy.engine)
+
+            try:
+                plugin.setup()
+                plugin.set("corrupt:key", {"a": 1})
+                plugin._execute(
+                    "UPDATE cache SET value=? WHERE prefix='corrupt'",
+                    (marshaled[:-1],)
+                )
+
+                self.assertIsNone(plugin.get("corrupt:key"))
+                self.assertEqual(plugin.mget(("corrupt:key",)), {})
+                self.assertEqual(plugin.stats()["entries"], 0)
+            finally:
+                mixins.pool.close_all()
+
+    def test_sweep(self) -> None:
+        """Expired rows are deleted in batches and their space reclaimed."""
+
+        with tempfile.TemporaryDirectory() as database_dir:
+            cherrypy.config.update({"database_dir": database_dir})
+            plugin = plugins.cache.Plugin(cherrypy.engine)
+            plugin.sweep_batch_size = 10
+
+            try:
+                plugin.setup()
+
+                for i in range(25):
+                    plugin.set(f"sweep:{i}", "x" * 5000, -1 if i % 5 else 60)
+
+                self.assertEqual(plugin.sweep(), 20)
+                self.assertEqual(
+                    plugin._selectFirst("SELECT count(*) FROM cache"),
+                    5
+                )
+                self.assertEqual(
+                    plugin._selectFirst("PRAGMA freelist_count"),
+                    0
+                )
+            finally:
+                mixins.pool.close_all()
+
+    def test_mget(self) -> None:
+        """Multiple values are returned by the keys they were requested
+        with."""
+
+        with tempfile.TemporaryDirectory() as database_dir:
+            cherrypy.config.update({"database_dir": database_dir})
+            plugin = plugins.cache.Plugin(cherrypy.engine)
+            plugin.mget_batch_size = 2
+
+            try:
+                plugin.setup()
+                plugin.set("a:1", {"value": 1})
+                plugin.set("a:2", "two")
+                plugin.set("plain", b"three")
+                plugin.set("a:expired", "four", -1)
+                plugin.get("a:1")
+
+                self.assertEqual(
+                    plugin.mget(
+                        ("a:1", "a:2", "plain", "_:plain", "a:expired", "a:3")
+                    ),
+                    {
+                        "a:1": {"value": 1},
+                        "a:2": "two",
+                        "plain": b"three",
+                        "_:plain": b"three",
+                    }
+                )
+                self.assertEqual(plugin.stats()["hits"], 1)
+            finally:
+                mixins.pool.close_all()
+
+    def test_reddit_projection(self) -> None:
+        """Reddit discussions are projected when cached."""
+
+        def comment(
+                comment_id: str,
+                author: str,
+                replies: Any = ""
+        ) -> Dict[str, Any]:
+            return {"kind": "t1", "data": {
+                "id": comment_id,
+                "author": author,
+                "body_html": f"by {author}",
+                "parent_id": "t3_a",
+                "created_utc": 1.0,
+                "replies": replies,
+            }}
+
+        payload = [
+            {"data": {"children": [
+                {"kind": "t3", "data": {"title": "Story", "author": "op"}}
+            ]}},
+            {"data": {"children": [
+                comment("1", "AutoModerator", {"data": {"children": [
+                    comment("2", "reader")
+                ]}}),
+                comment("3", "op"),
+                {"kind": "more", "data": {"id": "4"}},
+            ]}},
+        ]
+
+        key = "https://www.reddit.com/r/a/comments/a/.json"
+
+        with tempfile.TemporaryDirectory() as database_dir:
+            cherrypy.config.update({"database_dir": database_dir})
+            plugin = plugins.cache.Plugin(cherrypy.engine)
+
+            try:
+                plugin.setup()
+                plugin.set(key, json.dumps(payload))
+
+                story, comments = plugin.reddit_story(Url(key))
+                self.assertEqual(story["title"], "Story")
+                self.assertEqual(
+                    [row["id"] for row in comments],
+                    ["2", "3"]
+                )
+
+                plugin.set(key, "<html>Service unavailable</html>")
+                story, comments = plugin.reddit_story(Url(key))
+                self.assertEqual(story, {})
+                self.assertEqual(list(comments), [])
+
+                plugin.set(key, json.dumps(payload))
+                plugin.clear(key)
+                self.assertEqual(
+                    plugin._selectFirst("SELECT count(*) FROM reddit_comment"),
+                    0
+                )
+            finally:
+                mixins.pool.close_all()
+
+    def test_concurrent_load(self) -> None:
+        """A read that races a write cannot keep the old value in
+        memory."""
+
+        with tempfile.TemporaryDirectory() as database_dir:
+            cherrypy.config.update({"database_dir": database_dir})
+            plugin = plugins.cache.Plugin(cherrypy.engine)
+
+            try:
+                plugin.setup()
+                plugin.set("race:key", "old")
+
+                write = plugin._execute
+
+                def interleaved_write(*args: Any) -> bool:
+                    reader = threading.Thread(
+                        target=plugin.get,
+                        args=("race:key",)
+                    )
+                    reader.start()
+                    reader.join()
+                    return write(*args)
+
+                with patch.object(plugin, "_execute", interleaved_write):
+                    plugin.set("race:key", "new")
+
+                self.assertEqual(plugin.get("race:key"), "new")
+            finally:
+                mixins.pool.close_all()
+
+    def test_memory_tier(self) -> None:
+        """The memory tier evicts by recency and honors expiration."""
+
+        memory = plugins.cache.MemoryTier(budget=100)
+        later = time.time() + 60
+
+        memory.put("a", ("A", None, later, 40), memory.generation)
+        memory.put("b", ("B", None, later, 40), memory.generation)
+        memory.get("a")
+        memory.put("c", ("C", None, later, 40), memory.generation)
+        memory.put("d", ("D", None, time.time() - 1, 10), memory.generation)
+
+        self.assertIsNone(memory.get("b"))
+        self.assertIsNone(memory.get("d"))
+        self.assertEqual(memory.get("a"), ("A", None, later, 40))
+
+        stale = memory.generation
+        memory.discard("a")
+        memory.put("a", ("A", None, later, 40), stale)
+        self.assertIsNone(memory.get("a"))
+
+        self.assertEqual(
+            memory.stats(),
+            {
+                "entries": 1,
+                "bytes": 40,
+                "budget": 100,
+                "hits": 2,
+                "misses": 3,
+                "evictions": 1,
+            }
+        )
 
 
 if __name__ == "__main__":
@@ -3,16 +3,30 @@
 See https://googleapis.dev/python/storage/latest/client.html
 """
 
-import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import itertools
+import multiprocessing
+import os
 import pathlib
+import time
 from datetime import datetime, UTC
 from typing import Any
+from typing import Dict
 from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Tuple
 from typing import cast
 import cherrypy
+import orjson
 from plugins import decorators
 
+REQUEST_TOP_PATH = ("appengine.googleapis.com", "request_log")
+
+LogRecord = Tuple[str, int, str, str, Dict[str, Any]]
+
 
 class Plugin(cherrypy.process.plugins.SimplePlugin):
     """A CherryPy plugin for interacting with Google AppEngine."""
@@ -31,6 +45,11 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             self.ingest_file
         )
 
+        self.bus.subscribe(
+            "gcp:appengine:ingest_files",
+            self.ingest_files
+        )
+
     @staticmethod
     def full_storage_path(path: pathlib.Path) -> pathlib.Path:
         """Get an absolute path to a file within the storage root."""
@@ -50,9 +69,7 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
     ) -> None:
         """Match a log file to a processor based on its file path."""
 
-        request_top_path = ("appengine.googleapis.com", "request_log")
-
-        if not storage_path.parts[0:2] == request_top_path:
+        if not storage_path.parts[0:2] == REQUEST_TOP_PATH:
             return
 
         line_count = self.process_request_log(storage_path, batch_size)
@@ -65,7 +82,91 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             f"{line_count} {unit} ingested from {storage_path}"
         )
 
-        cherrypy.engine.publish("scheduler:add", 5, "logindex:parse")
+        cherrypy.engine.publish("scheduler:add", 5, "logindex:reversal")
+
+    @decorators.log_runtime
+    def ingest_files(
+            self,
+            storage_paths: Iterable[pathlib.Path],
+            workers: int = 0,
+            batch_size: int = 10000
+    ) -> int:
+        """Add several request logs to the logindex database at once.
+
+        This is the batch counterpart to ingest_file() for when many
+        hourly logs arrive together, such as after a backfill. Files
+        are read and converted by a pool of worker processes while the
+        results are inserted here, and reverse lookups are scheduled
+        once at the end rather than once per file.
+
+        A workers value of 0 means one worker per CPU.
+
+        """
+
+        jobs = [
+            (self.full_storage_path(storage_path), str(storage_path))
+            for storage_path in storage_paths
+            if storage_path.parts[0:2] == REQUEST_TOP_PATH
+        ]
+
+        jobs = [job for job in jobs if job[0].is_file()]
+
+        if not jobs:
+            return 0
+
+        start = time.perf_counter()
+        line_count = 0
+        max_workers = min(workers or os.cpu_count() or 1, len(jobs))
+
+        try:
+            for records in self.map_jobs(jobs, max_workers):
+                for i in range(0, len(records), batch_size):
+                    self.publish_lines(records[i:i + batch_size])
+                line_count += len(records)
+        except BrokenProcessPool as err:
+            cherrypy.engine.publish(
+                "applog:add",
+                "gcp_appengine:error",
+                f"Ingestion pool failed: {err}"
+            )
+
+        elapsed = time.perf_counter() - start
+        line_unit = "line" if line_count == 1 else "lines"
+        file_unit = "file" if len(jobs) == 1 else "files"
+
+        cherrypy.engine.publish(
+            "applog:add",
+            "gcp_appengine",
+            f"{line_count} {line_unit} ingested from {len(jobs)} {file_unit} "
+            f"in {elapsed:.1f} seconds, {line_count / elapsed:.0f} lines/sec"
+        )
+
+        cherrypy.engine.publish("scheduler:add", 5, "logindex:reversal")
+
+        return line_count
+
+    def map_jobs(
+            self,
+            jobs: List[Tuple[pathlib.Path, str]],
+            max_workers: int
+    ) -> Iterator[List[LogRecord]]:
+        """Read request logs in worker processes, or in-process when
+        there would only be one worker.
+
+        Results are yielded in the order of the jobs. The pool only
+        lives as long as the generator.
+
+        """
+
+        if max_workers < 2:
+            yield from itertools.starmap(self.read_request_log, jobs)
+            return
+
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            yield from executor.map(self.read_request_log, *zip(*jobs))
 
     @decorators.log_runtime
     def process_request_log(
@@ -77,11 +178,10 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
         Add the lines of an hourly request log in JSON format to the
         logindex database.
 
-        This is similar to the ingestion process for log files in
-        combined format, even though it means additional parsing
-        (going from JSON to combined here, and then parsing combined
-        back down to individual fields in the logindex plugin). Doing
-        it this way reduces duplication with the logindex plugin.
+        The JSON fields are mapped directly to logindex fields, so
+        these lines skip the parsing stage that log files in combined
+        format go through. A combined-format version of each line is
+        still stored for display.
         """
 
         log_path = self.full_storage_path(storage_path)
@@ -89,49 +189,57 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
         if not log_path.is_file():
             return 0
 
-        line_count = 0
-        batch: List[Any] = []
-        with open(log_path, "r", encoding="utf-8") as file_handle:
-            while True:
-                line = file_handle.readline()
+        records = self.read_request_log(log_path, str(storage_path))
 
-                if not line:
-                    break
+        for i in range(0, len(records), batch_size):
+            self.publish_lines(records[i:i + batch_size])
 
-                offset = file_handle.tell()
+        return len(records)
 
-                json_line = json.loads(line)
+    @classmethod
+    def read_request_log(
+            cls,
+            log_path: pathlib.Path,
+            source: str
+    ) -> List[LogRecord]:
+        """Convert the lines of a request log to insertable records.
 
-                payload = json_line.get("protoPayload")
+        This runs in a worker process during batch ingestion, so it
+        must not depend on the CherryPy bus.
 
-                if not payload:
-                    continue
+        Lines are read as bytes and hashed as they are, which matches
+        the hash of the decoded line. The offset of each record is the
+        position just past its line. Lines that are not valid JSON or
+        that lack a complete request payload are skipped.
+
+        """
+
+        records = []
+        offset = 0
 
-                combined_line = self.json_to_combined(payload)
+        with open(log_path, "rb") as file_handle:
+            for line in file_handle:
+                offset += len(line)
 
-                record_hash = cherrypy.engine.publish(
-                    "hasher:value",
-                    line,
-                    algorithm="md5"
-                ).pop()
+                try:
+                    payload = orjson.loads(line).get("protoPayload")
 
-                batch.append((
-                    str(storage_path),
+                    if not payload:
+                        continue
+
+                    fields, logline = cls.payload_to_fields(payload)
+                except (KeyError, ValueError):
+                    continue
+
+                records.append((
+                    source,
                     offset,
-                    record_hash,
-                    combined_line
+                    hashlib.md5(line, usedforsecurity=False).hexdigest(),
+                    logline,
+                    fields
                 ))
 
-                if len(batch) > batch_size:
-                    self.publish_lines(batch)
-                    line_count += len(batch)
-                    batch = []
-        if batch:
-            self.publish_lines(batch)
-            line_count += len(batch)
-            batch = []
-
-        return line_count
+        return records
 
     @staticmethod
     def combined_quoted(value: str = "") -> str:
@@ -152,7 +260,43 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             return f'{key}="{quoteless_value}"'
         return ""
 
-    def json_to_combined(self, payload: Any) -> str:
+    @classmethod
+    def payload_to_fields(
+            cls,
+            payload: Any
+    ) -> Tuple[Dict[str, Any], str]:
+        """Map a request payload to logindex fields and a line in
+        combined log format.
+
+        The fields are the ones the combined log parser would have
+        produced from the line, minus the ones logindex derives on
+        its own. Empty values become None as they would in parsing.
+
+        """
+
+        start_time = datetime.fromisoformat(
+            payload["startTime"]
+        ).astimezone(UTC)
+
+        uri, separator, query = payload["resource"].partition("?")
+
+        fields = {
+            "unix_timestamp": start_time.timestamp(),
+            "datestamp": start_time.strftime("%Y-%m-%d-%H"),
+            "ip": payload["ip"] or None,
+            "host": payload.get("host") or None,
+            "uri": uri or None,
+            "query": query if separator else None,
+            "statusCode": int(payload["status"]),
+            "method": payload["method"] or None,
+            "agent": payload.get("userAgent") or None,
+            "referrer": payload.get("referrer") or None,
+        }
+
+        return (fields, cls.json_to_combined(payload, start_time))
+
+    @classmethod
+    def json_to_combined(cls, payload: Any, start_time: datetime) -> str:
         """Format a JSON-formatted string in combined log format."""
 
         resource = " ".join((
@@ -161,22 +305,7 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             payload["httpVersion"]
         ))
 
-        formats = (
-            "%Y-%m-%dT%H:%M:%S.%f%z",
-            "%Y-%m-%dT%H:%M:%S%z"
-        )
-
-        for fmt in formats:
-            try:
-                parsed_timestamp = datetime.strptime(
-                    payload["startTime"],
-                    fmt
-                ).replace(tzinfo=UTC)
-                break
-            except ValueError:
-                pass
-
-        formatted_timestamp = parsed_timestamp.strftime(
+        formatted_timestamp = start_time.strftime(
             "%d/%b/%Y:%H:%M:%S:%f %z"
         )
 
@@ -185,27 +314,27 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             "-",
             "-",
             f'[{formatted_timestamp}]',
-            self.combined_quoted(resource),
+            cls.combined_quoted(resource),
             str(payload["status"]),
             payload.get("responseSize", "0"),
-            self.combined_quoted(payload.get("referrer")),
-            self.combined_quoted(payload.get("userAgent")),
-            self.combined_quoted(payload.get("host")),
-            self.combined_pair("latency", payload.get("latency")),
-            self.combined_pair("end_time", payload.get("endTime")),
-            self.combined_pair("version", payload.get("versionId")),
-            self.combined_pair("request_id", payload.get("requestId"))
+            cls.combined_quoted(payload.get("referrer")),
+            cls.combined_quoted(payload.get("userAgent")),
+            cls.combined_quoted(payload.get("host")),
+            cls.combined_pair("latency", payload.get("latency")),
+            cls.combined_pair("end_time", payload.get("endTime")),
+            cls.combined_pair("version", payload.get("versionId")),
+            cls.combined_pair("request_id", payload.get("requestId"))
         )
 
         return " ".join(fields).strip()
 
     @staticmethod
-    def publish_lines(batch: Iterable[str]) -> None:
-        """Send a batch of request logs in combined format to the logindex
+    def publish_lines(batch: Iterable[LogRecord]) -> None:
+        """Send a batch of request logs with their fields to the logindex
         plugin.
 
         """
         cherrypy.engine.publish(
-            "logindex:insert_line",
+            "logindex:insert_parsed",
             batch
         )
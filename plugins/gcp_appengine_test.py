@@ -1,10 +1,16 @@
 """Test suite for the gcp_appengine plugin."""
 
+import hashlib
+import pathlib
+import tempfile
 import unittest
+from typing import Any
+from typing import List
 from unittest.mock import Mock, patch
 import cherrypy
 import plugins.gcp_appengine
 from testing.assertions import Subscriber
+from testing.helpers import get_fixture
 
 
 class TestGcpApengine(Subscriber):
@@ -19,9 +25,135 @@ class TestGcpApengine(Subscriber):
         self.plugin.start()
         self.assert_prefix(subscribe_mock, "gcp")
 
-    def test_placeholder(self) -> None:
-        """Placeholder to force pytest to generate a coverage file."""
-        pass   # pylint: disable=unnecessary-pass
+    def test_read_request_log(self) -> None:
+        """Request log lines become records with fields and a
+        combined-format line."""
+
+        line = (
+            '{"protoPayload": {"ip": "192.0.2.1", "method": "GET", '
+            '"resource": "/?q=1", "httpVersion": "HTTP/1.1", '
+            '"startTime": "2024-01-01T01:02:03.456Z", "status": 200}}\n'
+        )
+
+        with tempfile.TemporaryDirectory() as workdir:
+            log_path = pathlib.Path(workdir) / "request.json"
+            log_path.write_text(
+                f"{line}not json\n{{}}\n{line}",
+                encoding="utf-8"
+            )
+
+            records = self.plugin.read_request_log(log_path, "request.json")
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0][1], len(line))
+        self.assertEqual(
+            records[0][2],
+            hashlib.md5(line.encode()).hexdigest()
+        )
+        self.assertTrue(records[0][3].startswith("192.0.2.1 - - [01/Jan/2024"))
+        self.assertEqual(records[0][4]["uri"], "/")
+        self.assertEqual(records[0][4]["query"], "q=1")
+        self.assertEqual(records[0][4]["datestamp"], "2024-01-01-01")
+        self.assertEqual(records[0][4]["unix_timestamp"], 1704070923.456)
+
+    def test_ingest_files(self) -> None:
+        """Request logs under the storage root are read and published
+        to logindex in batches, in the order of the files."""
+
+        fixture = get_fixture("appengine-request-log.json")
+        log_dir = pathlib.Path(*plugins.gcp_appengine.REQUEST_TOP_PATH)
+        storage_paths = [
+            log_dir / "2024" / "01" / "01" / "01.json",
+            log_dir / "2024" / "01" / "01" / "02.json",
+            pathlib.Path("other") / "03.json",
+            log_dir / "2024" / "01" / "01" / "04.json",
+        ]
+
+        with tempfile.TemporaryDirectory() as workdir:
+            storage_root = pathlib.Path(workdir)
+
+            for storage_path in storage_paths[:3]:
+                log_path = storage_root / storage_path
+                log_path.parent.mkdir(parents=True, exist_ok=True)
+                log_path.write_text(fixture, encoding="utf-8")
+
+            for workers in (1, 2):
+                with self.subTest(workers=workers):
+                    batches = []
+
+                    def registry(*_args: Any, **_kwargs: Any) -> pathlib.Path:
+                        return storage_root
+
+                    def insert_parsed(batch: List[Any]) -> None:
+                        batches.append(list(batch))
+
+                    subscriptions = (
+                        ("registry:first:value", registry),
+                        ("logindex:insert_parsed", insert_parsed),
+                    )
+
+                    for channel, callback in subscriptions:
+                        cherrypy.engine.subscribe(channel, callback)
+
+                    try:
+                        line_count = self.plugin.ingest_files(
+                            storage_paths,
+                            workers=workers,
+                            batch_size=2
+                        )
+                    finally:
+                        for channel, callback in subscriptions:
+                            cherrypy.engine.unsubscribe(channel, callback)
+
+                    self.assertEqual(line_count, 6)
+                    self.assertEqual(
+                        [len(batch) for batch in batches],
+                        [2, 1, 2, 1]
+                    )
+
+                    rows = [row for batch in batches for row in batch]
+                    lines = fixture.splitlines(keepends=True)
+
+                    self.assertEqual(
+                        [row[0] for row in rows],
+                        [str(storage_paths[0])] * 3 +
+                        [str(storage_paths[1])] * 3
+                    )
+
+                    self.assertEqual(
+                        [row[1] for row in rows[:3]],
+                        [
+                            len("".join(lines[:1])),
+                            len("".join(lines[:2])),
+                            len("".join(lines)),
+                        ]
+                    )
+
+                    self.assertEqual(
+                        rows[1][2],
+                        hashlib.md5(lines[1].encode()).hexdigest()
+                    )
+
+                    self.assertEqual(
+                        [row[4]["ip"] for row in rows[:3]],
+                        ["192.0.2.1", "192.0.2.2", "192.0.2.4"]
+                    )
+
+                    self.assertEqual(rows[0][4]["host"], "example.com")
+                    self.assertEqual(rows[1][4]["statusCode"], 302)
+                    self.assertEqual(
+                        rows[1][4]["referrer"],
+                        "https://example.com/"
+                    )
+                    self.assertEqual(rows[2][4]["datestamp"], "2024-01-01-01")
+                    self.assertTrue(rows[2][3].startswith(
+                        '192.0.2.4 - - [01/Jan/2024:01:59:59:000000 +0000] '
+                        '"HEAD / HTTP/2" 404 0'
+                    ))
+                    self.assertEqual(rows[:3], [
+                        (str(storage_paths[0]),) + row[1:]
+                        for row in rows[3:]
+                    ])
 
 
 if __name__ == "__main__":
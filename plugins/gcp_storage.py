@@ -100,6 +100,7 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             return
 
         files_pulled = 0
+        request_logs = []
 
         for item in bucket.get("items", []):
             item_path = pathlib.Path(item.get("name", ""))
@@ -149,15 +150,18 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             request_top_path = ("appengine.googleapis.com", "request_log")
 
             if item_path.parts[0:2] == request_top_path:
-                cherrypy.engine.publish(
-                    "scheduler:add",
-                    1,
-                    "gcp:appengine:ingest_file",
-                    item_path
-                )
+                request_logs.append(item_path)
 
             files_pulled += 1
 
+        if request_logs:
+            cherrypy.engine.publish(
+                "scheduler:add",
+                1,
+                "gcp:appengine:ingest_files",
+                request_logs
+            )
+
         cherrypy.engine.publish(
             "applog:add",
             "gcp_storage",
@@ -1,19 +1,78 @@
 """Look up geographic and network information for an IP address."""
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import math
 import os.path
 import pathlib
 import socket
+import threading
+import time
 from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Optional
 import maxminddb
+from maxminddb.const import MODE_MMAP
+from maxminddb.reader import Reader
 import cherrypy
 
 
-class Plugin(cherrypy.process.plugins.SimplePlugin):
-    """A CherryPy plugin for looking up information about an IP address."""
+def resolve_fqdn(ip_address: str) -> str:
+    """Look up the fully-qualified reverse hostname of an IP address.
+
+    This picks a name the same way as socket.getfqdn(), but lets
+    lookup failures propagate rather than returning the address, so
+    that a missing name can be told apart from a failed lookup.
+
+    """
+
+    hostname, aliases, _ = socket.gethostbyaddr(ip_address)
+
+    for name in (hostname, *aliases):
+        if "." in name:
+            return name
+
+    return hostname
+
 
-    def __init__(self, bus: cherrypy.process.wspbus.Bus) -> None:
+class Plugin(cherrypy.process.plugins.SimplePlugin):
+    """A CherryPy plugin for looking up information about an IP address.
+
+    Geographic facts come from a GeoLite2 database that is opened once
+    and kept open. Shaped results are held in a bounded LRU cache that
+    is emptied whenever the database file changes.
+
+    Reverse lookups run concurrently on a small thread pool. Addresses
+    that fail to resolve are remembered for a while so that they are
+    not retried on every pass.
+
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            bus: cherrypy.process.wspbus.Bus,
+            cache_size: int = 10000,
+            resolver: Callable[[str], str] = resolve_fqdn,
+            resolver_workers: int = 16,
+            unresolved_ttl: int = 3600
+    ) -> None:
         cherrypy.process.plugins.SimplePlugin.__init__(self, bus)
+        self.reader: Optional[Reader] = None
+        self.reader_modified: float = 0
+        self.cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resolver = resolver
+        self.resolver_workers = resolver_workers
+        self.resolver_pool: Optional[ThreadPoolExecutor] = None
+        self.unresolved: Dict[str, float] = {}
+        self.unresolved_ttl = unresolved_ttl
 
     def start(self) -> None:
         """Define the CherryPy messages to listen for.
@@ -22,7 +81,24 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
         """
         self.bus.subscribe("ip:db:modified", self.db_modified)
         self.bus.subscribe("ip:facts", self.facts)
+        self.bus.subscribe("ip:facts:many", self.facts_many)
+        self.bus.subscribe("ip:facts:stats", self.stats)
         self.bus.subscribe("ip:reverse", self.reverse)
+        self.bus.subscribe("ip:reverse:many", self.reverse_many)
+
+    def stop(self) -> None:
+        """Close the GeoIP database and stop the resolver pool."""
+
+        if self.resolver_pool:
+            self.resolver_pool.shutdown(wait=False, cancel_futures=True)
+            self.resolver_pool = None
+
+        with self.lock:
+            if self.reader:
+                self.reader.close()
+            self.reader = None
+            self.reader_modified = 0
+            self.cache.clear()
 
     @staticmethod
     def db_path() -> pathlib.Path:
@@ -43,84 +119,268 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
 
         return 0
 
-    def facts(self, ip_address: str) -> Dict[str, str]:
+    def get_reader(self) -> Optional[Reader]:
+        """Open the GeoIP database or return the already-open reader.
+
+        A new modification time means the database has been replaced
+        since it was opened, so it is reopened and any facts cached
+        from the old one are dropped. The previous reader is left for
+        garbage collection rather than closed, since another thread
+        could be in the middle of a lookup with it.
+
+        """
+
+        modified = self.db_modified()
+
+        with self.lock:
+            if modified != self.reader_modified:
+                self.reader = None
+                self.reader_modified = modified
+                self.cache.clear()
+
+                if modified:
+                    try:
+                        self.reader = maxminddb.open_database(
+                            str(self.db_path()),
+                            MODE_MMAP
+                        )
+                    except (ValueError, OSError):
+                        pass
+
+            return self.reader
+
+    def facts(
+            self,
+            ip_address: str,
+            include_annotations: bool = True
+    ) -> Dict[str, Any]:
         """Look up geographic information for an IP address."""
 
-        facts: Dict[str, Any] = {
-            "annotations": [],
-            "geo": {
-                "city": "",
-                "country_code": "",
-                "country_name": "",
-                "region_code": "",
-                "latitude": "",
-                "longitude": "",
-                "metro_code": "",
-                "map_region": ""
+        return self.facts_many(
+            (ip_address,),
+            include_annotations
+        )[ip_address]
+
+    def facts_many(
+            self,
+            ip_addresses: Iterable[str],
+            include_annotations: bool = False
+    ) -> Dict[str, Dict[str, Any]]:
+        """Look up geographic information for several IP addresses.
+
+        Annotations are found with a single registry query for the
+        whole set, and are skipped entirely unless asked for.
+
+        """
+
+        result: Dict[str, Dict[str, Any]] = {
+            ip_address: {
+                "annotations": [],
+                "geo": dict(self.geo(ip_address)),
             }
+            for ip_address in ip_addresses
         }
 
-        _, rows = cherrypy.engine.publish(
-            "registry:search",
-            f"ip:{ip_address}"
-        ).pop()
+        if include_annotations and result:
+            _, rows = cherrypy.engine.publish(
+                "registry:search",
+                keys=tuple(f"ip:{ip_address}" for ip_address in result),
+                limit=0
+            ).pop()
+
+            for row in rows:
+                ip_address = row["key"].split(":", 1)[1]
+                result[ip_address]["annotations"].append(
+                    (row["value"], row["rowid"])
+                )
 
-        if rows:
-            facts["annotations"] = [
-                (row["value"], row["rowid"])
-                for row in rows
-            ]
+        return result
 
-        geodb_path = self.db_path()
+    def geo(self, ip_address: str) -> Dict[str, Any]:
+        """Find the geographic facts for an IP address, using the cache
+        when possible.
+
+        """
+
+        reader = self.get_reader()
+
+        with self.lock:
+            cached = self.cache.get(ip_address)
+            if cached:
+                self.cache.move_to_end(ip_address)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = None
+        if reader:
+            try:
+                result = reader.get(ip_address)
+            except ValueError:
+                pass
+
+        geo = self.shape(result)
+
+        with self.lock:
+            self.cache[ip_address] = geo
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
 
-        try:
-            reader = maxminddb.open_database(str(geodb_path))
-            result = reader.get(ip_address)
-        except (ValueError, FileNotFoundError):
-            pass
+        return geo
+
+    @staticmethod
+    def shape(result: Any) -> Dict[str, Any]:
+        """Reduce a GeoIP database record to the fields of interest."""
+
+        geo: Dict[str, Any] = {
+            "city": "",
+            "country_code": "",
+            "country_name": "",
+            "region_code": "",
+            "latitude": "",
+            "longitude": "",
+            "metro_code": "",
+            "map_region": ""
+        }
 
         if result:
 
             try:
-                facts["geo"]["city"] = result["city"]["names"]["en"]
+                geo["city"] = result["city"]["names"]["en"]
             except KeyError:
                 pass
 
             try:
-                facts["geo"]["country_code"] = result["country"]["iso_code"]
+                geo["country_code"] = result["country"]["iso_code"]
             except KeyError:
                 pass
 
             try:
-                facts["geo"]["country_name"] = result["country"]["names"]["en"]
+                geo["country_name"] = result["country"]["names"]["en"]
             except KeyError:
                 pass
 
             try:
-                facts["geo"]["region_code"] = result["subdivisions"][0]["iso_code"]
+                geo["region_code"] = result["subdivisions"][0]["iso_code"]
             except (IndexError, KeyError):
                 pass
 
             try:
-                facts["geo"]["latitude"] = result["location"]["latitude"]
-                facts["geo"]["longitude"] = result["location"]["longitude"]
-                facts["geo"]["metro_code"] = result["location"]["metro_code"]
+                geo["latitude"] = result["location"]["latitude"]
+                geo["longitude"] = result["location"]["longitude"]
+                geo["metro_code"] = result["location"]["metro_code"]
             except KeyError:
                 pass
 
         # Google charts
-        facts["geo"]["map_region"] = facts["geo"]["country_code"]
-        if facts["geo"]["country_code"] == "US":
-            if facts["geo"]["region_code"]:
-                country_code = facts["geo"]["country_code"]
-                region_code = facts["geo"]["region_code"]
-                facts["geo"]["map_region"] = f"{country_code}-{region_code}"
+        geo["map_region"] = geo["country_code"]
+        if geo["country_code"] == "US":
+            if geo["region_code"]:
+                country_code = geo["country_code"]
+                region_code = geo["region_code"]
+                geo["map_region"] = f"{country_code}-{region_code}"
 
-        return facts
+        return geo
+
+    def stats(self) -> Dict[str, Any]:
+        """Usage counters for the facts cache."""
+
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
+
+    def reverse(
+            self,
+            ip_address: str,
+            timeout: float = 5
+    ) -> Dict[str, Any]:
+        """Look up the reverse host and domain for an IP address."""
+
+        return self.reverse_many((ip_address,), timeout).get(
+            ip_address,
+            self.reverse_facts(ip_address, "")
+        )
+
+    def reverse_many(
+            self,
+            ip_addresses: Iterable[str],
+            timeout: float = 2
+    ) -> Dict[str, Dict[str, Any]]:
+        """Look up reverse hosts for several IP addresses at once.
+
+        The timeout applies to each lookup. Since lookups beyond the
+        size of the pool have to wait their turn, the overall deadline
+        is scaled by the number of rounds the pool needs.
+
+        A lookup that times out is abandoned rather than interrupted,
+        and its address is left out of the result so that callers can
+        retry it later. Only addresses that genuinely failed to
+        resolve are remembered as unresolved.
+
+        """
+
+        now = time.monotonic()
+        result: Dict[str, Dict[str, Any]] = {}
+        pending = []
+
+        for ip_address in set(ip_addresses):
+            if self.unresolved.get(ip_address, 0) > now:
+                result[ip_address] = self.reverse_facts(ip_address, "")
+            else:
+                pending.append(ip_address)
+
+        if not pending:
+            return result
+
+        if not self.resolver_pool:
+            self.resolver_pool = ThreadPoolExecutor(
+                max_workers=self.resolver_workers,
+                thread_name_prefix="ReverseDNS"
+            )
+
+        futures = [
+            (ip_address, self.resolver_pool.submit(self.resolver, ip_address))
+            for ip_address in pending
+        ]
+
+        deadline = now + timeout * math.ceil(
+            len(pending) / self.resolver_workers
+        )
+
+        for ip_address, future in futures:
+            try:
+                reverse_host = future.result(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except (socket.herror, socket.gaierror):
+                reverse_host = ip_address
+            except (FutureTimeoutError, OSError, UnicodeError):
+                future.cancel()
+                continue
+
+            if reverse_host in ("", ip_address):
+                self.unresolved[ip_address] = now + self.unresolved_ttl
+                reverse_host = ""
+
+            result[ip_address] = self.reverse_facts(ip_address, reverse_host)
+
+        if len(self.unresolved) > self.cache_size:
+            self.unresolved = {
+                key: expiration
+                for key, expiration in self.unresolved.items()
+                if expiration > now
+            }
+
+        return result
 
     @staticmethod
-    def reverse(ip_address: str) -> Dict[str, Any]:
-        """Look up the reverse host and domain for an IP address.
+    def reverse_facts(ip_address: str, reverse_host: str) -> Dict[str, Any]:
+        """Split a reverse hostname into host and domain.
 
         These are treated as separate values because the reverse host
         may embed the IP (reversed or otherwise). The non-IP parts are
@@ -133,9 +393,7 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             "reverse_domain": ""
         }
 
-        reverse_host = socket.getfqdn(ip_address)
-
-        if reverse_host != ip_address:
+        if reverse_host and reverse_host != ip_address:
             # Reverse by IPv4 quads (12.34.56.78 becomes 78.56.34.21)
             quads = ip_address.split(".")
             reversed_ip = ".".join(quads[::-1])
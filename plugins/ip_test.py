@@ -1,5 +1,7 @@
 """Test suite for the ip plugin."""
 
+import socket
+import time
 import unittest
 from unittest.mock import Mock, patch
 import cherrypy
@@ -19,9 +21,55 @@ class TestIp(Subscriber):
         self.plugin.start()
         self.assert_prefix(subscribe_mock, "ip")
 
-    def test_placeholder(self) -> None:
-        """Placeholder to force pytest to generate a coverage file."""
-        pass   # pylint: disable=unnecessary-pass
+    @patch("plugins.ip.Plugin.db_modified", return_value=0)
+    def test_cache_eviction(self, _: Mock) -> None:
+        """The facts cache is bounded and tracks its hit rate."""
+
+        self.plugin.cache_size = 2
+
+        self.plugin.facts_many(("192.0.2.1", "192.0.2.2"))
+        self.plugin.facts_many(("192.0.2.1", "192.0.2.3"))
+
+        self.assertEqual(list(self.plugin.cache), ["192.0.2.1", "192.0.2.3"])
+        self.assertEqual(self.plugin.stats()["hits"], 1)
+        self.assertEqual(self.plugin.stats()["misses"], 3)
+
+    def test_reverse_many(self) -> None:
+        """Reverse lookups time out, and failures but not timeouts are
+        remembered. Timed-out addresses are left out of the result."""
+
+        lookups = []
+
+        def resolver(ip_address: str) -> str:
+            lookups.append(ip_address)
+            if ip_address == "192.0.2.3" and lookups.count(ip_address) == 1:
+                time.sleep(0.5)
+            if ip_address == "192.0.2.4":
+                raise socket.herror("Unknown host")
+            if ip_address == "192.0.2.1":
+                return "host-192-0-2-1.example.com"
+            return ip_address
+
+        plugin = plugins.ip.Plugin(cherrypy.engine, resolver=resolver)
+
+        result = plugin.reverse_many(
+            ("192.0.2.1", "192.0.2.2", "192.0.2.3", "192.0.2.4"),
+            timeout=0.1
+        )
+
+        self.assertEqual(
+            result["192.0.2.1"]["reverse_domain"],
+            "example.com"
+        )
+        self.assertEqual(result["192.0.2.2"]["reverse_host"], "")
+        self.assertNotIn("192.0.2.3", result)
+        self.assertEqual(result["192.0.2.4"]["reverse_host"], "")
+        self.assertEqual(set(plugin.unresolved), {"192.0.2.2", "192.0.2.4"})
+
+        plugin.reverse_many(("192.0.2.2", "192.0.2.3", "192.0.2.4"))
+        self.assertEqual(lookups.count("192.0.2.3"), 2)
+        self.assertEqual(len(lookups), 5)
+        plugin.stop()
 
 
 if __name__ == "__main__":
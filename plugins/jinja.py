@@ -366,10 +366,22 @@ class Plugin(cherrypy.process.plugins.SimplePlugin):
             context: jinja2.runtime.Context,
             record: sqlite3.Row
     ) -> str:
-        """Add hyperlinks to a log entry."""
+        """Add hyperlinks to a log entry.
+
+        Lines whose raw text has been moved to the logindex archive
+        are fetched from there.
+
+        """
 
         result = cast(str, record["logline"])
 
+        if result is None:
+            result = cherrypy.engine.publish(
+                "logindex:archived_line",
+                record["source_file"],
+                record["source_offset"]
+            ).pop()
+
         # ip
         link = f"""<a href="/visitors?query=ip+{record['ip']}"
         title="Search for visits from this address"
@@ -1,37 +1,447 @@
 """Parse webserver log files for storage in an SQLite database."""
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import base64
+import binascii
+import ctypes
+import ctypes.util
+import functools
+import hashlib
+import math
+import mmap
+import multiprocessing
 import os
 import os.path
 import pathlib
+import queue
 import re
+import select
 import sqlite3
+import struct
+import threading
+import time
+import zlib
 from typing import Any
 from typing import Dict
 from typing import Iterable
+from typing import Iterator
 from typing import Deque
 from typing import List
 from typing import Optional
-from typing import Sequence
+from typing import Set
 from typing import Tuple
 from typing import Union
 from typing import cast
 from collections import deque
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 import cherrypy
 import parsers.logindex_query
 import parsers.combined_log
+from resources.url import Url
 from plugins import mixins
 from plugins import decorators
 
 
+AGENT_URL_PATTERN = re.compile(r"https?://(www\.)?(.*?)[/; ]")
+
+# User agent classifications in order of precedence, with the
+# substrings that identify them. An agent matching more than one takes
+# the first; most bots also claim to be Mozilla, and feed readers often
+# call themselves fetchers.
+AGENT_CLASSIFICATIONS = (
+    ("feed", r"feed|rss|atom/|podcast|newsblur|inoreader|netnewswire|miniflux"),
+    ("bot", r"bot\b|bot/|crawl|spider|slurp|archiver|fetcher|scanner|"
+     r"headless|lighthouse|pingdom|uptime|monitor|preview|"
+     r"facebookexternalhit|scrapy|validator"),
+    ("tool", r"curl|wget|python|httpie|go-http-client|java/|okhttp|"
+     r"libwww|perl|ruby|php/|axios|node-fetch|aiohttp|httpclient"),
+    ("browser", r"mozilla|opera|safari|chrome|firefox|edg/"),
+)
+
+AGENT_CLASSIFICATION_PATTERN = re.compile(
+    "|".join(
+        f"(?P<{name}>{pattern})"
+        for name, pattern in AGENT_CLASSIFICATIONS
+    ),
+    re.IGNORECASE
+)
+
+PARSED_COLUMNS = (
+    "unix_timestamp", "datestamp", "ip", "host", "uri", "query",
+    "statusCode", "method", "agent", "agent_domain", "classification",
+    "country", "region", "city", "latitude", "longitude", "cookie",
+    "referrer", "referrer_domain"
+)
+
+PARSED_UPDATE_SQL = (
+    "UPDATE {table} SET "
+    + ", ".join(f"{column}=?" for column in PARSED_COLUMNS)
+    + " WHERE rowid=?"
+)
+
+# High-cardinality strings that repeat from line to line are stored
+# once in a lookup table per column and referenced from partitions by
+# id. The logs view joins them back in under their original names.
+#
+# Lookup values compare case-insensitively like the columns they
+# replace, but are unique by exact value so that the original text
+# survives.
+INTERNED_COLUMNS = ("host", "uri", "agent", "referrer")
+
+INTERNED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interned_{column} (
+    id integer PRIMARY KEY,
+    value collate nocase,
+    UNIQUE(value collate binary)
+);
+
+CREATE INDEX IF NOT EXISTS index_interned_{column}_value
+    ON interned_{column} (value);
+"""
+
+INTERNED_UPDATE_SQL = (
+    "UPDATE {table} SET "
+    + ", ".join(
+        f"{column}_id=?" if column in INTERNED_COLUMNS else f"{column}=?"
+        for column in PARSED_COLUMNS
+    )
+    + " WHERE rowid=?"
+)
+
+# Lines from structured sources arrive with their fields already known
+# and are inserted whole rather than updated after parsing.
+INSERTED_COLUMNS = ("source_file", "source_offset", "hash", "logline")
+
+PARSED_INSERT_SQL = (
+    "INSERT OR IGNORE INTO {table} ("
+    + ", ".join(INSERTED_COLUMNS + PARSED_COLUMNS)
+    + ") VALUES ("
+    + ", ".join("?" * (len(INSERTED_COLUMNS) + len(PARSED_COLUMNS)))
+    + ")"
+)
+
+INTERNED_INSERT_SQL = (
+    "INSERT OR IGNORE INTO {table} ("
+    + ", ".join(INSERTED_COLUMNS + tuple(
+        f"{column}_id" if column in INTERNED_COLUMNS else column
+        for column in PARSED_COLUMNS
+    ))
+    + ") VALUES ("
+    + ", ".join("?" * (len(INSERTED_COLUMNS) + len(PARSED_COLUMNS)))
+    + ")"
+)
+
+# The columns of the logs view, in the order that partitions that
+# predate interning store them.
+LOG_COLUMNS = (
+    "id", "unix_timestamp", "datestamp", "hash", "source_file",
+    "source_offset", "ip", "host", "uri", "query", "statusCode", "method",
+    "agent", "agent_domain", "classification", "country", "region", "city",
+    "latitude", "longitude", "cookie", "referrer", "referrer_domain",
+    "logline"
+)
+
+INTERNED_SELECT_SQL = (
+    "SELECT "
+    + ", ".join(
+        f"interned_{column}.value AS {column}"
+        if column in INTERNED_COLUMNS else f"{{table}}.{column}"
+        for column in LOG_COLUMNS
+    )
+    + " FROM {table} "
+    + " ".join(
+        f"LEFT JOIN interned_{column} "
+        f"ON interned_{column}.id={{table}}.{column}_id"
+        for column in INTERNED_COLUMNS
+    )
+)
+
+# Log lines are stored in one table per month, and the logs view joins
+# them back together. Queries restricted by date can skip the months
+# they don't need, and retention drops a month at a time.
+#
+# Each partition's ids start from a base derived from its month, so
+# that an id identifies its partition. The table that predates
+# partitioning is kept as-is, and its ids fall below every base.
+PARTITION_ID_BITS = 32
+
+LEGACY_PARTITION = "logs_legacy"
+
+PARTITION_NAME_PATTERN = re.compile(r"logs_(\d{4})_(\d{2})")
+
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id integer PRIMARY KEY AUTOINCREMENT,
+    unix_timestamp integer,
+    datestamp,
+    hash,
+    source_file,
+    source_offset integer,
+    ip collate nocase,
+    host_id integer,
+    uri_id integer,
+    query collate nocase,
+    statusCode integer,
+    method collate nocase,
+    agent_id integer,
+    agent_domain collate nocase,
+    classification collate nocase,
+    country collate nocase,
+    region collate nocase,
+    city collate nocase,
+    latitude real,
+    longitude real,
+    cookie collate nocase,
+    referrer_id integer,
+    referrer_domain collate nocase,
+    logline,
+    UNIQUE(hash)
+);
+
+INSERT INTO sqlite_sequence (name, seq)
+SELECT '{table}', {base}
+WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name='{table}');
+
+CREATE INDEX IF NOT EXISTS {table}_datestamp
+    ON {table} (datestamp desc);
+CREATE INDEX IF NOT EXISTS {table}_unix_timestamp
+    ON {table} (unix_timestamp desc);
+CREATE INDEX IF NOT EXISTS {table}_ip_datestamp
+    ON {table} (ip, datestamp);
+CREATE INDEX IF NOT EXISTS {table}_host_id
+    ON {table} (host_id);
+CREATE INDEX IF NOT EXISTS {table}_uri_id
+    ON {table} (uri_id);
+CREATE INDEX IF NOT EXISTS {table}_statusCode
+    ON {table} (statusCode);
+CREATE INDEX IF NOT EXISTS {table}_method
+    ON {table} (method);
+CREATE INDEX IF NOT EXISTS {table}_agent_domain
+    ON {table} (agent_domain);
+CREATE INDEX IF NOT EXISTS {table}_classification
+    ON {table} (classification);
+CREATE INDEX IF NOT EXISTS {table}_country
+    ON {table} (country);
+CREATE INDEX IF NOT EXISTS {table}_city
+    ON {table} (city);
+CREATE INDEX IF NOT EXISTS {table}_region
+    ON {table} (region);
+CREATE INDEX IF NOT EXISTS {table}_cookie
+    ON {table} (cookie);
+CREATE INDEX IF NOT EXISTS {table}_source_file
+    ON {table} (source_file);
+"""
+
+IP_LOCATION_UPSERT_SQL = """INSERT INTO ip_location (ip, region, city)
+VALUES (?, ?, ?)
+ON CONFLICT (ip) DO UPDATE SET
+region=COALESCE(NULLIF(region, ''), excluded.region),
+city=COALESCE(NULLIF(city, ''), excluded.city)"""
+
+# The date portion of the timestamp in a combined-format line.
+LINE_MONTH_PATTERN = re.compile(r"\[\d{2}/([A-Z][a-z]{2})/(\d{4}):")
+
+MONTH_ABBREVIATIONS = (
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
+)
+
+# Columns that are counted per day and per hour as lines are parsed.
+# Counting by IP doubles as a record of unique visitors.
+ROLLUP_DIMENSIONS = (
+    "host", "statusCode", "country", "agent_domain", "referrer_domain", "ip"
+)
+
+# Rollup tables and the length of the datestamp prefix that identifies
+# their period.
+ROLLUP_PERIODS = (("rollup_daily", 10), ("rollup_hourly", 13))
+
+# The inotify events that indicate a followed file has been written to
+# or replaced.
+INOTIFY_EVENTS = 0x002 | 0x400 | 0x800  # IN_MODIFY, IN_DELETE_SELF, IN_MOVE_SELF
+
+# The header of a saved BloomFilter: its size in bits, number of hash
+# functions, capacity and count of added items.
+BLOOM_HEADER = struct.Struct("<QQQQ")
+
+CompiledAlert = Tuple[str, str, parsers.logindex_query.Predicate]
+PreparedQuery = Tuple[str, parsers.logindex_query.Params]
+
+
+class BloomFilter():
+    """A compact, probabilistic set of line hashes.
+
+    Membership tests can return false positives but never false
+    negatives, so a hash that is not found has definitely not been
+    added. Bit positions are derived from the hash itself, which is
+    already uniformly distributed.
+
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        self.capacity = capacity
+        self.count = 0
+        self.size = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @staticmethod
+    def to_int(digest: str) -> int:
+        """Convert a hex digest to an integer.
+
+        Anything that isn't hex is hashed first so that it can still
+        be added.
+
+        """
+
+        try:
+            return int(digest, 16)
+        except ValueError:
+            return int.from_bytes(
+                hashlib.md5(digest.encode(), usedforsecurity=False).digest()
+            )
+
+    def positions(self, digest: str) -> Iterator[int]:
+        """Map a hex digest to bit positions by double hashing."""
+
+        value = self.to_int(digest)
+        first = value >> 64
+        second = (value & 0xFFFFFFFFFFFFFFFF) | 1
+
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, digest: str) -> bool:
+        """Add a hex digest to the set and report whether it may have
+        been added before.
+
+        This is on the ingestion hot path, so positions() is inlined.
+
+        """
+
+        value = self.to_int(digest)
+        position = value >> 64
+        step = (value & 0xFFFFFFFFFFFFFFFF) | 1
+        bits = self.bits
+        size = self.size
+        present = True
+
+        for _ in range(self.hashes):
+            position %= size
+            mask = 1 << (position & 7)
+
+            if not bits[position >> 3] & mask:
+                present = False
+                bits[position >> 3] |= mask
+
+            position += step
+
+        if not present:
+            self.count += 1
+
+        return present
+
+    def __contains__(self, digest: object) -> bool:
+        if not isinstance(digest, str):
+            return False
+
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(digest)
+        )
+
+    def is_full(self) -> bool:
+        """Whether the error rate has exceeded what it was sized for."""
+
+        return self.count > self.capacity
+
+    def save(self, path: str) -> None:
+        """Write the filter to a file, replacing it atomically."""
+
+        partial_path = f"{path}.partial"
+
+        with open(partial_path, "wb") as handle:
+            handle.write(BLOOM_HEADER.pack(
+                self.size,
+                self.hashes,
+                self.capacity,
+                self.count
+            ))
+            handle.write(self.bits)
+
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BloomFilter"]:
+        """Read a filter previously written by save()."""
+
+        try:
+            with open(path, "rb") as handle:
+                header = handle.read(BLOOM_HEADER.size)
+                bits = handle.read()
+        except OSError:
+            return None
+
+        if len(header) != BLOOM_HEADER.size:
+            return None
+
+        size, hashes, capacity, count = BLOOM_HEADER.unpack(header)
+
+        if len(bits) != (size + 7) // 8:
+            return None
+
+        bloom = cls.__new__(cls)
+        bloom.size = size
+        bloom.hashes = hashes
+        bloom.capacity = capacity
+        bloom.count = count
+        bloom.bits = bytearray(bits)
+
+        return bloom
+
+
 class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
     """A CherryPy plugin for searching webserver logs."""
 
+    db_pragmas = (
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+    )
+
     def __init__(self, bus: cherrypy.process.wspbus.Bus) -> None:
         cherrypy.process.plugins.SimplePlugin.__init__(self, bus)
         self.db_path = self._path("logindex.sqlite")
         self.queue: Deque[Tuple[datetime, datetime]] = deque()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.executor_workers = 0
+        self.alerts: Optional[List[CompiledAlert]] = None
+        self.alerts_date: Optional[date] = None
+        self.alert_window = 3600
+        self.alerted: Dict[str, float] = {}
+        self.prepared: OrderedDict[Tuple[date, str], PreparedQuery] = OrderedDict()
+        self.prepared_size = 128
+        self.prepared_lock = threading.Lock()
+        self.parser = parsers.logindex_query.Parser()
+        self.partitions: Dict[int, str] = {}
+        self.partition_lock = threading.Lock()
+        self.legacy_months: Optional[Tuple[int, int]] = None
+        self.plain_partitions: Set[str] = set()
+        self.interned: Dict[str, Dict[str, int]] = {
+            column: {} for column in INTERNED_COLUMNS
+        }
+        self.interned_cache_size = 100000
+        self.archive_blocks: OrderedDict[int, Dict[int, str]] = OrderedDict()
+        self.archive_blocks_size = 16
+        self.archive_blocks_lock = threading.Lock()
+        self.offsets: Dict[str, int] = {}
+        self.follower: Optional[threading.Thread] = None
+        self.follow_stop = threading.Event()
+        self.screen: Optional[BloomFilter] = None
+        self.screen_path = self._path("logindex.bloom")
 
     def setup(self) -> None:
         """Create the database."""
@@ -39,64 +449,6 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         self._create("""
         PRAGMA journal_mode=WAL;
 
-        CREATE TABLE IF NOT EXISTS logs (
-            unix_timestamp integer,
-            datestamp,
-            hash,
-            source_file,
-            source_offset integer,
-            ip collate nocase,
-            host collate nocase,
-            uri collate nocase,
-            query collate nocase,
-            statusCode integer,
-            method collate nocase,
-            agent collate nocase,
-            agent_domain collate nocase,
-            classification collate nocase,
-            country collate nocase,
-            region collate nocase,
-            city collate nocase,
-            latitude real,
-            longitude real,
-            cookie collate nocase,
-            referrer collate nocase,
-            referrer_domain collate nocase,
-            logline,
-            UNIQUE(hash)
-        );
-
-        CREATE INDEX IF NOT EXISTS index_datestamp
-            ON logs (datestamp desc);
-        CREATE INDEX IF NOT EXISTS index_datestamp_yyyymmdd
-            ON logs(substr(datestamp, 0, 11));
-        CREATE INDEX IF NOT EXISTS index_ip
-            ON logs(ip);
-        CREATE INDEX IF NOT EXISTS index_ip_datestamp
-            ON logs (ip, datestamp);
-        CREATE INDEX IF NOT EXISTS index_host
-            ON logs(host);
-        CREATE INDEX IF NOT EXISTS index_uri
-            ON logs(uri);
-        CREATE INDEX IF NOT EXISTS index_statusCode
-            ON logs(statusCode);
-        CREATE INDEX IF NOT EXISTS index_method
-            ON logs(method);
-        CREATE INDEX IF NOT EXISTS index_agent_domain
-            ON logs(agent_domain);
-        CREATE INDEX IF NOT EXISTS index_classification
-            ON logs(classification);
-        CREATE INDEX IF NOT EXISTS index_country
-            ON logs(country);
-        CREATE INDEX IF NOT EXISTS index_city
-            ON logs(city);
-        CREATE INDEX IF NOT EXISTS index_region
-            ON logs(region);
-        CREATE INDEX IF NOT EXISTS index_cookie
-            ON logs(cookie);
-        CREATE INDEX IF NOT EXISTS index_source_file
-            ON logs(source_file);
-
         CREATE TABLE IF NOT EXISTS reverse_ip (
             ip,
             reverse_host,
@@ -112,31 +464,82 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         UPDATE reverse_ip SET updated=CURRENT_TIMESTAMP WHERE ip=new.ip;
         END;
 
-        CREATE TRIGGER IF NOT EXISTS backfill_region_after_insert
-        AFTER INSERT ON logs
-        FOR EACH ROW WHEN IFNULL(new.region, '') = ''
-        BEGIN
-        UPDATE logs SET region=(
-            SELECT region FROM logs WHERE ip=new.ip AND region <> '' LIMIT 1
-        ) WHERE rowid=new.rowid;
-        END;
-
-        CREATE TRIGGER IF NOT EXISTS backfill_city_after_insert
-        AFTER INSERT ON logs
-        FOR EACH ROW WHEN IFNULL(new.city, '') = ''
-        BEGIN
-        UPDATE logs SET city=(
-            SELECT city FROM logs WHERE ip=new.ip AND city <> '' LIMIT 1
-        ) WHERE rowid=new.rowid;
-        END;
-
         CREATE INDEX IF NOT EXISTS index_reverse_domain
             ON reverse_ip(reverse_domain);
 
+        CREATE TABLE IF NOT EXISTS ip_location (
+            ip PRIMARY KEY collate nocase,
+            region,
+            city
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS rollup_daily (
+            period,
+            dimension,
+            value,
+            hits integer,
+            earliest real,
+            latest real,
+            PRIMARY KEY (period, dimension, value)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS index_rollup_daily_value
+            ON rollup_daily(dimension, value);
+
+        CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+            source_file PRIMARY KEY,
+            source_offset integer,
+            updated DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS logline_archive (
+            source_file,
+            first_offset integer,
+            last_offset integer,
+            block blob
+        );
+
+        DROP INDEX IF EXISTS index_logline_archive_source;
+        CREATE INDEX IF NOT EXISTS index_logline_archive_range
+            ON logline_archive(source_file, first_offset, last_offset);
+
+        CREATE TABLE IF NOT EXISTS rollup_hourly (
+            period,
+            dimension,
+            value,
+            hits integer,
+            earliest real,
+            latest real,
+            PRIMARY KEY (period, dimension, value)
+        ) WITHOUT ROWID;
+
         """)
 
+        self._create("".join(
+            INTERNED_SCHEMA.format(column=column)
+            for column in INTERNED_COLUMNS
+        ))
+
+        self.load_partitions()
+
+        self.load_screen()
+
+        if not self._selectFirst("SELECT EXISTS(SELECT 1 FROM ip_location)"):
+            self.rebuild_ip_locations()
+
+        if not self._selectFirst("SELECT EXISTS(SELECT 1 FROM rollup_daily)"):
+            self.rebuild_rollups()
+
         self.parse()
 
+        follow = cherrypy.engine.publish(
+            "registry:first:value",
+            "logindex:follow"
+        )
+
+        if follow and follow.pop():
+            self.follow()
+
     def start(self) -> None:
         """Define the CherryPy messages to listen for.
 
@@ -149,12 +552,530 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         self.bus.subscribe("logindex:alert", self.alert)
         self.bus.subscribe("logindex:enqueue", self.enqueue)
         self.bus.subscribe("logindex:insert_line", self.insert_line)
+        self.bus.subscribe("logindex:insert_parsed", self.insert_parsed)
         self.bus.subscribe("logindex:append_line", self.append_line)
         self.bus.subscribe("logindex:count_lines", self.count_lines)
         self.bus.subscribe("logindex:process_queue", self.process_queue)
         self.bus.subscribe("logindex:query", self.query)
         self.bus.subscribe("logindex:query:reverse_ip", self.query_reverse_ip)
         self.bus.subscribe("logindex:count_visit_days", self.count_visit_days)
+        self.bus.subscribe("logindex:prune", self.prune)
+        self.bus.subscribe("logindex:archive", self.archive)
+        self.bus.subscribe("logindex:screen", self.maintain_screen)
+        self.bus.subscribe("logindex:archived_line", self.archived_line)
+        self.bus.subscribe("logindex:follow", self.follow)
+        self.bus.subscribe("logindex:unfollow", self.unfollow)
+        self.bus.subscribe("registry:added", self.on_registry_changed)
+        self.bus.subscribe("registry:removed", self.on_registry_changed)
+        self.bus.subscribe("registry:updated", self.on_registry_changed)
+
+    @staticmethod
+    def month_index(year: int, month: int) -> int:
+        """Count months from year zero, for ordering and id bases."""
+
+        return year * 12 + month - 1
+
+    @staticmethod
+    def partition_name(month_index: int) -> str:
+        """The name of the table that holds a month of log lines."""
+
+        year, month = divmod(month_index, 12)
+        return f"logs_{year:04d}_{month + 1:02d}"
+
+    def partition_for_line(self, logline: str) -> int:
+        """Find the month of a combined-format line by its timestamp.
+
+        Lines without a recognizable timestamp go to the current month.
+
+        """
+
+        match = LINE_MONTH_PATTERN.search(logline)
+
+        if match and match.group(1) in MONTH_ABBREVIATIONS:
+            return self.month_index(
+                int(match.group(2)),
+                MONTH_ABBREVIATIONS.index(match.group(1)) + 1
+            )
+
+        today = date.today()
+        return self.month_index(today.year, today.month)
+
+    def partition_for_id(self, rowid: int) -> str:
+        """The name of the table that holds a log line by its id."""
+
+        month_index = rowid >> PARTITION_ID_BITS
+
+        if month_index == 0:
+            return LEGACY_PARTITION
+
+        return self.partition_name(month_index)
+
+    def load_partitions(self) -> None:
+        """Find existing partitions and make sure the view is current.
+
+        A logs table from before partitioning is renamed so that it
+        can be included in the view as-is. So are partitions from
+        before interning, which store strings rather than ids.
+
+        """
+
+        rows = self._select(
+            """SELECT name, type, sql
+            FROM sqlite_master
+            WHERE name LIKE 'logs%'"""
+        )
+
+        tables = {row["name"]: row["type"] for row in rows}
+
+        self.plain_partitions = {
+            row["name"]
+            for row in rows
+            if row["type"] == "table" and "host_id" not in row["sql"]
+        }
+
+        if tables.get("logs") == "table":
+            self._create(f"ALTER TABLE logs RENAME TO {LEGACY_PARTITION}")
+            tables[LEGACY_PARTITION] = "table"
+            self.plain_partitions.discard("logs")
+            self.plain_partitions.add(LEGACY_PARTITION)
+
+        self.legacy_months = None
+        if LEGACY_PARTITION in tables:
+            row = self._selectOne(
+                f"""SELECT min(datestamp) as earliest,
+                max(datestamp) as latest
+                FROM {LEGACY_PARTITION}"""  # nosec
+            )
+
+            if row and row["earliest"]:
+                self.legacy_months = (
+                    self.month_index(
+                        int(row["earliest"][:4]), int(row["earliest"][5:7])
+                    ),
+                    self.month_index(
+                        int(row["latest"][:4]), int(row["latest"][5:7])
+                    ),
+                )
+            else:
+                self.legacy_months = (0, 0)
+
+        for name in tables:
+            match = PARTITION_NAME_PATTERN.fullmatch(name)
+            if match:
+                month_index = self.month_index(
+                    int(match.group(1)),
+                    int(match.group(2))
+                )
+                self.partitions[month_index] = name
+
+        # Region and city used to be backfilled by triggers on every
+        # insert. That now happens during parsing; see enrich().
+        self._create("".join(
+            f"""DROP TRIGGER IF EXISTS {table}_backfill_region;
+            DROP TRIGGER IF EXISTS {table}_backfill_city;"""
+            for table in self.partitions.values()
+        ) + """DROP TRIGGER IF EXISTS backfill_region_after_insert;
+        DROP TRIGGER IF EXISTS backfill_city_after_insert;""")
+
+        today = date.today()
+        current_month = self.month_index(today.year, today.month)
+
+        if current_month in self.partitions:
+            self.rebuild_view()
+        else:
+            self.ensure_partitions((current_month,))
+
+    def ensure_partitions(self, month_indexes: Iterable[int]) -> None:
+        """Create the partitions for the given months if necessary."""
+
+        if set(month_indexes) <= self.partitions.keys():
+            return
+
+        with self.partition_lock:
+            missing = set(month_indexes) - self.partitions.keys()
+
+            if not missing:
+                return
+
+            self._create("".join(
+                PARTITION_SCHEMA.format(
+                    table=self.partition_name(month_index),
+                    base=month_index << PARTITION_ID_BITS
+                )
+                for month_index in missing
+            ))
+
+            for month_index in missing:
+                self.partitions[month_index] = self.partition_name(month_index)
+
+            self.rebuild_view()
+
+    def partition_selects(
+            self,
+            first_month: int = 0,
+            last_month: int = 0
+    ) -> List[str]:
+        """SELECT statements for the partitions within a range of months.
+
+        Both ends of the range are inclusive, and 0 leaves an end open.
+
+        """
+
+        selects = []
+
+        if self.legacy_months:
+            earliest, latest = self.legacy_months
+            if (not last_month or earliest <= last_month) \
+               and (not first_month or latest >= first_month):
+                selects.append(f"SELECT rowid AS id, * FROM {LEGACY_PARTITION}")
+
+        for month_index, table in sorted(self.partitions.items()):
+            if first_month and month_index < first_month:
+                continue
+            if last_month and month_index > last_month:
+                continue
+            if table in self.plain_partitions:
+                selects.append(f"SELECT * FROM {table}")
+            else:
+                selects.append(INTERNED_SELECT_SQL.format(table=table))
+
+        return selects
+
+    def rebuild_view(self) -> None:
+        """Point the logs view at the current set of partitions."""
+
+        union = " UNION ALL ".join(self.partition_selects())
+
+        self._create(f"""
+        BEGIN;
+        DROP VIEW IF EXISTS logs;
+        CREATE VIEW logs AS {union};
+        COMMIT;
+        """)
+
+    def partition_source(self, query: str) -> str:
+        """Narrow the logs view to the partitions a query can match.
+
+        The date range of the query is widened by a day in either
+        direction to account for datestamps being in the timezone of
+        the original log rather than UTC.
+
+        """
+
+        bounds = self.parser.date_bounds(query)
+
+        if not bounds:
+            return "logs"
+
+        start, end = (
+            datetime.strptime(bound, "%Y-%m-%d-%H") + timedelta(days=offset)
+            for bound, offset in zip(bounds, (-1, 1))
+        )
+
+        selects = self.partition_selects(
+            self.month_index(start.year, start.month),
+            self.month_index(end.year, end.month)
+        )
+
+        if not selects:
+            return "(SELECT * FROM logs WHERE 0)"
+
+        return "(" + " UNION ALL ".join(selects) + ")"
+
+    @decorators.log_runtime
+    def prune(self, cutoff_months: int = 0) -> None:
+        """Drop partitions that are older than the retention period.
+
+        This is normally invoked from the maintenance plugin. The
+        retention period comes from the logindex:retention_months
+        registry key, and nothing is dropped if it is not set. Rollups
+        are not affected.
+
+        Archive blocks and interned strings that only the dropped
+        partitions referred to are deleted in the same transaction as
+        the partitions themselves.
+
+        """
+
+        if not cutoff_months:
+            cutoff_months = int(cherrypy.engine.publish(
+                "registry:first:value",
+                "logindex:retention_months",
+                default=0
+            ).pop())
+
+        if cutoff_months < 1:
+            return
+
+        today = date.today()
+        cutoff = self.month_index(today.year, today.month) - cutoff_months
+
+        with self.partition_lock:
+            doomed = [
+                self.partitions.pop(month_index)
+                for month_index in sorted(self.partitions)
+                if month_index < cutoff
+            ]
+
+            if self.legacy_months and self.legacy_months[1] < cutoff:
+                doomed.append(LEGACY_PARTITION)
+                self.legacy_months = None
+
+            if doomed:
+                self.rebuild_view()
+
+        sources = sorted({
+            row["source_file"]
+            for table in doomed
+            for row in self._select(
+                f"SELECT DISTINCT source_file FROM {table}"  # nosec
+            )
+        })
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = [
+            (f"DROP TABLE IF EXISTS {table}", ())  # nosec
+            for table in doomed
+        ]
+
+        # An archive block can only go once none of its lines are
+        # left in the partitions that remain.
+        queries.extend(
+            ("""DELETE FROM logline_archive
+            WHERE source_file=?
+            AND NOT EXISTS (
+                SELECT 1 FROM logs
+                WHERE logs.source_file=logline_archive.source_file
+                AND logs.source_offset
+                BETWEEN logline_archive.first_offset
+                AND logline_archive.last_offset
+            )""", (source,))
+            for source in sources
+        )
+
+        if doomed:
+            queries.extend(self.interned_sweep_queries())
+
+        self._batch(queries)
+
+        for table in doomed:
+            self.plain_partitions.discard(table)
+
+        # Swept strings may have been cached, and their ids can be
+        # handed out again. So can the rowids of deleted blocks.
+        for cache in self.interned.values():
+            cache.clear()
+
+        with self.archive_blocks_lock:
+            self.archive_blocks.clear()
+
+        unit = "partition" if len(doomed) == 1 else "partitions"
+
+        cherrypy.engine.publish(
+            "applog:add",
+            "logindex:prune",
+            f"{len(doomed)} {unit} dropped"
+        )
+
+    def interned_sweep_queries(self) -> List[Tuple[str, Tuple[Any, ...]]]:
+        """Queries that delete interned strings no partition refers to."""
+
+        remaining = [
+            table for table in self.partitions.values()
+            if table not in self.plain_partitions
+        ]
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = []
+
+        for column in INTERNED_COLUMNS:
+            if not remaining:
+                queries.append((f"DELETE FROM interned_{column}", ()))  # nosec
+                continue
+
+            referenced = " UNION ".join(
+                f"""SELECT {column}_id FROM {table}
+                WHERE {column}_id IS NOT NULL"""
+                for table in remaining
+            )
+
+            queries.append((
+                f"""DELETE FROM interned_{column}
+                WHERE id NOT IN ({referenced})""",  # nosec
+                ()
+            ))
+
+        return queries
+
+    @decorators.log_runtime
+    def archive(
+            self,
+            days: int = 0,
+            batch_size: int = 50000,
+            block_lines: int = 1000
+    ) -> None:
+        """Move the raw text of older parsed lines to compressed blocks.
+
+        Once a line has been parsed its original text is only needed
+        for display. Lines older than the given number of days are
+        grouped by source file into blocks of consecutive offsets,
+        compressed, and cleared from their partitions. Their text
+        remains available through archived_line().
+
+        This is normally invoked from the maintenance plugin. The age
+        comes from the logindex:archive_days registry key, and nothing
+        is archived if it is not set.
+
+        """
+
+        if not days:
+            days = int(cherrypy.engine.publish(
+                "registry:first:value",
+                "logindex:archive_days",
+                default=0
+            ).pop())
+
+        if days < 1:
+            return
+
+        cutoff = time.time() - days * 86400
+
+        records = self._select(
+            """SELECT id, source_file, source_offset, logline
+            FROM logs
+            WHERE logline IS NOT NULL
+            AND ip IS NOT NULL
+            AND unix_timestamp < ?
+            LIMIT ?""",
+            (cutoff, batch_size)
+        )
+
+        if not records:
+            return
+
+        sources: Dict[str, List[Tuple[int, int, str]]] = {}
+        for record in records:
+            sources.setdefault(record["source_file"], []).append((
+                record["source_offset"],
+                record["id"],
+                record["logline"]
+            ))
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = []
+
+        for source_file, lines in sources.items():
+            lines.sort()
+
+            for i in range(0, len(lines), block_lines):
+                block = lines[i:i + block_lines]
+
+                queries.append((
+                    """INSERT INTO logline_archive
+                    (source_file, first_offset, last_offset, block)
+                    VALUES (?, ?, ?, ?)""",
+                    (
+                        source_file,
+                        block[0][0],
+                        block[-1][0],
+                        self.pack_block(
+                            (offset, logline) for offset, _, logline in block
+                        )
+                    )
+                ))
+
+        queries.extend(sorted(
+            (
+                f"""UPDATE {self.partition_for_id(record['id'])}
+                SET logline=NULL
+                WHERE rowid=?""",  # nosec
+                (record["id"],)
+            )
+            for record in records
+        ))
+
+        self._batch(queries)
+
+        unit = "line" if len(records) == 1 else "lines"
+
+        cherrypy.engine.publish(
+            "applog:add",
+            "logindex:archive",
+            f"{len(records)} {unit} archived"
+        )
+
+        if len(records) == batch_size:
+            cherrypy.engine.publish("scheduler:add", 5, "logindex:archive")
+
+    @staticmethod
+    def pack_block(lines: Iterable[Tuple[int, str]]) -> bytes:
+        """Compress log lines along with their offsets.
+
+        Each line is prefixed by its offset and a tab. Lines never
+        contain newlines other than their own trailing one, so the
+        lines can be joined by newlines and split apart again.
+
+        """
+
+        return zlib.compress("\n".join(
+            str(offset) + "\t" + logline.rstrip("\r\n")
+            for offset, logline in lines
+        ).encode("utf-8"))
+
+    @staticmethod
+    def unpack_block(block: bytes) -> Dict[int, str]:
+        """Decompress a block from pack_block() into lines by offset."""
+
+        lines = {}
+
+        for line in zlib.decompress(block).decode("utf-8").split("\n"):
+            offset, logline = line.split("\t", 1)
+            lines[int(offset)] = logline
+
+        return lines
+
+    def archived_line(self, source_file: str, source_offset: int) -> str:
+        """Look up the text of a line that has been archived.
+
+        Only the blocks whose offset range spans the line are read.
+        Decompressed blocks are kept for a while, since lines that are
+        displayed together tend to come from the same block. The
+        cache is shared by request threads, so it is only touched
+        under a lock.
+
+        """
+
+        rowids = self._select(
+            """SELECT rowid
+            FROM logline_archive
+            WHERE source_file=?
+            AND first_offset <= ?
+            AND last_offset >= ?
+            ORDER BY first_offset DESC""",
+            (source_file, source_offset, source_offset)
+        )
+
+        for row in rowids:
+            rowid = row["rowid"]
+
+            with self.archive_blocks_lock:
+                lines = self.archive_blocks.get(rowid)
+                if lines is not None:
+                    self.archive_blocks.move_to_end(rowid)
+
+            if lines is None:
+                block = self._selectFirst(
+                    "SELECT block FROM logline_archive WHERE rowid=?",
+                    (rowid,)
+                )
+                lines = self.unpack_block(block)
+
+                with self.archive_blocks_lock:
+                    self.archive_blocks[rowid] = lines
+                    while len(self.archive_blocks) > self.archive_blocks_size:
+                        self.archive_blocks.popitem(last=False)
+
+            if source_offset in lines:
+                return lines[source_offset]
+
+        return ""
 
     @staticmethod
     def get_root() -> str:
@@ -189,21 +1110,52 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         Tracking the byte offset of each line within a file makes it
         possible to skip over previously-processed lines. Always
         starting from the beginning would take longer and longer as the
-        size of the log file grew, and waste time."""
+        size of the log file grew, and waste time.
+
+        Offsets are kept in memory and checkpointed to the database
+        after each ingestion. Scanning the logs themselves is only
+        necessary for files that were ingested before checkpointing.
+
+        """
 
         source = self.file_path_to_source(path)
 
+        if source in self.offsets:
+            return self.offsets[source]
+
         row = self._selectOne(
-            """SELECT COALESCE(MAX(source_offset), 0) as offset
-            FROM logs
+            """SELECT source_offset as offset
+            FROM ingest_checkpoint
             WHERE source_file=?""",
             (source,)
         )
 
-        if row:
-            return cast(int, row["offset"])
+        if not row:
+            row = self._selectOne(
+                """SELECT COALESCE(MAX(source_offset), 0) as offset
+                FROM logs
+                WHERE source_file=?""",
+                (source,)
+            )
+
+        offset = cast(int, row["offset"]) if row else 0
+        self.offsets[source] = offset
+
+        return offset
+
+    def checkpoint(self, source: str, offset: int) -> None:
+        """Record the position of the last ingested line of a file."""
+
+        self.offsets[source] = offset
 
-        return 0
+        self._execute(
+            """INSERT INTO ingest_checkpoint (source_file, source_offset)
+            VALUES (?, ?)
+            ON CONFLICT (source_file) DO UPDATE SET
+            source_offset=excluded.source_offset,
+            updated=CURRENT_TIMESTAMP""",
+            (source, offset)
+        )
 
     def file_for_date(
             self,
@@ -308,65 +1260,302 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         self.process_queue()
 
     @decorators.log_runtime
-    def ingest_file(self, file_path: str, batch_size: int = 100) -> None:
-        """Read new lines from a log file in batches."""
+    def ingest_file(self, file_path: str, batch_size: int = 10000) -> int:
+        """Read new lines from a log file in batches.
 
-        batch = []
-        line_count = 0
+        The file is memory-mapped and scanned for line boundaries as
+        bytes, so the offset of each line falls out of the scan rather
+        than requiring a tell() per line. Hashing happens in-process.
 
-        max_offset = self.last_known_offset(file_path)
+        Only newline-terminated lines are ingested. A partially-written
+        final line is left for the next pass, by which point it will
+        have been completed.
 
-        with open(file_path, "r", encoding="utf-8") as file_handle:
+        """
 
-            # When indexing a previously indexed log file, max_offset
-            # is the position of the last line that was added to the
-            # database. Since it has already been seen, it can be
-            # skipped. The next line is the first new line.
-            if max_offset > 0:
-                file_handle.seek(max_offset)
-                file_handle.readline()
+        line_count = self.ingest_new_lines(file_path, batch_size)
 
-            while True:
-                offset = file_handle.tell()
-                line = file_handle.readline()
+        unit = "line" if line_count == 1 else "lines"
 
-                if not line:
-                    break
+        cherrypy.engine.publish(
+            "applog:add",
+            "logindex",
+            f"{line_count} {unit} ingested from {file_path}"
+        )
 
-                line_hash = cherrypy.engine.publish(
-                    "hasher:value",
-                    line,
-                    algorithm="md5"
-                ).pop()
+        return line_count
 
-                values = (
-                    self.file_path_to_source(file_path),
-                    offset,
-                    line_hash,
-                    line
-                )
+    def ingest_new_lines(self, file_path: str, batch_size: int = 10000) -> int:
+        """Insert the lines of a file that follow its last known offset.
+
+        This is the quiet part of ingest_file(), shared with follow
+        mode. A file that has shrunk since it was last seen is assumed
+        to have been replaced and is read from the start.
 
-                batch.append(values)
-                if len(batch) > batch_size:
+        """
+
+        line_count = 0
+        last_offset = -1
+        source = self.file_path_to_source(file_path)
+        max_offset = self.last_known_offset(file_path)
+
+        with open(file_path, "rb") as file_handle:
+            size = os.fstat(file_handle.fileno()).st_size
+
+            if size == 0:
+                return 0
+
+            if max_offset >= size:
+                max_offset = 0
+
+            with mmap.mmap(
+                    file_handle.fileno(),
+                    0,
+                    access=mmap.ACCESS_READ
+            ) as view:
+                for batch in self.read_batches(
+                        view, source, max_offset, batch_size
+                ):
                     self.insert_line(batch)
                     line_count += len(batch)
-                    batch = []
+                    last_offset = batch[-1][1]
 
-        if batch:
-            self.insert_line(batch)
-            line_count += len(batch)
+        if last_offset > -1:
+            self.checkpoint(source, last_offset)
 
-        unit = "line" if line_count == 1 else "lines"
+        return line_count
+
+    def follow(self, poll_interval: float = 1.0) -> None:
+        """Ingest the current day's log file as it is written to.
+
+        This runs in its own thread until unfollow() is called or the
+        engine stops. It is started during setup if the
+        logindex:follow registry key is set.
+
+        """
+
+        if self.follower and self.follower.is_alive():
+            return
+
+        self.follow_stop.clear()
+
+        self.follower = threading.Thread(
+            target=self.follow_loop,
+            args=(poll_interval,),
+            name="LogindexFollower",
+            daemon=True
+        )
+
+        self.follower.start()
 
         cherrypy.engine.publish(
             "applog:add",
             "logindex",
-            f"{line_count} {unit} ingested from {file_path}"
+            "Following the current log file"
         )
 
+    def unfollow(self) -> None:
+        """Stop following the current day's log file."""
+
+        self.follow_stop.set()
+
+        if self.follower:
+            self.follower.join()
+            self.follower = None
+
+    def follow_loop(self, poll_interval: float) -> None:
+        """Watch for writes to the current day's log file and ingest
+        new lines as they appear.
+
+        Writes are detected with inotify where it is available and by
+        checking the size of the file otherwise. Either way the file
+        and the current date are rechecked every poll interval. That
+        moves the loop on to the next day's file, ingesting the
+        remainder of the previous day's file on the way, and re-arms
+        the watch if the file was deleted or replaced, since its old
+        watch stops firing.
+
+        A pass that fails is logged and retried at the next interval
+        rather than ending the thread.
+
+        """
+
+        current: Optional[str] = None
+        watch = -1
+        watched_inode: Optional[int] = None
+        size = -1
+
+        try:
+            while not self.follow_stop.is_set():
+                try:
+                    now = cherrypy.engine.publish(
+                        "clock:now",
+                        local=True
+                    ).pop()
+                    path = self.file_for_date(now)
+
+                    if path != current:
+                        if current:
+                            self.ingest_new_lines(current)
+
+                        current = path
+                        watched_inode = None
+
+                    stat = None
+                    if current:
+                        try:
+                            stat = os.stat(current)
+                        except FileNotFoundError:
+                            pass
+
+                    inode = stat.st_ino if stat else None
+
+                    if inode != watched_inode:
+                        if watch > -1:
+                            os.close(watch)
+
+                        watch = self.watch(current) if current and stat else -1
+                        watched_inode = inode
+                        size = -1
+
+                    if current and stat and stat.st_size != size:
+                        size = stat.st_size
+                        if self.ingest_new_lines(current):
+                            cherrypy.engine.publish(
+                                "scheduler:add",
+                                1,
+                                "logindex:parse"
+                            )
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    size = -1
+                    cherrypy.engine.publish(
+                        "applog:add",
+                        "logindex:error",
+                        f"Follow pass failed: {err!r}"
+                    )
+
+                self.wait_for_write(watch, poll_interval)
+        finally:
+            if watch > -1:
+                os.close(watch)
+            mixins.pool.discard(self.db_path)
+
+    @staticmethod
+    def watch(path: str) -> int:
+        """Get an inotify descriptor that becomes readable when a file
+        is written to.
+
+        Returns -1 if inotify is not available, in which case the
+        caller should fall back to polling.
+
+        """
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError):
+            return -1
+
+        if descriptor < 0:
+            return -1
+
+        if libc.inotify_add_watch(
+                descriptor,
+                os.fsencode(path),
+                INOTIFY_EVENTS
+        ) < 0:
+            os.close(descriptor)
+            return -1
+
+        return cast(int, descriptor)
+
+    def wait_for_write(self, watch: int, timeout: float) -> bool:
+        """Block until a watched file is written to or the timeout
+        passes, and report whether it might have changed.
+
+        Without a watch there is no way to know, so the answer is
+        always yes.
+
+        """
+
+        if watch < 0:
+            self.follow_stop.wait(timeout)
+            return True
+
+        readable, _, _ = select.select([watch], [], [], timeout)
+
+        if not readable:
+            return False
+
+        try:
+            while os.read(watch, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        return True
+
+    @staticmethod
+    def read_batches(
+            view: Union[mmap.mmap, bytes],
+            source: str,
+            max_offset: int = 0,
+            batch_size: int = 10000
+    ) -> Iterator[List[Tuple[str, int, str, str]]]:
+        """Split a byte buffer into batches of insertable log lines.
+
+        When indexing a previously indexed log file, max_offset is the
+        position of the last line that was added to the database.
+        Since it has already been seen, it is skipped. The line after
+        it is the first new line.
+
+        Hashes are calculated over the raw bytes of the line,
+        including its newline, which matches the hashes of lines
+        ingested by earlier versions of this method.
+
+        """
+
+        offset = 0
+        if max_offset > 0:
+            offset = view.find(b"\n", max_offset) + 1
+            if offset == 0:
+                return
+
+        batch: List[Tuple[str, int, str, str]] = []
+
+        while True:
+            end = view.find(b"\n", offset) + 1
+
+            if end == 0:
+                break
+
+            line = view[offset:end]
+
+            batch.append((
+                source,
+                offset,
+                hashlib.md5(line, usedforsecurity=False).hexdigest(),
+                line.decode("utf-8", errors="replace")
+            ))
+
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+            offset = end
+
+        if batch:
+            yield batch
+
     @decorators.log_runtime
     def reversal(self, batch_size: int = 50) -> None:
-        """Store the reverse hostname of an IP address."""
+        """Store the reverse hostname of an IP address.
+
+        Addresses whose lookups timed out are missing from the
+        reversals and stay unreversed for a later pass. If none of
+        the batch could be looked up, that pass is put off for a
+        while rather than retried right away.
+        """
 
         records = self._select(
             """SELECT 0 as id, count(*) as value
@@ -383,203 +1572,886 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
             (batch_size,)
         )
 
-        batch: List[Tuple[str, Sequence[Any]]] = []
-
         unreversed_ips = records[0]["value"]
 
         if unreversed_ips == 0:
             return
 
-        for record in records[1:]:
-            facts = cherrypy.engine.publish(
-                "ip:reverse",
-                record["value"]
-            ).pop()
+        rowids = {record["value"]: record["id"] for record in records[1:]}
 
-            batch.append((
-                """UPDATE reverse_ip
-                SET reverse_host=?, reverse_domain=?
-                WHERE rowid=?""",
-                (
-                    facts.get("reverse_host"),
-                    facts.get("reverse_domain"),
-                    record["id"]
-                )
-            ))
+        reversals = cherrypy.engine.publish(
+            "ip:reverse:many",
+            rowids.keys()
+        ).pop()
 
-        self._multi(batch)
+        self._batch(
+            ("""UPDATE reverse_ip
+            SET reverse_host=?, reverse_domain=?
+            WHERE rowid=?""",
+             (
+                 facts["reverse_host"],
+                 facts["reverse_domain"],
+                 rowids[ip_address]
+             ))
+            for ip_address, facts in reversals.items()
+        )
 
-        cherrypy.engine.publish("scheduler:add", 5, "logindex:reversal")
+        cherrypy.engine.publish(
+            "scheduler:add",
+            5 if reversals else 300,
+            "logindex:reversal"
+        )
 
     @decorators.log_runtime
-    def parse(self, batch_size: int = 100) -> None:
+    def parse(
+            self,
+            batch_size: int = 50000,
+            workers: int = 0,
+            chunk_size: int = 2000
+    ) -> None:
         """Parse log lines into fields
 
         The log line is initially inserted to the database as a single
         string. This is where the string gets broken into its
         constituent pieces.
 
-        """
+        Unparsed lines are split into chunks and fanned out to a pool
+        of worker processes. Results are enriched with geographic
+        facts as they come back and handed to a writer thread that
+        applies them in bulk, so that parsing and writing overlap.
 
-        update_sql = """UPDATE logs SET unix_timestamp=?, datestamp=?, ip=?,
-        host=?, uri=?, query=?, statusCode=?, method=?, agent=?,
-        agent_domain=?, classification=?, country=?, region=?, city=?,
-        latitude=?, longitude=?, cookie=?, referrer=?,
-        referrer_domain=?  WHERE rowid=?"""
+        A workers value of 0 means one worker per CPU. Batches no
+        larger than a single chunk are parsed in-process since the
+        overhead of the pool would outweigh its benefit.
 
-        records = self._select(
-            """SELECT 0 as id, count(*) as value
-            FROM logs
-            WHERE ip IS NULL
-            UNION
-            SELECT rowid as id, logline as value
-            FROM logs
-            WHERE ip IS NULL
-            LIMIT ?""",
-            (batch_size,)
+        """
+
+        unparsed_count = self._selectFirst(
+            "SELECT count(*) FROM logs WHERE ip IS NULL"
         )
 
-        if records[0]["value"] == 0:
+        if not unparsed_count:
             cherrypy.engine.publish("scheduler:add", 1, "logindex:reversal")
             return
 
-        parser = parsers.combined_log.Parser()
-
-        batch: List[Tuple[str, Sequence[Any]]] = []
-        ips = set()
-        cache: Dict[str, defaultdict] = {
-            "ip": defaultdict(),
-            "agent": defaultdict()
-        }
-
-        for record in records[1:]:
-            fields = parser.parse(record["value"])
-
-            ip_address = fields["ip"]
-
-            ips.add(ip_address)
-
-            if ip_address not in cache["ip"]:
-                cache["ip"][ip_address] = cherrypy.engine.publish(
-                    "ip:facts", ip_address
-                ).pop()
-
-            geo = cache["ip"][ip_address]["geo"]
-
-            fields["country"] = fields.get("country", geo["country_code"])
-            fields["region"] = fields.get("region", geo["region_code"])
-            fields["city"] = fields.get("city", geo["city"])
-            fields["latitude"] = fields.get("latitude", geo["latitude"])
-            fields["longitude"] = fields.get("latitude", geo["longitude"])
-
-            agent = fields.get("agent", "")
-            if agent in cache["agent"]:
-                fields["agent_domain"] = cache["agent"][agent]["agent_domain"]
-            elif agent:
-                agent_url_matches = re.search(
-                    r"https?://(www\.)?(.*?)[/; ]",
-                    agent
-                )
+        records = [
+            (row["id"], row["logline"])
+            for row in self._select(
+                """SELECT id, logline
+                FROM logs
+                WHERE ip IS NULL
+                LIMIT ?""",
+                (batch_size,)
+            )
+        ]
 
-                if agent_url_matches:
-                    fields["agent_domain"] = agent_url_matches.group(2).lower()
+        # Sorting here is cheaper than having the view merge its
+        # partitions by id.
+        records.sort()
 
-                cache["agent"][agent] = {
-                    "agent_domain": fields.get("agent_domain"),
-                }
+        chunks = [
+            records[i:i + chunk_size]
+            for i in range(0, len(records), chunk_size)
+        ]
 
-            values = (
-                fields.get("unix_timestamp"),
-                fields.get("datestamp"),
-                fields.get("ip"),
-                fields.get("host"),
-                fields.get("uri"),
-                fields.get("query"),
-                fields.get("statusCode"),
-                fields.get("method"),
-                fields.get("agent"),
-                fields.get("agent_domain"),
-                fields.get("classification"),
-                fields.get("country"),
-                fields.get("region"),
-                fields.get("city"),
-                fields.get("latitude"),
-                fields.get("longitude"),
-                fields.get("cookie"),
-                fields.get("referrer"),
-                fields.get("referrer_domain"),
-                record["id"]
+        if len(chunks) > 1:
+            results = self.get_executor(workers).map(
+                self.parse_chunk,
+                chunks
             )
+        else:
+            results = map(self.parse_chunk, chunks)
+
+        updates: queue.Queue = queue.Queue(maxsize=8)
+        writer = threading.Thread(
+            target=self.write_parsed,
+            args=(updates,),
+            name="LogindexWriter"
+        )
+        writer.start()
 
-            batch.append((update_sql, values))
-            if len(batch) > batch_size:
-                self._multi(batch)
-                batch = []
+        ips: Set[str] = set()
+        ip_cache: Dict[str, Any] = {}
 
-        if batch:
-            self._multi(batch)
+        try:
+            for parsed_chunk in results:
+                unseen = {
+                    fields["ip"] for _, fields in parsed_chunk
+                } - ips
+
+                if unseen:
+                    ip_cache.update(cherrypy.engine.publish(
+                        "ip:facts:many", unseen
+                    ).pop())
+                    ips.update(unseen)
+
+                values = [
+                    self.parsed_values(
+                        rowid,
+                        fields,
+                        ip_cache[fields["ip"]]["geo"]
+                    )
+                    for rowid, fields in parsed_chunk
+                ]
+                updates.put(values)
+        except BrokenProcessPool as err:
+            self.executor = None
+            cherrypy.engine.publish(
+                "applog:add",
+                "logindex:error",
+                f"Parser pool failed: {err}"
+            )
+        finally:
+            updates.put(None)
+            writer.join()
 
-        self._multi(
+        self._batch(
             [("""INSERT OR IGNORE INTO reverse_ip (ip) VALUES (?)""",
               (ip,))
              for ip in ips]
         )
 
+        remaining = max(unparsed_count - len(records), 0)
+
         cherrypy.engine.publish(
-            "scheduler:add",
-            1,
-            "logindex:parse"
+            "applog:add",
+            "logindex",
+            f"{len(records)} lines parsed, {remaining} remaining"
         )
 
         cherrypy.engine.publish(
             "scheduler:add",
             1,
-            "logindex:alert",
-            records[1]["id"],
-            len(records)
+            "logindex:parse"
+        )
+
+        # Ids jump between partitions, so each partition gets its own
+        # range to keep alerting from rescanning the gap.
+        first_ids: Dict[int, int] = {}
+        last_ids: Dict[int, int] = {}
+
+        for rowid, _ in records:
+            month_index = rowid >> PARTITION_ID_BITS
+            first_ids.setdefault(month_index, rowid)
+            last_ids[month_index] = rowid
+
+        for month_index, first_id in first_ids.items():
+            cherrypy.engine.publish(
+                "scheduler:add",
+                1,
+                "logindex:alert",
+                first_id,
+                last_ids[month_index] - first_id
+            )
+
+    def get_executor(self, workers: int = 0) -> ProcessPoolExecutor:
+        """Start the parser worker pool or return the running one.
+
+        Workers are started by a fork server rather than by forking
+        the multi-threaded server process directly. A running pool of
+        a different size is shut down and replaced.
+
+        """
+
+        max_workers = workers or os.cpu_count() or 1
+
+        if self.executor and self.executor_workers != max_workers:
+            self.executor.shutdown()
+            self.executor = None
+
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+            self.executor_workers = max_workers
+
+        return self.executor
+
+    def stop(self) -> None:
+        """Shut down the parser worker pool, stop following, and save
+        the hash screen."""
+
+        self.unfollow()
+        self.save_screen()
+
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    @staticmethod
+    def parse_chunk(
+            records: List[Tuple[int, str]]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Parse a list of log lines into fields.
+
+        This runs in a worker process, so it must not depend on the
+        CherryPy bus.
+
+        """
+
+        parser = parsers.combined_log.FastParser()
+        result = []
+
+        for rowid, logline in records:
+            fields = parser.parse(logline)
+
+            agent_domain, classification = Plugin.agent_facts(
+                fields.get("agent") or ""
+            )
+
+            if agent_domain:
+                fields["agent_domain"] = agent_domain
+
+            if classification:
+                fields["classification"] = classification
+
+            result.append((rowid, fields))
+
+        return result
+
+    @staticmethod
+    @functools.lru_cache(maxsize=20000)
+    def agent_facts(agent: str) -> Tuple[Optional[str], Optional[str]]:
+        """The domain mentioned by a user agent and its classification.
+
+        Agents repeat heavily from line to line, so results are
+        memoized. Within a worker process the memo outlasts the chunk.
+
+        Every classification pattern is tried in a single pass, and
+        the one with the highest precedence wins.
+
+        """
+
+        agent_domain = None
+        agent_url_matches = AGENT_URL_PATTERN.search(agent)
+        if agent_url_matches:
+            agent_domain = agent_url_matches.group(2).lower()
+
+        found = {
+            match.lastgroup
+            for match in AGENT_CLASSIFICATION_PATTERN.finditer(agent)
+        }
+
+        classification = next(
+            (name for name, _ in AGENT_CLASSIFICATIONS if name in found),
+            None
+        )
+
+        return (agent_domain, classification)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=20000)
+    def referrer_domain(referrer: str) -> Optional[str]:
+        """The domain of a referrer URL."""
+
+        return Url(referrer).domain
+
+    @staticmethod
+    def parsed_values(
+            rowid: int,
+            fields: Dict[str, Any],
+            geo: Dict[str, Any]
+    ) -> Tuple[Any, ...]:
+        """Arrange parsed fields as parameters to PARSED_UPDATE_SQL."""
+
+        return (
+            fields.get("unix_timestamp"),
+            fields.get("datestamp"),
+            fields.get("ip"),
+            fields.get("host"),
+            fields.get("uri"),
+            fields.get("query"),
+            fields.get("statusCode"),
+            fields.get("method"),
+            fields.get("agent"),
+            fields.get("agent_domain"),
+            fields.get("classification"),
+            fields.get("country", geo["country_code"]),
+            fields.get("region", geo["region_code"]),
+            fields.get("city", geo["city"]),
+            fields.get("latitude", geo["latitude"]),
+            fields.get("longitude", geo["longitude"]),
+            fields.get("cookie"),
+            fields.get("referrer"),
+            fields.get("referrer_domain"),
+            rowid
+        )
+
+    def write_parsed(self, updates: queue.Queue) -> None:
+        """Apply parsed values to the database as they arrive.
+
+        This runs in its own thread. Its pooled connection is
+        discarded on the way out since the thread won't be back.
+
+        A batch that fails to write is logged and skipped rather than
+        ending the thread, since the producer would otherwise block
+        forever on the full queue. Its lines remain unparsed and are
+        retried by the next parse.
+
+        """
+
+        try:
+            while True:
+                values = updates.get()
+
+                if values is None:
+                    break
+
+                try:
+                    self.write_parsed_batch(values)
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    cherrypy.engine.publish(
+                        "applog:add",
+                        "logindex:error",
+                        f"Parsed batch not written: {err!r}"
+                    )
+        finally:
+            mixins.pool.discard(self.db_path)
+
+    def write_parsed_batch(self, values: List[Tuple[Any, ...]]) -> None:
+        """Apply one batch of parsed values to the database."""
+
+        values, locations = self.enrich(values)
+
+        queries = []
+        for value, interned_value in zip(values, self.intern(values)):
+            table = self.partition_for_id(value[-1])
+
+            if table in self.plain_partitions:
+                queries.append(
+                    (PARSED_UPDATE_SQL.format(table=table), value)
+                )
+            else:
+                queries.append(
+                    (INTERNED_UPDATE_SQL.format(table=table), interned_value)
+                )
+
+        self._batch(
+            queries
+            + locations
+            + self.rollup_queries(values)
+        )
+
+    def intern(
+            self,
+            values: List[Tuple[Any, ...]]
+    ) -> List[Tuple[Any, ...]]:
+        """Swap the strings in interned columns for their lookup ids.
+
+        The values are parameters to PARSED_UPDATE_SQL, and the return
+        value is the equivalent parameters to INTERNED_UPDATE_SQL.
+        Strings are resolved through an in-memory cache, so the lookup
+        tables are only consulted for strings new to this process.
+
+        """
+
+        indexes = tuple(
+            (column, PARSED_COLUMNS.index(column))
+            for column in INTERNED_COLUMNS
+        )
+
+        for column, index in indexes:
+            cache = self.interned[column]
+
+            if len(cache) > self.interned_cache_size:
+                cache.clear()
+
+            unseen = {
+                value[index] for value in values
+                if value[index] is not None
+            } - cache.keys()
+
+            if unseen:
+                self.lookup_interned(column, unseen)
+
+        interned = []
+        for value in values:
+            swapped = list(value)
+            for column, index in indexes:
+                if value[index] is not None:
+                    swapped[index] = self.interned[column].get(value[index])
+            interned.append(tuple(swapped))
+
+        return interned
+
+    def lookup_interned(self, column: str, strings: Iterable[str]) -> None:
+        """Add strings to a lookup table and cache their ids.
+
+        Strings already in the table are left as they are.
+
+        """
+
+        table = f"interned_{column}"
+        strings = list(strings)
+
+        self._batch(
+            (f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", (string,))
+            for string in strings
+        )
+
+        for i in range(0, len(strings), 500):
+            chunk = strings[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+
+            self.interned[column].update(
+                (row["value"], row["id"])
+                for row in self._select(
+                    f"""SELECT id, value
+                    FROM {table}
+                    WHERE value COLLATE BINARY IN ({placeholders})""",  # nosec
+                    chunk
+                )
+            )
+
+    def enrich(
+            self,
+            values: List[Tuple[Any, ...]]
+    ) -> Tuple[List[Tuple[Any, ...]], List[Tuple[str, Tuple[Any, ...]]]]:
+        """Fill in missing regions and cities from other sightings of
+        the same IP.
+
+        Locations found in the batch are combined with those already
+        in the ip_location table, which is looked up once for the
+        batch as a whole. The return value is the updated parameters
+        for PARSED_UPDATE_SQL along with upserts for ip_location.
+
+        """
+
+        ip_index = PARSED_COLUMNS.index("ip")
+        region_index = PARSED_COLUMNS.index("region")
+        city_index = PARSED_COLUMNS.index("city")
+
+        locations: Dict[str, List[Any]] = {}
+
+        for value in values:
+            if not value[ip_index]:
+                continue
+
+            location = locations.setdefault(value[ip_index], ["", ""])
+            location[0] = location[0] or value[region_index] or ""
+            location[1] = location[1] or value[city_index] or ""
+
+        incomplete = tuple(
+            ip for ip, location in locations.items()
+            if not all(location)
+        )
+
+        if incomplete:
+            placeholders = ", ".join("?" * len(incomplete))
+
+            for row in self._select(
+                f"""SELECT ip, region, city
+                FROM ip_location
+                WHERE ip IN ({placeholders})""",  # nosec
+                incomplete
+            ):
+                location = locations[row["ip"]]
+                location[0] = location[0] or row["region"] or ""
+                location[1] = location[1] or row["city"] or ""
+
+        enriched = []
+        for value in values:
+            if value[ip_index] and not (
+                    value[region_index] and value[city_index]
+            ):
+                region, city = locations[value[ip_index]]
+                filled = list(value)
+                filled[region_index] = value[region_index] or region
+                filled[city_index] = value[city_index] or city
+                value = tuple(filled)
+
+            enriched.append(value)
+
+        upserts = [
+            (IP_LOCATION_UPSERT_SQL, (ip, region, city))
+            for ip, (region, city) in locations.items()
+            if region or city
+        ]
+
+        return (enriched, upserts)
+
+    @decorators.log_runtime
+    def rebuild_ip_locations(self) -> None:
+        """Populate the ip_location table from previously-parsed lines."""
+
+        self._execute(
+            """INSERT OR IGNORE INTO ip_location (ip, region, city)
+            SELECT ip, max(NULLIF(region, '')), max(NULLIF(city, ''))
+            FROM logs
+            WHERE ip IS NOT NULL
+            AND (IFNULL(region, '') <> '' OR IFNULL(city, '') <> '')
+            GROUP BY ip"""
         )
 
     def insert_line(
             self,
             records: List[Tuple[str, int, str, str]]
-    ) -> None:
+    ) -> int:
         """Write a batch of log lines to the database.
 
         This is the initial insert, where the line is added in its
-        entirety. Parsing occurs at the next stage of processing."""
+        entirety. Parsing occurs at the next stage of processing.
+
+        Each line goes to the partition for the month of its
+        timestamp. Duplicates are screened by hash within a partition,
+        which is sufficient since a line always maps to the same month,
+        and within the legacy table for the months it covers.
+
+        Hashes are added to a Bloom filter on the way in. Lines it has
+        never seen go straight to the insert. The rest are confirmed
+        with a single lookup per partition and dropped if they are
+        already stored, so that re-ingesting an overlapping range
+        doesn't cost a failed insert per line.
+
+        Returns the number of lines that were actually inserted, which
+        excludes lines that were already in the database."""
 
         if not records:
-            return
+            return 0
 
-        sql = """INSERT OR IGNORE INTO logs
-        (source_file, source_offset, hash, logline)
-        VALUES (?, ?, ?, ?)"""
+        months = [self.partition_for_line(record[3]) for record in records]
 
-        queries = [
-            (sql, (record[0], record[1], record[2], record[3]))
-            for record in records
-        ]
+        self.ensure_partitions(set(months))
+
+        stored: Set[str] = set()
+
+        if self.screen or self.legacy_months:
+            stored = self.screen_hashes(
+                months,
+                [record[2] for record in records]
+            )
+
+        queries = sorted(
+            (
+                f"""INSERT OR IGNORE INTO {self.partitions[month]}
+                (source_file, source_offset, hash, logline)
+                VALUES (?, ?, ?, ?)""",  # nosec
+                (record[0], record[1], record[2], record[3])
+            )
+            for month, record in zip(months, records)
+            if record[2] not in stored
+        )
+
+        if not queries:
+            return 0
+
+        return sum(self._batch(queries).values())
+
+    def insert_parsed(
+            self,
+            records: List[Tuple[str, int, str, str, Dict[str, Any]]]
+    ) -> int:
+        """Write a batch of log lines whose fields are already known.
+
+        This is the counterpart to insert_line() for structured
+        sources such as AppEngine request logs. Each record carries
+        the same four values plus a dict of fields keyed like the
+        output of the combined log parser, and the line is stored
+        whole so that it skips the parse stage.
+
+        Everything parse() does for a line happens here instead: the
+        fields are completed with agent and referrer facts and with
+        geographic facts for the IP, rollups are tallied, and alerts
+        are scheduled for the new rows. Since rollups must only count
+        lines that are actually inserted, every line is checked
+        against the database first rather than trusting the Bloom
+        filter, and repeats within the batch are dropped.
+
+        Returns the number of lines that were inserted."""
+
+        if not records:
+            return 0
+
+        months = [self.partition_for_line(record[3]) for record in records]
+
+        self.ensure_partitions(set(months))
+
+        stored = self.screen_hashes(
+            months,
+            [record[2] for record in records],
+            confirm=True
+        )
+
+        fresh = []
+        for month, record in zip(months, records):
+            if record[2] in stored:
+                continue
+            stored.add(record[2])
+            fresh.append((self.partitions[month], record))
+
+        if not fresh:
+            return 0
+
+        ips: Set[str] = {
+            record[4]["ip"] for _, record in fresh
+            if record[4].get("ip")
+        }
+
+        ip_facts: Dict[str, Dict[str, Any]] = {}
+        if ips:
+            ip_facts = cherrypy.engine.publish("ip:facts:many", ips).pop()
+
+        no_geo = {
+            "country_code": None,
+            "region_code": None,
+            "city": None,
+            "latitude": None,
+            "longitude": None,
+        }
+
+        values = []
+        for _, record in fresh:
+            fields = record[4]
+
+            fields["agent_domain"], fields["classification"] = \
+                self.agent_facts(fields.get("agent") or "")
+
+            fields["referrer_domain"] = None
+            if fields.get("referrer"):
+                fields["referrer_domain"] = self.referrer_domain(
+                    fields["referrer"]
+                )
+
+            facts = ip_facts.get(fields.get("ip") or "")
+
+            # The trailing rowid is unused since the row doesn't exist
+            # yet.
+            values.append(self.parsed_values(
+                0,
+                fields,
+                facts["geo"] if facts else no_geo
+            ))
+
+        values, locations = self.enrich(values)
+
+        queries = []
+        for (table, record), value, interned_value in zip(
+                fresh, values, self.intern(values)
+        ):
+            if table in self.plain_partitions:
+                queries.append((
+                    PARSED_INSERT_SQL.format(table=table),
+                    record[:4] + value[:-1]
+                ))
+            else:
+                queries.append((
+                    INTERNED_INSERT_SQL.format(table=table),
+                    record[:4] + interned_value[:-1]
+                ))
+
+        queries.sort(key=lambda query: query[0])
+
+        tables = {table for table, _ in fresh}
+        sequences = self.partition_sequences(tables)
+
+        counts = self._batch(
+            queries
+            + locations
+            + self.rollup_queries(values)
+            + [("""INSERT OR IGNORE INTO reverse_ip (ip) VALUES (?)""",
+                (ip,))
+               for ip in sorted(ips)]
+        )
+
+        if not counts:
+            return 0
+
+        for table, sequence in self.partition_sequences(tables).items():
+            if sequence > sequences[table]:
+                cherrypy.engine.publish(
+                    "scheduler:add",
+                    1,
+                    "logindex:alert",
+                    sequences[table] + 1,
+                    sequence - sequences[table] - 1
+                )
+
+        inserts = {query for query, _ in queries}
+
+        return sum(
+            count for query, count in counts.items()
+            if query in inserts
+        )
+
+    def partition_sequences(self, tables: Iterable[str]) -> Dict[str, int]:
+        """The most recently assigned id of each of the given partitions."""
+
+        tables = list(tables)
+        placeholders = ", ".join("?" * len(tables))
+
+        sequences = {
+            row["name"]: row["seq"]
+            for row in self._select(
+                f"""SELECT name, seq FROM sqlite_sequence
+                WHERE name IN ({placeholders})""",  # nosec
+                tables
+            )
+        }
+
+        return {table: sequences.get(table, 0) for table in tables}
+
+    def screen_hashes(
+            self,
+            months: List[int],
+            hashes: List[str],
+            confirm: bool = False
+    ) -> Set[str]:
+        """Find which of a batch of line hashes are already stored.
+
+        The months are the partition of each line. Hashes pass
+        through the Bloom filter on the way, and only the ones it may
+        have seen before are looked up. Without a filter, every hash
+        is looked up.
+
+        The filter is only saved periodically, so after an unclean
+        stop it can miss lines that are in the database. When confirm
+        is set, every hash is looked up regardless of the filter, for
+        callers that cannot tolerate a duplicate reaching the insert.
+
+        Lines from months that the pre-partitioning table covers are
+        also looked up there, since re-ingesting an old log would
+        otherwise store them a second time. The legacy range is
+        widened by a month either way because its months come from
+        UTC datestamps while partitions go by the local date of the
+        line.
+
+        """
+
+        candidates: Dict[str, List[str]] = {}
+        earliest, latest = self.legacy_months or (0, 0)
+
+        for month, digest in zip(months, hashes):
+            seen = self.screen.add(digest) if self.screen else True
+
+            if not (seen or confirm):
+                continue
+
+            candidates.setdefault(
+                self.partitions[month], []
+            ).append(digest)
+
+            if earliest and earliest - 1 <= month <= latest + 1:
+                candidates.setdefault(
+                    LEGACY_PARTITION, []
+                ).append(digest)
+
+        stored: Set[str] = set()
+
+        for table, candidate_hashes in candidates.items():
+            stored.update(self.stored_hashes(table, candidate_hashes))
+
+        return stored
+
+    def stored_hashes(self, table: str, hashes: List[str]) -> Set[str]:
+        """Find which of the given line hashes a partition contains."""
+
+        stored: Set[str] = set()
+
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+
+            stored.update(
+                row["hash"]
+                for row in self._select(
+                    f"""SELECT hash FROM {table}
+                    WHERE hash IN ({placeholders})""",  # nosec
+                    chunk
+                )
+            )
+
+        return stored
+
+    @decorators.log_runtime
+    def load_screen(self) -> None:
+        """Load the Bloom filter of line hashes, or build it from
+        scratch.
+
+        A saved filter can lag behind the database if the server
+        stopped without saving it. That only means some duplicates
+        fall through to the insert, where they are ignored as before.
+
+        """
+
+        self.screen = BloomFilter.load(self.screen_path)
+
+        if not self.screen or self.screen.is_full():
+            self.rebuild_screen()
+
+    @decorators.log_runtime
+    def rebuild_screen(self) -> None:
+        """Size a new Bloom filter for the current number of lines and
+        fill it from the database."""
+
+        line_count = self._selectFirst("SELECT count(*) FROM logs") or 0
+
+        screen = BloomFilter(max(line_count * 2, 1000000))
+
+        for row in self._select_generator("SELECT hash FROM logs"):
+            if row["hash"]:
+                screen.add(row["hash"])
+
+        self.screen = screen
+        self.save_screen()
+
+    def maintain_screen(self) -> None:
+        """Save the Bloom filter of line hashes, or rebuild it if it
+        has outgrown its capacity.
 
-        self._multi(queries)
+        This is normally invoked from the maintenance plugin.
+
+        """
+
+        if self.screen and self.screen.is_full():
+            self.rebuild_screen()
+        else:
+            self.save_screen()
+
+    def save_screen(self) -> None:
+        """Write the Bloom filter of line hashes to disk."""
+
+        if not self.screen:
+            return
+
+        try:
+            self.screen.save(self.screen_path)
+        except OSError as err:
+            cherrypy.engine.publish(
+                "applog:add",
+                "logindex:error",
+                f"Unable to save hash screen: {err}"
+            )
 
     def append_line(
             self,
             records: List[Tuple[str, str]]
     ) -> None:
-        """Append a string of additional key-value pairs to a logline."""
+        """Append a string of additional key-value pairs to a logline.
+
+        Only the hash of the line is known, so every partition is
+        checked.
+
+        """
 
         if not records:
             return
 
-        sql = """UPDATE logs SET logline=(logline || ' ' || ?)
-        WHERE hash=? AND INSTR(logline, ?) == 0"""
+        tables = list(self.partitions.values())
+        if self.legacy_months:
+            tables.append(LEGACY_PARTITION)
 
         queries = [
-            (sql, (values[1], values[0], values[1]))
+            (
+                f"""UPDATE {table} SET logline=(logline || ' ' || ?)
+                WHERE hash=? AND INSTR(logline, ?) == 0""",  # nosec
+                (values[1], values[0], values[1])
+            )
+            for table in tables
             for values in records
         ]
 
-        self._multi(queries)
+        self._batch(queries)
 
     def count_lines(self, source: pathlib.Path) -> int:
         """Tally the number of stored records for the given source file."""
@@ -596,26 +2468,118 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
     @decorators.log_runtime
     def query(
             self,
-            query: str
-    ) -> Tuple[List[sqlite3.Row], List[str]]:
-        """Perform a search against parsed log lines."""
+            query: str,
+            explain: bool = False,
+            cursor: str = "",
+            limit: int = 250
+    ) -> Tuple[List[sqlite3.Row], List[str], str]:
+        """Perform a search against parsed log lines.
+
+        Results are returned a page at a time, newest first. The cursor
+        marks where the previous page left off, and the cursor for the
+        page after this one is returned alongside the rows. It is empty
+        on the last page.
 
-        parser = parsers.logindex_query.Parser()
+        Paging is by timestamp and rowid rather than by offset so that
+        later pages cost the same as the first.
+
+        The query plan is only generated when asked for.
+
+        """
 
-        parsed_query = parser.parse(query)
+        where_clause, params = self.prepare(query)
 
-        sql = f"""SELECT unix_timestamp, datestamp, logs.ip,
-        host, uri, query as "query [querystring]",
+        position = self.decode_cursor(cursor)
+        keyset = ""
+        if position:
+            keyset = "AND (unix_timestamp, logs.id) < (?, ?)"
+            params += position
+
+        source = self.partition_source(query)
+
+        sql = f"""SELECT logs.id as rowid, unix_timestamp, datestamp,
+        logs.ip, host, uri, query as "query [querystring]",
         statusCode, method, agent_domain, classification, country,
         region, city, latitude, longitude, cookie,
-        referrer, referrer_domain, logline
-        FROM logs
-        WHERE {parsed_query}
-        ORDER BY unix_timestamp DESC"""  # nosec
+        referrer, referrer_domain, source_file, source_offset, logline
+        FROM {source} AS logs
+        WHERE {where_clause} {keyset}
+        ORDER BY unix_timestamp DESC, logs.id DESC
+        LIMIT ?"""  # nosec
+
+        params += (limit + 1,)
+
+        query_plan = []
+        if explain:
+            query_plan = self._explain(sql, params)
+
+        result = self._select(sql, params)
+
+        next_cursor = ""
+        if len(result) > limit:
+            result = result[:limit]
+            next_cursor = self.encode_cursor(
+                result[-1]["unix_timestamp"],
+                result[-1]["rowid"]
+            )
+
+        return (result, query_plan, next_cursor)
+
+    def prepare(self, query: str) -> PreparedQuery:
+        """Convert a search query to a parameterized WHERE clause.
+
+        Clauses are cached by their normalized query text. The
+        current date is part of the cache key because relative dates
+        such as "today" resolve differently from one day to the next.
+
+        The cache is shared by request threads, so it is only touched
+        under a lock. Parsing happens outside it.
+
+        """
+
+        key = (date.today(), " ".join(query.lower().split()))
+
+        with self.prepared_lock:
+            prepared = self.prepared.get(key)
+            if prepared:
+                self.prepared.move_to_end(key)
+                return prepared
+
+        prepared = self.parser.prepare(query)
+
+        with self.prepared_lock:
+            self.prepared[key] = prepared
+            while len(self.prepared) > self.prepared_size:
+                self.prepared.popitem(last=False)
+
+        return prepared
+
+    @staticmethod
+    def encode_cursor(unix_timestamp: float, rowid: int) -> str:
+        """Convert a result position to an opaque token."""
+
+        position = f"{unix_timestamp}:{rowid}"
+
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, ...]:
+        """Convert a token from encode_cursor() back to a position.
+
+        An empty tuple is returned for a missing or malformed token,
+        which equates to starting from the first page.
+
+        """
 
-        query_plan = self._explain(sql, ())
-        result = self._select(sql, ())
-        return (result, query_plan)
+        if not cursor:
+            return ()
+
+        try:
+            position = base64.urlsafe_b64decode(cursor.encode()).decode()
+            unix_timestamp, rowid = position.split(":")
+            return (float(unix_timestamp), int(rowid))
+        except (binascii.Error, UnicodeError, ValueError):
+            return ()
 
     @decorators.log_runtime
     def query_reverse_ip(
@@ -634,13 +2598,28 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
 
         return {row["ip"]: row["reverse_domain"] for row in result}
 
-    def alert(self, earliest_id: int, count: int) -> None:
-        """Send a notification for newly-parsed records that match
-        previously-stored queries.
+    def on_registry_changed(self, _: str) -> None:
+        """Discard compiled alerts after any registry change.
+
+        Updates only report the new key, so a query that was renamed
+        away from the alert namespace cannot be detected by key.
+
+        """
+
+        self.alerts = None
+
+    def get_alerts(self) -> List[CompiledAlert]:
+        """Compile the stored alert queries into record predicates.
+
+        The result is kept until the registry changes or the day
+        rolls over, since queries can refer to relative dates.
 
         """
 
-        parser = parsers.logindex_query.Parser()
+        today = date.today()
+
+        if self.alerts is not None and self.alerts_date == today:
+            return self.alerts
 
         alert_queries = cherrypy.engine.publish(
             "registry:search:dict",
@@ -648,20 +2627,69 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
             key_slice=2
         ).pop()
 
-        for name, query in alert_queries.items():
-            parsed_query = parser.parse(query)
+        self.alert_window = int(cherrypy.engine.publish(
+            "registry:first:value",
+            "logindex:alert_window",
+            default=3600
+        ).pop())
+
+        self.alerts = [
+            (name, query, self.parser.compile(query))
+            for name, query in alert_queries.items()
+        ]
+        self.alerts_date = today
+
+        return self.alerts
+
+    def alert(self, earliest_id: int, count: int) -> None:
+        """Send a notification for newly-parsed records that match
+        previously-stored queries.
+
+        The records are fetched once and tested against every alert
+        in memory. An IP that has already triggered a notification is
+        skipped until the alert window has passed.
+
+        """
+
+        alerts = self.get_alerts()
+
+        if not alerts:
+            return
 
-            sql = f"""SELECT distinct ip, uri
+        columns = ", ".join(
+            f"logs.{column}"
+            for column in parsers.logindex_query.Parser.keywords.values()
+            if column not in parsers.logindex_query.Parser.subquery_fields
+        )
+
+        # The reverse_ip column is the left operand so that the join
+        # compares with its binary collation and can use its index.
+        records = self._select_generator(
+            f"""SELECT {columns}, reverse_ip.reverse_domain
             FROM logs
-            WHERE {parsed_query}
-            AND rowid BETWEEN ? AND ?"""  # nosec
+            LEFT JOIN reverse_ip ON reverse_ip.ip=logs.ip
+            WHERE logs.id BETWEEN ? AND ?""",  # nosec
+            (earliest_id, earliest_id + count)
+        )
 
-            records = self._select(
-                sql,
-                (earliest_id, earliest_id + count)
-            )
+        now = time.time()
+
+        self.alerted = {
+            ip: alerted_at
+            for ip, alerted_at in self.alerted.items()
+            if now - alerted_at < self.alert_window
+        }
+
+        for record in records:
+            if record["ip"] in self.alerted:
+                continue
+
+            for name, query, predicate in alerts:
+                if not predicate(record):
+                    continue
+
+                self.alerted[record["ip"]] = now
 
-            for record in records:
                 url = cherrypy.engine.publish(
                     "app_url",
                     "/visitors",
@@ -683,6 +2711,8 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
                     notification
                 )
 
+                break
+
     @decorators.log_runtime
     def count_visit_days(
             self,
@@ -693,13 +2723,95 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         record = cast(
             Iterable[Tuple[Any, Any]],
             self._selectOne(
-                """SELECT count(DISTINCT substr(datestamp, 0, 11)) as count,
-                min(unix_timestamp) as earliest,
-                max(unix_timestamp) as latest
-                FROM logs
-                WHERE ip=?""",
+                """SELECT count(*) as count,
+                min(earliest) as earliest,
+                max(latest) as latest
+                FROM rollup_daily
+                WHERE dimension='ip' AND value=?""",
                 (ip_address,)
             )
         )
 
         return dict(record)
+
+    @staticmethod
+    def rollup_queries(
+            values: Iterable[Tuple[Any, ...]]
+    ) -> List[Tuple[str, Tuple[Any, ...]]]:
+        """Tally a batch of parsed values into rollup upserts.
+
+        The values are parameter tuples for PARSED_UPDATE_SQL. Lines
+        without a datestamp failed to parse and are not counted, nor
+        are empty dimension values.
+
+        """
+
+        datestamp_index = PARSED_COLUMNS.index("datestamp")
+        timestamp_index = PARSED_COLUMNS.index("unix_timestamp")
+        dimensions = tuple(
+            (dimension, PARSED_COLUMNS.index(dimension))
+            for dimension in ROLLUP_DIMENSIONS
+        )
+
+        tallies: Dict[Tuple[str, str, str, Any], List[Any]] = {}
+
+        for value in values:
+            datestamp = value[datestamp_index]
+            unix_timestamp = value[timestamp_index]
+
+            if not datestamp:
+                continue
+
+            for table, length in ROLLUP_PERIODS:
+                period = datestamp[:length]
+
+                for dimension, index in dimensions:
+                    if value[index] in (None, ""):
+                        continue
+
+                    key = (table, period, dimension, value[index])
+                    tally = tallies.get(key)
+
+                    if tally:
+                        tally[0] += 1
+                        tally[1] = min(tally[1], unix_timestamp)
+                        tally[2] = max(tally[2], unix_timestamp)
+                    else:
+                        tallies[key] = [1, unix_timestamp, unix_timestamp]
+
+        return [
+            (f"""INSERT INTO {table}
+            (period, dimension, value, hits, earliest, latest)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (period, dimension, value) DO UPDATE SET
+            hits=hits + excluded.hits,
+            earliest=min(earliest, excluded.earliest),
+            latest=max(latest, excluded.latest)""",  # nosec
+             (period, dimension, dimension_value, *tally))
+            for (table, period, dimension, dimension_value), tally
+            in sorted(tallies.items(), key=lambda item: item[0][0])
+        ]
+
+    @decorators.log_runtime
+    def rebuild_rollups(self) -> None:
+        """Recalculate the rollup tables from previously-parsed lines."""
+
+        queries: List[Tuple[str, Tuple[Any, ...]]] = []
+
+        for table, length in ROLLUP_PERIODS:
+            queries.append((f"DELETE FROM {table}", ()))  # nosec
+
+            for dimension in ROLLUP_DIMENSIONS:
+                queries.append((
+                    f"""INSERT INTO {table}
+                    (period, dimension, value, hits, earliest, latest)
+                    SELECT substr(datestamp, 1, {length}), ?, {dimension},
+                    count(*), min(unix_timestamp), max(unix_timestamp)
+                    FROM logs
+                    WHERE datestamp IS NOT NULL
+                    AND IFNULL({dimension}, '') <> ''
+                    GROUP BY 1, 3""",  # nosec
+                    (dimension,)
+                ))
+
+        self._batch(queries)
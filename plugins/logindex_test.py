@@ -1,10 +1,27 @@
 """Test suite for the logindex plugin."""
 
+import hashlib
+import os.path
+import queue
+import tempfile
+import threading
+import time
 import unittest
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from datetime import date
+from datetime import datetime
 from unittest.mock import Mock, patch
 import cherrypy
+import plugins.ip
 import plugins.logindex
+from plugins import mixins
 from testing.assertions import Subscriber
+from testing import helpers
 
 
 class TestLogindex(Subscriber):
@@ -17,11 +34,746 @@ class TestLogindex(Subscriber):
         """Subscriptions are prefixed consistently."""
 
         self.plugin.start()
-        self.assert_prefixes(subscribe_mock, ("logindex", "server"))
+        self.assert_prefixes(
+            subscribe_mock,
+            ("logindex", "registry", "server")
+        )
 
-    def test_placeholder(self) -> None:
-        """Placeholder to force pytest to generate a coverage file."""
-        pass   # pylint: disable=unnecessary-pass
+    def test_read_batches(self) -> None:
+        """Complete lines are batched with their byte offsets."""
+
+        buffer = "one\ntwö\nthree\npartial".encode("utf-8")
+
+        batches = list(self.plugin.read_batches(buffer, "test", 0, 2))
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(
+            [(line[1], line[3]) for line in batches[0] + batches[1]],
+            [(0, "one\n"), (4, "twö\n"), (9, "three\n")]
+        )
+        self.assertEqual(
+            batches[0][0][2],
+            "5bbf5a52328e7439ae6e719dfe712200"
+        )
+
+    def test_parse_chunk(self) -> None:
+        """Log lines are parsed and agent domains extracted."""
+
+        logline = helpers.get_fixture("combined.log")
+
+        result = self.plugin.parse_chunk([(42, logline)])
+
+        rowid, fields = result[0]
+        self.assertEqual(rowid, 42)
+        self.assertEqual(fields["ip"], "100.200.300.400")
+        self.assertEqual(fields["agent_domain"], "example.com")
+
+    def test_agent_facts(self) -> None:
+        """User agents are classified by the most specific match."""
+
+        cases = (
+            ("Mozilla/5.0 (compatible; Googlebot/2.1)", "bot"),
+            ("Feedly/1.0 (+http://www.feedly.com/fetcher.html)", "feed"),
+            ("curl/8.4.0", "tool"),
+            ("Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0", "browser"),
+            ("", None),
+        )
+
+        for agent, classification in cases:
+            self.assertEqual(
+                self.plugin.agent_facts(agent)[1],
+                classification
+            )
+
+    def test_read_batches_resume(self) -> None:
+        """The line at the last known offset is skipped."""
+
+        buffer = b"one\ntwo\nthree\n"
+
+        batches = list(self.plugin.read_batches(buffer, "test", 4))
+
+        self.assertEqual(batches[0][0][1], 8)
+        self.assertEqual(len(batches[0]), 1)
+
+    def test_prepare(self) -> None:
+        """Prepared statements are cached by normalized query text."""
+
+        prepared = self.plugin.prepare("uri /example\nstatus 404")
+        cached = self.plugin.prepare("URI  /example status 404")
+
+        self.assertIn("uri = ?", prepared[0])
+        self.assertEqual(prepared[1], ("/example", 404))
+        self.assertIs(cached, prepared)
+        self.assertEqual(len(self.plugin.prepared), 1)
+
+    @patch("plugins.logindex.ProcessPoolExecutor")
+    def test_get_executor(self, executor_mock: Mock) -> None:
+        """The parser pool is reused until a different size is asked
+        for."""
+
+        executors = [Mock(), Mock()]
+        executor_mock.side_effect = executors
+
+        self.assertIs(self.plugin.get_executor(2), executors[0])
+        self.assertIs(self.plugin.get_executor(2), executors[0])
+        self.assertIs(self.plugin.get_executor(3), executors[1])
+
+        executors[0].shutdown.assert_called_once()
+        self.assertEqual(
+            [call.kwargs["max_workers"] for call in executor_mock.call_args_list],
+            [2, 3]
+        )
+
+    def test_cursor(self) -> None:
+        """Cursor tokens round-trip and tolerate tampering."""
+
+        cursor = self.plugin.encode_cursor(1700000000.25, 42)
+
+        self.assertEqual(
+            self.plugin.decode_cursor(cursor),
+            (1700000000.25, 42)
+        )
+        self.assertEqual(self.plugin.decode_cursor("bogus!"), ())
+
+    def test_rollup_queries(self) -> None:
+        """Parsed values are tallied per period and dimension."""
+
+        geo = {
+            "country_code": "US",
+            "region_code": "",
+            "city": "",
+            "latitude": "",
+            "longitude": "",
+        }
+
+        values = [
+            self.plugin.parsed_values(
+                rowid,
+                {
+                    "unix_timestamp": timestamp,
+                    "datestamp": datestamp,
+                    "ip": "192.0.2.1",
+                },
+                geo
+            )
+            for rowid, timestamp, datestamp in (
+                (1, 100, "2024-01-01-05"),
+                (2, 200, "2024-01-01-06"),
+                (3, 300, None),
+            )
+        ]
+
+        queries = self.plugin.rollup_queries(values)
+        daily = [
+            params for sql, params in queries
+            if "rollup_daily" in sql
+        ]
+
+        self.assertEqual(len(queries), 6)
+        self.assertIn(("2024-01-01", "ip", "192.0.2.1", 2, 100, 200), daily)
+        self.assertIn(("2024-01-01", "country", "US", 2, 100, 200), daily)
+
+    def test_partition_for_line(self) -> None:
+        """Lines are assigned to the partition for their month."""
+
+        month = self.plugin.partition_for_line(
+            '192.0.2.1 - - [03/Feb/2024:01:01:01 +0000] "GET / HTTP/1.1"'
+        )
+
+        self.assertEqual(self.plugin.partition_name(month), "logs_2024_02")
+        self.assertEqual(
+            self.plugin.partition_for_id((month << 32) + 5),
+            "logs_2024_02"
+        )
+        self.assertEqual(self.plugin.partition_for_id(5), "logs_legacy")
+
+    def test_enrich(self) -> None:
+        """Missing locations are filled from the same IP in the batch."""
+
+        geo = {
+            "country_code": "",
+            "region_code": "",
+            "city": "",
+            "latitude": "",
+            "longitude": "",
+        }
+
+        values = [
+            self.plugin.parsed_values(1, {"ip": "192.0.2.1", "region": "NY"}, geo),
+            self.plugin.parsed_values(2, {"ip": "192.0.2.1", "city": "Albany"}, geo),
+        ]
+
+        enriched, upserts = self.plugin.enrich(values)
+        region = plugins.logindex.PARSED_COLUMNS.index("region")
+        city = plugins.logindex.PARSED_COLUMNS.index("city")
+
+        self.assertEqual(
+            [(value[region], value[city]) for value in enriched],
+            [("NY", "Albany"), ("NY", "Albany")]
+        )
+        self.assertEqual(upserts[0][1], ("192.0.2.1", "NY", "Albany"))
+
+    def test_pack_block(self) -> None:
+        """Archived lines survive a round trip by offset."""
+
+        block = self.plugin.pack_block([
+            (0, "first line\n"),
+            (11, "second\tline\r\n"),
+        ])
+
+        self.assertEqual(
+            self.plugin.unpack_block(block),
+            {0: "first line", 11: "second\tline"}
+        )
+
+    def test_bloom_filter(self) -> None:
+        """Hashes are remembered across a save and load."""
+
+        bloom = plugins.logindex.BloomFilter(1000)
+        digest = "d41d8cd98f00b204e9800998ecf8427e"
+
+        self.assertFalse(bloom.add(digest))
+        self.assertTrue(bloom.add(digest))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "test.bloom")
+            bloom.save(path)
+            loaded = plugins.logindex.BloomFilter.load(path)
+
+        self.assertIsNotNone(loaded)
+        assert loaded is not None
+        self.assertIn(digest, loaded)
+        self.assertNotIn("0" * 32, loaded)
+        self.assertEqual(loaded.count, 1)
+
+    def test_intern(self) -> None:
+        """Interned strings are swapped for ids that keep their case."""
+
+        geo = {
+            "country_code": "",
+            "region_code": "",
+            "city": "",
+            "latitude": "",
+            "longitude": "",
+        }
+
+        with tempfile.TemporaryDirectory() as workdir:
+            self.plugin.db_path = os.path.join(workdir, "logindex.sqlite")
+            self.plugin._create("".join(
+                plugins.logindex.INTERNED_SCHEMA.format(column=column)
+                for column in plugins.logindex.INTERNED_COLUMNS
+            ))
+
+            values = [
+                self.plugin.parsed_values(1, {"uri": "/Page"}, geo),
+                self.plugin.parsed_values(2, {"uri": "/page"}, geo),
+                self.plugin.parsed_values(3, {"uri": "/Page"}, geo),
+            ]
+
+            uri = plugins.logindex.PARSED_COLUMNS.index("uri")
+            ids = [value[uri] for value in self.plugin.intern(values)]
+
+            self.assertEqual(ids[0], ids[2])
+            self.assertNotEqual(ids[0], ids[1])
+            self.assertEqual(
+                self.plugin._selectFirst(
+                    "SELECT value FROM interned_uri WHERE id=?",
+                    (ids[1],)
+                ),
+                "/page"
+            )
+
+            mixins.pool.close_all()
+
+
+class TestLogindexDatabase(unittest.TestCase):
+    """Tests that read and write a throwaway database."""
+
+    def setUp(self) -> None:
+        self.workdir = tempfile.TemporaryDirectory()
+        cherrypy.config.update({"database_dir": self.workdir.name})
+
+        self.scheduled: List[Tuple[Any, ...]] = []
+        cherrypy.engine.subscribe("ip:facts:many", self.ip_facts)
+        cherrypy.engine.subscribe("scheduler:add", self.schedule)
+
+        self.plugin = plugins.logindex.Plugin(cherrypy.engine)
+        self.plugin.setup()
+        self.scheduled.clear()
+
+    def tearDown(self) -> None:
+        cherrypy.engine.unsubscribe("ip:facts:many", self.ip_facts)
+        cherrypy.engine.unsubscribe("scheduler:add", self.schedule)
+        mixins.pool.close_all()
+        self.workdir.cleanup()
+
+    @staticmethod
+    def ip_facts(ips: Any) -> Dict[str, Any]:
+        """A stand-in for the ip plugin with no geographic facts."""
+
+        geo = {
+            "country_code": None,
+            "region_code": None,
+            "city": None,
+            "latitude": None,
+            "longitude": None,
+        }
+
+        return {ip: {"geo": geo} for ip in ips}
+
+    def schedule(self, *args: Any) -> None:
+        """A stand-in for the scheduler that records what was added."""
+
+        self.scheduled.append(args)
+
+    @staticmethod
+    def logline(day: str, ip: str = "192.0.2.1") -> str:
+        """A combined-format line for a day such as 03/Feb/2024."""
+
+        return (
+            f'{ip} - - [{day}:01:01:01 +0000] "GET / HTTP/1.1" 200 10 '
+            '"-" "curl/8.4.0"\n'
+        )
+
+    def insert_days(self, *days: str) -> int:
+        """Insert one line per day, each from a different IP."""
+
+        lines = [
+            self.logline(day, f"192.0.2.{index}")
+            for index, day in enumerate(days, start=1)
+        ]
+
+        return self.plugin.insert_line([
+            ("test", offset, hashlib.md5(line.encode()).hexdigest(), line)
+            for offset, line in enumerate(lines)
+        ])
+
+    def test_partition_routing(self) -> None:
+        """Lines land in the partition for their month and are all
+        visible through the logs view."""
+
+        inserted = self.insert_days(
+            "31/Jan/2024", "01/Feb/2024", "31/Jan/2024", "29/Feb/2024"
+        )
+
+        self.assertEqual(inserted, 4)
+
+        for table, count in (("logs_2024_01", 2), ("logs_2024_02", 2)):
+            self.assertEqual(
+                self.plugin._selectFirst(f"SELECT count(*) FROM {table}"),
+                count
+            )
+
+        ids = [
+            row["id"]
+            for row in self.plugin._select("SELECT id FROM logs ORDER BY id")
+        ]
+
+        self.assertEqual(
+            [self.plugin.partition_for_id(rowid) for rowid in ids],
+            ["logs_2024_01", "logs_2024_01", "logs_2024_02", "logs_2024_02"]
+        )
+
+    def test_parse_across_partitions(self) -> None:
+        """A parse batch spanning two months schedules one alert range
+        per partition."""
+
+        self.insert_days("31/Jan/2024", "31/Jan/2024", "01/Feb/2024")
+
+        self.plugin.parse()
+
+        self.assertEqual(
+            self.plugin._selectFirst(
+                "SELECT count(*) FROM logs WHERE ip IS NOT NULL"
+            ),
+            3
+        )
+
+        alerts = [
+            args[2:] for args in self.scheduled
+            if args[1] == "logindex:alert"
+        ]
+
+        self.assertEqual(
+            [
+                (self.plugin.partition_for_id(first_id), count)
+                for first_id, count in alerts
+            ],
+            [("logs_2024_01", 1), ("logs_2024_02", 0)]
+        )
+
+    def test_writer_survives_errors(self) -> None:
+        """A batch that fails to write does not stop the writer."""
+
+        updates: queue.Queue = queue.Queue()
+        updates.put(["bad"])
+        updates.put(["good"])
+        updates.put(None)
+
+        with patch.object(
+                self.plugin,
+                "write_parsed_batch",
+                side_effect=[ValueError("bad batch"), None]
+        ) as write_mock:
+            self.plugin.write_parsed(updates)
+
+        self.assertEqual(write_mock.call_count, 2)
+        self.assertTrue(updates.empty())
+
+    def test_prune(self) -> None:
+        """Partitions past the retention period are dropped from the
+        database and the logs view."""
+
+        today = date.today()
+        self.insert_days("01/Jan/2001", today.strftime("%d/%b/%Y"))
+
+        self.plugin.prune(cutoff_months=12)
+
+        self.assertNotIn("logs_2001_01", self.plugin.partitions.values())
+        self.assertIsNone(
+            self.plugin._selectFirst(
+                "SELECT name FROM sqlite_master WHERE name='logs_2001_01'"
+            )
+        )
+        self.assertEqual(
+            self.plugin._selectFirst("SELECT count(*) FROM logs"),
+            1
+        )
+
+    def test_prune_archive(self) -> None:
+        """Pruning deletes the archive blocks and interned strings that
+        only the dropped partitions used."""
+
+        old_day = "01/Jan/2001"
+        current_day = date.today().strftime("%d/%b/%Y")
+        archivable = time.time() - 86400 * 2
+
+        records = [
+            (source_file, offset, f"{source_file}{offset}".ljust(32, "0"),
+             self.logline(day), {
+                 "ip": "192.0.2.1",
+                 "uri": uri,
+                 "unix_timestamp": archivable,
+                 "datestamp": "2001-01-01-01",
+             })
+            for source_file, offset, day, uri in (
+                ("old.log", 0, old_day, "/old"),
+                ("shared.log", 0, old_day, "/old"),
+                ("shared.log", 100, current_day, "/current"),
+            )
+        ]
+
+        self.plugin.insert_parsed(records)
+        self.plugin.archive(days=1)
+
+        self.assertEqual(
+            self.plugin._selectFirst("SELECT count(*) FROM logline_archive"),
+            2
+        )
+
+        self.plugin.prune(cutoff_months=12)
+
+        self.assertEqual(
+            [
+                row["source_file"]
+                for row in self.plugin._select(
+                    "SELECT source_file FROM logline_archive"
+                )
+            ],
+            ["shared.log"]
+        )
+        self.assertEqual(
+            self.plugin.archived_line("shared.log", 100),
+            self.logline(current_day).rstrip()
+        )
+        self.assertEqual(
+            [
+                row["value"]
+                for row in self.plugin._select(
+                    "SELECT value FROM interned_uri"
+                )
+            ],
+            ["/current"]
+        )
+
+    def test_archived_line(self) -> None:
+        """Archived lines are read from the one block that spans their
+        offset."""
+
+        self.plugin._batch([
+            ("""INSERT INTO logline_archive
+            (source_file, first_offset, last_offset, block)
+            VALUES (?, ?, ?, ?)""",
+             ("test.log", lines[0][0], lines[-1][0],
+              self.plugin.pack_block(lines)))
+            for lines in (
+                [(0, "line 0"), (10, "line 10")],
+                [(20, "line 20"), (30, "line 30")],
+            )
+        ])
+
+        with patch.object(
+                self.plugin,
+                "unpack_block",
+                wraps=self.plugin.unpack_block
+        ) as unpack_mock:
+            self.assertEqual(
+                self.plugin.archived_line("test.log", 20),
+                "line 20"
+            )
+            self.assertEqual(self.plugin.archived_line("test.log", 15), "")
+            self.assertEqual(
+                self.plugin.archived_line("test.log", 30),
+                "line 30"
+            )
+
+        self.assertEqual(unpack_mock.call_count, 1)
+
+    def write_log(self, mode: str, *ips: str) -> str:
+        """Write lines from the given IPs to a log file in the work
+        directory."""
+
+        path = os.path.join(self.workdir.name, "2024-02-03.log")
+
+        with open(path, mode, encoding="utf-8") as handle:
+            for ip in ips:
+                handle.write(self.logline("03/Feb/2024", ip))
+
+        return path
+
+    def line_count(self) -> int:
+        """The number of lines stored across all partitions."""
+
+        return int(self.plugin._selectFirst("SELECT count(*) FROM logs"))
+
+    def test_checkpoint_resume(self) -> None:
+        """Ingestion resumes from the checkpoint after a restart, and
+        starts over when the file has been truncated."""
+
+        path = self.write_log("w", "192.0.2.1", "192.0.2.2")
+
+        self.assertEqual(self.plugin.ingest_new_lines(path), 2)
+
+        self.write_log("a", "192.0.2.3")
+        restarted = plugins.logindex.Plugin(cherrypy.engine)
+
+        self.assertEqual(restarted.ingest_new_lines(path), 1)
+        self.assertEqual(
+            restarted._selectFirst(
+                "SELECT source_offset FROM ingest_checkpoint"
+            ),
+            2 * len(self.logline("03/Feb/2024", "192.0.2.1"))
+        )
+
+        self.write_log("w", "192.0.2.4")
+
+        self.assertEqual(restarted.ingest_new_lines(path), 1)
+        self.assertEqual(self.line_count(), 4)
+
+    def follow_file(
+            self,
+            watch: Callable[[str], int],
+            update: Optional[Callable[[str], None]] = None
+    ) -> None:
+        """Follow a log file, update it, and wait for the new line to
+        be ingested.
+
+        The default update appends to the file.
+
+        """
+
+        path = self.write_log("w", "192.0.2.1")
+
+        def now(**_: Any) -> datetime:
+            return datetime.now()
+
+        cherrypy.engine.subscribe("clock:now", now)
+
+        try:
+            with patch.object(
+                    self.plugin, "file_for_date", return_value=path
+            ), patch.object(self.plugin, "watch", watch):
+                self.plugin.follow(poll_interval=0.05)
+
+                deadline = time.monotonic() + 5
+                while self.line_count() < 1 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+
+                if update:
+                    update(path)
+                else:
+                    self.write_log("a", "192.0.2.2")
+
+                while self.line_count() < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+
+                self.plugin.unfollow()
+        finally:
+            cherrypy.engine.unsubscribe("clock:now", now)
+
+        self.assertIsNone(self.plugin.follower)
+        self.assertEqual(self.line_count(), 2)
+        self.assertTrue(
+            any(args[1] == "logindex:parse" for args in self.scheduled)
+        )
+
+    def test_follow_inotify(self) -> None:
+        """Appended lines are picked up by a followed file's watch."""
+
+        self.follow_file(plugins.logindex.Plugin.watch)
+
+    def test_follow_polling(self) -> None:
+        """Appended lines are picked up by polling without inotify."""
+
+        self.follow_file(lambda _: -1)
+
+    def test_follow_replaced(self) -> None:
+        """A followed file that is replaced is watched anew."""
+
+        def replace(path: str) -> None:
+            with open(f"{path}.new", "w", encoding="utf-8") as handle:
+                handle.write(self.logline("03/Feb/2024", "192.0.2.2"))
+            os.replace(f"{path}.new", path)
+
+        self.follow_file(plugins.logindex.Plugin.watch, replace)
+
+    def test_follow_survives_errors(self) -> None:
+        """A pass that fails is logged and following carries on."""
+
+        errors: List[str] = []
+        ingest_new_lines = self.plugin.ingest_new_lines
+
+        def flaky_ingest(path: str) -> int:
+            if not errors:
+                raise OSError("Log file unavailable")
+            return ingest_new_lines(path)
+
+        def applog(source: str, message: str) -> None:
+            if source == "logindex:error":
+                errors.append(message)
+
+        cherrypy.engine.subscribe("applog:add", applog)
+
+        try:
+            with patch.object(
+                    self.plugin, "ingest_new_lines", flaky_ingest
+            ):
+                self.follow_file(plugins.logindex.Plugin.watch)
+        finally:
+            cherrypy.engine.unsubscribe("applog:add", applog)
+
+        self.assertEqual(len(errors), 1)
+
+    def test_stale_screen(self) -> None:
+        """Parsed inserts are not fooled by a Bloom filter that lags
+        the database."""
+
+        fields = {
+            "ip": "192.0.2.1",
+            "unix_timestamp": 1706922061.0,
+            "datestamp": "2024-02-03-01",
+        }
+
+        record = ("test", 0, "a" * 32, self.logline("03/Feb/2024"), fields)
+
+        self.assertEqual(self.plugin.insert_parsed([record]), 1)
+
+        self.plugin.screen = plugins.logindex.BloomFilter(1000)
+
+        self.assertEqual(self.plugin.insert_parsed([record]), 0)
+        self.assertEqual(
+            self.plugin._selectFirst(
+                """SELECT hits FROM rollup_daily
+                WHERE dimension='ip' AND value='192.0.2.1'"""
+            ),
+            1
+        )
+
+    def test_legacy_duplicates(self) -> None:
+        """Lines stored before partitioning are not inserted again when
+        their log is re-ingested."""
+
+        line = self.logline("03/Feb/2024")
+        digest = hashlib.md5(line.encode()).hexdigest()
+
+        self.plugin._create(f"""
+        CREATE TABLE {plugins.logindex.LEGACY_PARTITION} (
+            unix_timestamp integer, datestamp, hash, source_file,
+            source_offset integer, ip, host, uri, query,
+            statusCode integer, method, agent, agent_domain,
+            classification, country, region, city, latitude real,
+            longitude real, cookie, referrer, referrer_domain, logline,
+            UNIQUE(hash)
+        );
+        INSERT INTO {plugins.logindex.LEGACY_PARTITION}
+            (datestamp, hash, source_file, source_offset, logline)
+            VALUES ('2024-02-03-01', '{digest}', 'test', 0, '{line}');
+        """)
+
+        self.plugin.load_partitions()
+        self.plugin.rebuild_screen()
+        record = ("test", 0, digest, line)
+
+        self.assertEqual(self.plugin.insert_line([record]), 0)
+
+        self.plugin.screen = None
+        self.assertEqual(self.plugin.insert_line([record]), 0)
+
+        fields = {
+            "ip": "192.0.2.1",
+            "unix_timestamp": 1706922061.0,
+            "datestamp": "2024-02-03-01",
+        }
+        self.assertEqual(self.plugin.insert_parsed([record + (fields,)]), 0)
+        self.assertEqual(
+            self.plugin._selectFirst("SELECT count(*) FROM logs"),
+            1
+        )
+
+    def test_reversal_timeout(self) -> None:
+        """Addresses whose reverse lookups time out stay unreversed."""
+
+        release = threading.Event()
+
+        def resolver(ip_address: str) -> str:
+            if ip_address == "192.0.2.2":
+                release.wait(5)
+            return f"host-{ip_address.replace('.', '-')}.example.com"
+
+        ip_plugin = plugins.ip.Plugin(cherrypy.engine, resolver=resolver)
+
+        def reverse_many(ips: Any) -> Dict[str, Dict[str, Any]]:
+            return ip_plugin.reverse_many(ips, timeout=0.1)
+
+        self.plugin._batch([
+            ("INSERT INTO reverse_ip (ip) VALUES (?)", (ip,))
+            for ip in ("192.0.2.1", "192.0.2.2")
+        ])
+        cherrypy.engine.subscribe("ip:reverse:many", reverse_many)
+
+        try:
+            self.plugin.reversal()
+        finally:
+            cherrypy.engine.unsubscribe("ip:reverse:many", reverse_many)
+            release.set()
+            ip_plugin.stop()
+
+        self.assertEqual(
+            [
+                tuple(row) for row in self.plugin._select(
+                    """SELECT ip, reverse_domain FROM reverse_ip
+                    WHERE updated IS NOT NULL"""
+                )
+            ],
+            [("192.0.2.1", "example.com")]
+        )
+        self.assertEqual(
+            self.plugin._selectFirst(
+                "SELECT ip FROM reverse_ip WHERE updated IS NULL"
+            ),
+            "192.0.2.2"
+        )
+        self.assertEqual(self.scheduled, [(5, "logindex:reversal")])
 
 
 if __name__ == "__main__":
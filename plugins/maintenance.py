@@ -50,6 +50,9 @@ class Plugin(cherrypy.process.plugins.SimplePlugin, mixins.Sqlite):
         cherrypy.engine.publish("bookmarks:prune")
         cherrypy.engine.publish("cache:prune")
         cherrypy.engine.publish("capture:prune")
+        cherrypy.engine.publish("logindex:prune")
+        cherrypy.engine.publish("logindex:archive")
+        cherrypy.engine.publish("logindex:screen")
         cherrypy.engine.publish("recipes:prune")
 
         cherrypy.engine.publish(
@@ -1,8 +1,13 @@
 """Methods for issuing SQL queries against an SQLite database."""
 
+import itertools
 import os.path
 import sqlite3
+import threading
 from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
 from typing import Iterator
 from typing import List
 from typing import Optional
@@ -13,6 +18,177 @@ from typing import cast
 import re
 import cherrypy
 
+PoolKey = Tuple[threading.Thread, str]
+
+# The name, argument count and implementation of an SQL function.
+SqlFunction = Tuple[str, int, Callable[..., Any]]
+
+
+class ConnectionPool(cherrypy.process.plugins.SimplePlugin):
+    """Long-lived SQLite connections keyed by thread and database path.
+
+    Opening a connection per query discards SQLite's page cache and
+    prepared statement cache each time. Holding on to connections
+    keeps both warm for as long as the server is running.
+
+    A connection is only ever handed out to the thread that opened
+    it. Threads are told apart by their Thread object rather than
+    their ident, since an ident can be reused once its thread exits.
+    The same-thread check is nonetheless disabled so that the pool
+    can close everything from the main thread during engine stop.
+
+    """
+
+    def __init__(self, bus: cherrypy.process.wspbus.Bus) -> None:
+        cherrypy.process.plugins.SimplePlugin.__init__(self, bus)
+        self.connections: Dict[PoolKey, sqlite3.Connection] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> None:
+        """Define the CherryPy messages to listen for.
+
+        This plugin owns the sqlite prefix.
+        """
+
+        self.bus.subscribe("sqlite:pool:stats", self.stats)
+
+    def stop(self) -> None:
+        """Close all connections when the engine stops."""
+
+        self.close_all()
+
+    def checkout(
+            self,
+            db_path: str,
+            pragmas: Tuple[str, ...] = (),
+            functions: Tuple[SqlFunction, ...] = ()
+    ) -> sqlite3.Connection:
+        """Get the current thread's connection to a database.
+
+        A pooled connection that was closed out from under the pool
+        is replaced. Transactions never outlive the call that began
+        them, so one that is still open was abandoned. It is logged
+        and rolled back rather than handed to a new caller, or replaced
+        if it cannot be.
+
+        Opening a connection is also when connections held for
+        threads that have since exited are closed.
+
+        """
+
+        key = (threading.current_thread(), db_path)
+
+        with self.lock:
+            con = self.connections.get(key)
+
+        if con:
+            try:
+                if con.in_transaction:
+                    cherrypy.log(
+                        "WARNING: rolling back abandoned transaction on "
+                        f"{os.path.basename(db_path)}"
+                    )
+                    con.execute("ROLLBACK")
+
+                with self.lock:
+                    self.hits += 1
+
+                return con
+            except sqlite3.Error:
+                self.discard(db_path)
+
+        with self.lock:
+            self.misses += 1
+
+        self.prune()
+
+        con = sqlite3.connect(
+            db_path,
+            detect_types=sqlite3.PARSE_COLNAMES,
+            isolation_level=None,
+            check_same_thread=False
+        )
+
+        con.row_factory = sqlite3.Row
+
+        for pragma in pragmas:
+            con.execute(pragma)
+
+        for name, narg, func in functions:
+            con.create_function(name, narg, func, deterministic=True)
+
+        with self.lock:
+            self.connections[key] = con
+
+        return con
+
+    def prune(self) -> int:
+        """Close the connections of threads that are no longer running.
+
+        CherryPy replaces its worker threads over time, and nothing
+        else would close the connections they leave behind.
+
+        """
+
+        with self.lock:
+            orphaned = [
+                self.connections.pop(key)
+                for key in list(self.connections)
+                if not key[0].is_alive()
+            ]
+
+        for con in orphaned:
+            try:
+                con.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+        return len(orphaned)
+
+    def discard(self, db_path: str) -> None:
+        """Drop the current thread's connection to a database."""
+
+        key = (threading.current_thread(), db_path)
+
+        with self.lock:
+            con = self.connections.pop(key, None)
+
+        if con:
+            try:
+                con.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+    def close_all(self) -> int:
+        """Close every pooled connection."""
+
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+
+        for con in connections:
+            try:
+                con.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+        return len(connections)
+
+    def stats(self) -> Dict[str, int]:
+        """Usage counters for the pool."""
+
+        with self.lock:
+            return {
+                "connections": len(self.connections),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+pool = ConnectionPool(cherrypy.engine)
+
 
 # pylint: disable=invalid-name,no-member
 class Sqlite:
@@ -20,6 +196,15 @@ class Sqlite:
 
     db_path: str
 
+    # Connection-level PRAGMAs applied once when the pool opens a new
+    # connection. Database-level settings that persist in the file,
+    # such as journal_mode, belong in the schema instead.
+    db_pragmas: Tuple[str, ...] = ()
+
+    # Application-defined SQL functions, registered alongside the
+    # PRAGMAs on each new connection.
+    db_functions: Tuple[SqlFunction, ...] = ()
+
     @staticmethod
     def _path(name: str) -> str:
         """Get the filesystem path of a database file relative to the
@@ -33,12 +218,14 @@ class Sqlite:
         )
 
     def _open(self) -> sqlite3.Connection:
-        """Open a connection to the current database."""
+        """Get a pooled connection to the current database.
 
-        return sqlite3.connect(
-            self.db_path,
-            detect_types=sqlite3.PARSE_COLNAMES
-        )
+        Connections run in autocommit mode. Statements that need to
+        share a transaction should go through _multi().
+
+        """
+
+        return pool.checkout(self.db_path, self.db_pragmas, self.db_functions)
 
     def _create(self, sql: str) -> None:
         """Establish a schema by executing a series of SQL statements."""
@@ -46,12 +233,11 @@ class Sqlite:
         con = self._open()
 
         try:
-            with con:
-                con.executescript(sql)
+            con.executescript(sql)
         except sqlite3.DatabaseError as err:
             self._logError(err)
-        finally:
-            con.close()
+            if con.in_transaction:
+                con.execute("ROLLBACK")
 
     def _execute(
             self,
@@ -64,13 +250,10 @@ class Sqlite:
         con = self._open()
 
         try:
-            with con:
-                con.execute(query, params)
+            con.execute(query, params)
         except sqlite3.DatabaseError as err:
             result = False
             self._logError(err)
-        finally:
-            con.close()
 
         return result
 
@@ -85,17 +268,53 @@ class Sqlite:
         con = self._open()
 
         try:
-            with con:
-                cur = con.execute(query, params)
-                insert_id = cur.lastrowid or 0
+            cur = con.execute(query, params)
+            insert_id = cur.lastrowid or 0
         except sqlite3.DatabaseError as err:
             insert_id = -1
             self._logError(err)
-        finally:
-            con.close()
 
         return insert_id
 
+    @staticmethod
+    def _group(
+            queries: Iterable[Tuple[str, Any]]
+    ) -> Iterator[Tuple[str, List[Any]]]:
+        """Collapse consecutive queries with the same SQL text.
+
+        Only adjacent queries are grouped so that the overall order of
+        statements is preserved.
+
+        """
+
+        for query, group in itertools.groupby(queries, lambda q: q[0]):
+            yield (query, [params for _, params in group])
+
+    def _run_grouped(
+            self,
+            con: sqlite3.Connection,
+            queries: Iterable[Tuple[str, Any]]
+    ) -> Dict[str, int]:
+        """Execute queries group by group and tally affected rows.
+
+        Runs of the same statement are sent through executemany() so
+        that SQLite prepares them once. A lone statement goes through
+        execute() since executemany() only accepts DML.
+
+        """
+
+        counts: Dict[str, int] = {}
+
+        for query, params in self._group(queries):
+            if len(params) == 1:
+                cur = con.execute(query, params[0])
+            else:
+                cur = con.executemany(query, params)
+
+            counts[query] = counts.get(query, 0) + max(cur.rowcount, 0)
+
+        return counts
+
     def _multi(
             self,
             queries: Sequence[Tuple[str, Any]],
@@ -105,12 +324,10 @@ class Sqlite:
 
         result = True
         con = self._open()
-        con.isolation_level = None
 
         try:
             con.execute("BEGIN")
-            for query, params in queries:
-                con.execute(query, params)
+            self._run_grouped(con, queries)
             con.execute("COMMIT")
 
             if after_commit:
@@ -120,16 +337,44 @@ class Sqlite:
                     con=con
                 )
 
-            con.close()
-
         except sqlite3.DatabaseError as err:
             result = False
             self._logError(err)
-            con.execute("rollback")
-            con.close()
+        finally:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
 
         return result
 
+    def _batch(
+            self,
+            queries: Iterable[Tuple[str, Any]]
+    ) -> Dict[str, int]:
+        """Issue batches of write queries within a single transaction.
+
+        This is the bulk counterpart to _multi() for callers that
+        send many copies of the same statement. The return value maps
+        each distinct statement to the number of rows it affected. It
+        is empty if the transaction was rolled back.
+
+        """
+
+        counts: Dict[str, int] = {}
+        con = self._open()
+
+        try:
+            con.execute("BEGIN")
+            counts = self._run_grouped(con, queries)
+            con.execute("COMMIT")
+        except sqlite3.DatabaseError as err:
+            counts = {}
+            self._logError(err)
+        finally:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+
+        return counts
+
     def _delete(
             self,
             query: str,
@@ -141,13 +386,10 @@ class Sqlite:
         con = self._open()
 
         try:
-            with con:
-                result = con.execute(query, values).rowcount
+            result = con.execute(query, values).rowcount
         except sqlite3.DatabaseError as err:
             result = 0
             self._logError(err)
-        finally:
-            con.close()
 
         return result
 
@@ -185,18 +427,12 @@ class Sqlite:
 
         result = None
         con = self._open()
-        con.row_factory = sqlite3.Row
-        cur = con.cursor()
 
         try:
-            with con:
-                cur.execute(query, values)
-                result = cur.fetchall() or []
+            result = con.execute(query, values).fetchall() or []
         except sqlite3.DatabaseError as err:
             result = []
             self._logError(err)
-        finally:
-            con.close()
 
         return result
 
@@ -206,19 +442,21 @@ class Sqlite:
             values: Sequence[Any] = (),
             con: Optional[sqlite3.Connection] = None
     ) -> Iterator[sqlite3.Row]:
-        """Execute a select query and return results as a generator."""
+        """Execute a select query and return results as a generator.
+
+        The connection is checked out when iteration begins rather
+        than when the generator is created so that it belongs to the
+        consuming thread.
+
+        """
 
         if not con:
             con = self._open()
 
-        con.row_factory = sqlite3.Row
-
         try:
             yield from con.execute(query, values)
         except sqlite3.DatabaseError as err:
             self._logError(err)
-        finally:
-            con.close()
 
     def _explain(
             self,
@@ -250,15 +488,11 @@ class Sqlite:
 
         row = None
         con = self._open()
-        con.row_factory = sqlite3.Row
 
         try:
-            for row in con.execute(query, values):
-                break
+            row = con.execute(query, values).fetchone()
         except sqlite3.DatabaseError as err:
             self._logError(err)
-        finally:
-            con.close()
 
         return row
 
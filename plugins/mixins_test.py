@@ -1,16 +1,190 @@
 """Test suite for the mixins plugin."""
 
+import sqlite3
+import tempfile
+import threading
 import unittest
+from typing import Any
+from typing import List
+from typing import Tuple
+from unittest.mock import patch
+import cherrypy
+from plugins import mixins
+
+
+class Example(mixins.Sqlite):
+    """A minimal consumer of the Sqlite mixin."""
+
+    db_pragmas = ("PRAGMA temp_store=MEMORY",)
+
+    def __init__(self) -> None:
+        cherrypy.config.update({"database_dir": tempfile.gettempdir()})
+        self.db_path = self._path("mixins_test.sqlite")
 
 
 class TestMixins(unittest.TestCase):
 
     def setUp(self) -> None:
-        pass
+        mixins.pool.close_all()
+        self.example = Example()
+        self.example._create("""
+        DROP TABLE IF EXISTS example;
+        CREATE TABLE example (value);
+        """)
+
+    def tearDown(self) -> None:
+        mixins.pool.close_all()
+
+    def test_connection_reuse(self) -> None:
+        """Repeat queries on the same thread share a connection."""
+
+        before = mixins.pool.stats()
+        self.example._insert("INSERT INTO example VALUES (?)", (1,))
+        self.example._insert("INSERT INTO example VALUES (?)", (2,))
+        after = mixins.pool.stats()
+
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertEqual(after["misses"], before["misses"])
+        self.assertEqual(
+            self.example._selectFirst("SELECT count(*) FROM example"),
+            2
+        )
+
+    def test_pragmas(self) -> None:
+        """Connection pragmas are applied when the connection opens."""
+
+        self.assertEqual(
+            self.example._selectFirst("PRAGMA temp_store"),
+            2
+        )
+
+    def test_broken_connection(self) -> None:
+        """A connection closed outside the pool is replaced."""
+
+        self.example._open().close()
+        self.example._insert("INSERT INTO example VALUES (?)", (1,))
+
+        self.assertEqual(
+            self.example._selectFirst("SELECT count(*) FROM example"),
+            1
+        )
+
+    def test_multi_rollback(self) -> None:
+        """A failed transaction leaves no partial writes."""
+
+        result = self.example._multi((
+            ("INSERT INTO example VALUES (?)", (1,)),
+            ("INSERT INTO nonexistent VALUES (?)", (2,)),
+        ))
+
+        self.assertFalse(result)
+        self.assertEqual(
+            self.example._selectFirst("SELECT count(*) FROM example"),
+            0
+        )
+
+    def test_multi_interrupted(self) -> None:
+        """A transaction interrupted by any exception is rolled back."""
+
+        def interrupted(con: Any, _: Any) -> None:
+            con.execute("INSERT INTO example VALUES (1)")
+            raise RuntimeError("interrupted")
+
+        with patch.object(self.example, "_run_grouped", interrupted):
+            with self.assertRaises(RuntimeError):
+                self.example._multi((("SELECT 1", ()),))
+
+        self.assertFalse(self.example._open().in_transaction)
+        self.assertEqual(
+            self.example._selectFirst("SELECT count(*) FROM example"),
+            0
+        )
+
+    def test_open_transaction(self) -> None:
+        """A transaction that was left open is rolled back before its
+        connection is handed out again."""
+
+        con = self.example._open()
+        con.execute("BEGIN")
+        con.execute("INSERT INTO example VALUES (1)")
+
+        self.assertIs(self.example._open(), con)
+        self.assertFalse(con.in_transaction)
+
+        self.assertEqual(
+            self.example._selectFirst("SELECT count(*) FROM example"),
+            0
+        )
+
+    def test_batch_counts(self) -> None:
+        """Batched writes report affected rows per statement."""
+
+        insert = "INSERT INTO example VALUES (?)"
+        delete = "DELETE FROM example WHERE value=?"
+
+        result = self.example._batch((
+            (insert, (1,)),
+            (insert, (2,)),
+            (insert, (3,)),
+            (delete, (2,)),
+            (insert, (4,)),
+        ))
+
+        self.assertEqual(result, {insert: 4, delete: 1})
+        self.assertEqual(
+            self.example._selectFirst("SELECT group_concat(value) FROM example"),
+            "1,3,4"
+        )
+
+    def test_exited_threads(self) -> None:
+        """Connections of threads that have exited are closed."""
+
+        worker = threading.Thread(
+            target=self.example._selectFirst,
+            args=("SELECT 1",)
+        )
+        worker.start()
+        worker.join()
+
+        self.assertEqual(mixins.pool.stats()["connections"], 2)
+
+        mixins.pool.discard(self.example.db_path)
+        self.example._selectFirst("SELECT 1")
+
+        self.assertEqual(mixins.pool.stats()["connections"], 1)
+
+    def test_reused_ident(self) -> None:
+        """A thread is not handed the connection of an exited thread
+        that had the same ident."""
+
+        checkouts: List[Tuple[int, sqlite3.Connection]] = []
+
+        def checkout() -> None:
+            checkouts.append((threading.get_ident(), self.example._open()))
+
+        for _ in range(10):
+            worker = threading.Thread(target=checkout)
+            worker.start()
+            worker.join()
+
+        reused = [
+            (earlier[1], later[1])
+            for earlier, later in zip(checkouts, checkouts[1:])
+            if earlier[0] == later[0]
+        ]
+
+        if not reused:
+            self.skipTest("Thread idents were not reused")
+
+        for earlier, later in reused:
+            self.assertIsNot(earlier, later)
+
+    def test_close_all(self) -> None:
+        """Every pooled connection is closed on request."""
 
-    def test_placeholder(self) -> None:
-        """Placeholder to force pytest to generate a coverage file."""
-        pass   # pylint: disable=unnecessary-pass
+        self.example._selectFirst("SELECT 1")
+        self.assertGreater(mixins.pool.close_all(), 0)
+        self.assertEqual(mixins.pool.stats()["connections"], 0)
 
 
 if __name__ == "__main__":
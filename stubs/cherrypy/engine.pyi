@@ -247,8 +247,9 @@ def publish(
 @overload
 def publish(
         channel: Literal["cache:mget"],
-        key: Tuple[str, ...],
-) -> List[Iterator[Any]]: ...
+        keys: Tuple[str, ...],
+        include_cache_date: bool = False
+) -> List[Dict[str, Any]]: ...
 
 
 @overload
@@ -293,6 +294,18 @@ def publish(
 ) -> List[bool]: ...
 
 
+@overload
+def publish(
+        channel: Literal["cache:stats"],
+) -> List[Dict[str, int]]: ...
+
+
+@overload
+def publish(
+        channel: Literal["cache:sweep"],
+) -> List[int]: ...
+
+
 @overload
 def publish(
         channel: Literal["capture:add"],
@@ -480,6 +493,15 @@ def publish(
 ) -> List[None]: ...
 
 
+@overload
+def publish(
+        channel: Literal["gcp:appengine:ingest_files"],
+        storage_paths: Iterable[Path],
+        workers: int = ...,
+        batch_size: int = ...,
+) -> List[int]: ...
+
+
 @overload
 def publish(
         channel: Literal["geography:country_by_abbreviation"],
@@ -528,16 +550,40 @@ def publish(
 def publish(
         channel: Literal["ip:facts"],
         ip_address: str,
-) -> List[Dict[str, str]]: ...
+        include_annotations: bool = ...,
+) -> List[Dict[str, Any]]: ...
+
+
+@overload
+def publish(
+        channel: Literal["ip:facts:many"],
+        ip_addresses: Iterable[str],
+        include_annotations: bool = ...,
+) -> List[Dict[str, Dict[str, Any]]]: ...
+
+
+@overload
+def publish(
+        channel: Literal["ip:facts:stats"],
+) -> List[Dict[str, Any]]: ...
 
 
 @overload
 def publish(
         channel: Literal["ip:reverse"],
         ip_address: str,
+        timeout: float = ...,
 ) -> List[Dict[str, Any]]: ...
 
 
+@overload
+def publish(
+        channel: Literal["ip:reverse:many"],
+        ip_addresses: Iterable[str],
+        timeout: float = ...,
+) -> List[Dict[str, Dict[str, Any]]]: ...
+
+
 @overload
 def publish(
         channel: Literal["jinja:render"],
@@ -568,6 +614,23 @@ def publish(
 ) -> List[None]: ...
 
 
+@overload
+def publish(
+        channel: Literal["logindex:archive"],
+        days: int = ...,
+        batch_size: int = ...,
+        block_lines: int = ...,
+) -> List[None]: ...
+
+
+@overload
+def publish(
+        channel: Literal["logindex:archived_line"],
+        source_file: str,
+        source_offset: int,
+) -> List[str]: ...
+
+
 @overload
 def publish(
         channel: Literal["logindex:count_lines"],
@@ -590,17 +653,33 @@ def publish(
 ) -> List[None]: ...
 
 
+@overload
+def publish(
+        channel: Literal["logindex:follow"],
+        poll_interval: float = ...,
+) -> List[None]: ...
+
+
 @overload
 def publish(
         channel: Literal["logindex:insert_line"],
         records: Iterable[Any],
-) -> List[None]: ...
+) -> List[int]: ...
+
+
+@overload
+def publish(
+        channel: Literal["logindex:insert_parsed"],
+        records: Iterable[Any],
+) -> List[int]: ...
 
 
 @overload
 def publish(
         channel: Literal["logindex:parse"],
-        batch_size: Optional[int] = 100,
+        batch_size: Optional[int] = 50000,
+        workers: Optional[int] = 0,
+        chunk_size: Optional[int] = 2000,
 ) -> List[None]: ...
 
 
@@ -610,11 +689,21 @@ def publish(
 ) -> List[None]: ...
 
 
+@overload
+def publish(
+        channel: Literal["logindex:prune"],
+        cutoff_months: int = ...,
+) -> List[None]: ...
+
+
 @overload
 def publish(
         channel: Literal["logindex:query"],
         query: str,
-) -> List[Tuple[List[Row], List[str]]]: ...
+        explain: bool = ...,
+        cursor: str = ...,
+        limit: int = ...,
+) -> List[Tuple[List[Row], List[str], str]]: ...
 
 
 @overload
@@ -637,6 +726,18 @@ def publish(
 ) -> List[None]: ...
 
 
+@overload
+def publish(
+        channel: Literal["logindex:screen"],
+) -> List[None]: ...
+
+
+@overload
+def publish(
+        channel: Literal["logindex:unfollow"],
+) -> List[None]: ...
+
+
 @overload
 def publish(
         channel: Literal["markup:plaintext"],
@@ -892,7 +993,7 @@ def publish(
 @overload
 def publish(
         channel: Literal["registry:search"],
-        key: str,
+        key: str = ...,
         **kwargs: Any,
 ) -> List[Tuple[int, Iterator[Row]]]: ...
 
@@ -1091,6 +1192,12 @@ def publish(
 ) -> List[Dict[str, str]]: ...
 
 
+@overload
+def publish(
+        channel: Literal["sqlite:pool:stats"],
+) -> List[Dict[str, int]]: ...
+
+
 @overload
 def publish(
         channel: Literal["reddit:render"],
@@ -1233,3 +1340,9 @@ def subscribe(
         channel: str,
         callback: Callable,
 ) -> List[int]: ...
+
+
+def unsubscribe(
+        channel: str,
+        callback: Callable,
+) -> None: ...
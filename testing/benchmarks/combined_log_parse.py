@@ -0,0 +1,61 @@
+"""Compare the throughput of the combined log parsers.
+
+Each parser is run over the same set of synthetic log lines and the
+result is reported in lines per second.
+
+Usage: python -m testing.benchmarks.combined_log_parse --lines 200000
+"""
+
+import argparse
+from time import perf_counter
+from typing import List
+from parsers.combined_log import FastParser
+from parsers.combined_log import Parser
+
+LINE_TEMPLATE = (
+    '10.0.{a}.{b} - - [01/Jan/2024:{h:02d}:{m:02d}:{s:02d} +0000] '
+    '"GET /page/{n}.html?ref={a} HTTP/1.1" 200 {size} '
+    '"https://example.com/index.html" '
+    '"Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101" '
+    '"example.com" city="Example" country="US" latlong="1.0,2.0"'
+)
+
+
+def synthesize(count: int) -> List[str]:
+    """Generate log lines spread across a day."""
+
+    return [
+        LINE_TEMPLATE.format(
+            a=i % 256,
+            b=(i // 256) % 256,
+            h=(i // 3600) % 24,
+            m=(i // 60) % 60,
+            s=i % 60,
+            n=i,
+            size=i % 10000,
+        )
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    """Run the benchmark and print lines per second for each parser."""
+
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--lines", type=int, default=200000)
+    args = argparser.parse_args()
+
+    lines = synthesize(args.lines)
+
+    for parser in (Parser(), FastParser()):
+        start = perf_counter()
+        for line in lines:
+            parser.parse(line)
+        elapsed = perf_counter() - start
+
+        name = type(parser).__name__
+        print(f"{name:<12} {len(lines) / elapsed:>10.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
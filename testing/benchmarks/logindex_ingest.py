@@ -0,0 +1,91 @@
+"""Measure log file ingestion throughput for the logindex plugin.
+
+A synthetic log in combined format is written to a temporary
+directory and ingested into a throwaway database. The default size is
+large enough to exercise paging behavior rather than just the page
+cache.
+
+The file is then ingested a second time from the start, as happens
+when an overlapping date range is requested, to measure how cheaply
+duplicates are screened out.
+
+Usage: python -m testing.benchmarks.logindex_ingest --megabytes 2048
+"""
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+import cherrypy
+import plugins.logindex
+
+LINE_TEMPLATE = (
+    '10.0.{a}.{b} - - [01/Jan/2024:{h:02d}:{m:02d}:{s:02d} +0000] '
+    '"GET /page/{n}.html?ref={a} HTTP/1.1" 200 {size} '
+    '"https://example.com/index.html" '
+    '"Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101" '
+    '"example.com" city="Example" country="US" latlong="1.0,2.0"\n'
+)
+
+
+def synthesize(path: str, megabytes: int) -> int:
+    """Write a combined-format log of approximately the given size."""
+
+    target_bytes = megabytes * 1024 * 1024
+    written = 0
+    count = 0
+
+    with open(path, "w", encoding="utf-8") as handle:
+        while written < target_bytes:
+            line = LINE_TEMPLATE.format(
+                a=count % 256,
+                b=(count // 256) % 256,
+                h=(count // 3600) % 24,
+                m=(count // 60) % 60,
+                s=count % 60,
+                n=count,
+                size=count % 10000,
+            )
+            handle.write(line)
+            written += len(line)
+            count += 1
+
+    return count
+
+
+def main() -> None:
+    """Run the benchmark and print lines per second."""
+
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--megabytes", type=int, default=2048)
+    argparser.add_argument("--batch-size", type=int, default=10000)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cherrypy.config.update({"database_dir": workdir})
+
+        log_path = os.path.join(workdir, "2024-01-01.log")
+        line_count = synthesize(log_path, args.megabytes)
+
+        plugin = plugins.logindex.Plugin(cherrypy.engine)
+        plugin.setup()
+
+        start = perf_counter()
+        ingested = plugin.ingest_file(log_path, args.batch_size)
+        elapsed = perf_counter() - start
+
+        print(f"{line_count} lines written, {ingested} ingested")
+        print(f"{elapsed:.2f} seconds, {ingested / elapsed:.0f} lines/sec")
+
+        plugin.offsets[plugin.file_path_to_source(log_path)] = 0
+
+        start = perf_counter()
+        reingested = plugin.ingest_new_lines(log_path, args.batch_size)
+        elapsed = perf_counter() - start
+
+        print(f"{reingested} lines re-read, {elapsed:.2f} seconds, "
+              f"{reingested / elapsed:.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measure the database cost of rendering a Reddit discussion.
+
+A synthetic story with a deeply threaded comment section is cached
+in a throwaway database, which projects it into relational rows. The
+story and its comments are then read back repeatedly, as they would
+be for each page view.
+
+For comparison, the same response is also walked with json_tree()
+on every read, which is how discussions were extracted before they
+were projected.
+
+Usage: python -m testing.benchmarks.reddit_render --comments 600
+"""
+
+import argparse
+import json
+import sqlite3
+import tempfile
+from time import perf_counter
+from typing import Any
+from typing import Dict
+from typing import List
+import cherrypy
+import plugins.cache
+from plugins import mixins
+from resources.url import Url
+
+ENDPOINT = "https://www.reddit.com/r/example/comments/abc123/example/.json"
+
+JSON_TREE_QUERY = """SELECT
+j.value ->> '$.id' AS id,
+j.value ->> '$.author' AS author,
+j.value ->> '$.created_utc' AS created_utc,
+j.value ->> '$.parent_id' as parent_id,
+j.value ->> '$.body_html' as body_html
+FROM json_tree(?, '$[1].data.children') j
+WHERE j.key='data'
+AND j.value ->> '$.id' <> ''
+AND j.value ->> '$.author' != 'AutoModerator'
+AND j.value ->> '$.author' != 'RemindMeBot'
+AND j.value ->> '$.author' != '[deleted]'
+AND j.value ->> '$.body_html' != '[removed]'
+AND j.value ->> '$.body_html' NOT LIKE  '%RemindMe!%'"""
+
+
+def synthesize(comment_count: int) -> List[Any]:
+    """Build a story response with threads of five nested replies."""
+
+    def comment(number: int, parent_id: str) -> Dict[str, Any]:
+        return {
+            "kind": "t1",
+            "data": {
+                "id": f"c{number}",
+                "author": f"user{number % 50}",
+                "created_utc": 1700000000.0 + number,
+                "parent_id": parent_id,
+                "body_html": f"&lt;p&gt;Comment {number} " + "text " * 40,
+                "score": number % 17,
+                "replies": "",
+            },
+        }
+
+    threads: List[Dict[str, Any]] = []
+
+    for number in range(comment_count):
+        if number % 5 == 0:
+            parent = comment(number, "t3_abc123")
+            threads.append(parent)
+        else:
+            parent["data"]["replies"] = {
+                "kind": "Listing",
+                "data": {"children": [comment(number, f"t1_c{number - 1}")]},
+            }
+            parent = parent["data"]["replies"]["data"]["children"][0]
+
+    story = {
+        "kind": "t3",
+        "data": {
+            "title": "Example story",
+            "url": "https://example.com/story",
+            "domain": "example.com",
+            "permalink": "/r/example/comments/abc123/example/",
+            "num_comments": comment_count,
+            "selftext": "",
+            "subreddit": "example",
+            "created_utc": 1700000000.0,
+            "author": "user0",
+            "num_crossposts": 0,
+        },
+    }
+
+    return [
+        {"kind": "Listing", "data": {"children": [story]}},
+        {"kind": "Listing", "data": {"children": threads}},
+    ]
+
+
+def main() -> None:
+    """Run the benchmark and print the cost per render."""
+
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--comments", type=int, default=600)
+    argparser.add_argument("--renders", type=int, default=200)
+    args = argparser.parse_args()
+
+    payload = json.dumps(synthesize(args.comments))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cherrypy.config.update({"database_dir": workdir})
+
+        plugin = plugins.cache.Plugin(cherrypy.engine)
+        plugin.setup()
+
+        start = perf_counter()
+        plugin.set(ENDPOINT, payload)
+        elapsed = perf_counter() - start
+        print(f"{len(payload)} bytes cached and projected "
+              f"in {elapsed * 1000:.2f} ms")
+
+        endpoint = Url(ENDPOINT)
+
+        start = perf_counter()
+        for _ in range(args.renders):
+            _, comments = plugin.reddit_story(endpoint)
+            projected_count = len(list(comments))
+        projected = (perf_counter() - start) / args.renders
+
+        mixins.pool.close_all()
+
+    con = sqlite3.connect(":memory:")
+
+    start = perf_counter()
+    for _ in range(args.renders):
+        walked_count = len(con.execute(JSON_TREE_QUERY, (payload,)).fetchall())
+    walked = (perf_counter() - start) / args.renders
+
+    con.close()
+
+    print(f"projected: {projected_count} comments, "
+          f"{projected * 1000:.2f} ms per render")
+    print(f"json_tree: {walked_count} comments, "
+          f"{walked * 1000:.2f} ms per render")
+
+
+if __name__ == "__main__":
+    main()